@@ -1,19 +1,36 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from jwt import encode, decode  # Updated import from PyJWT
 import hashlib
-import json
+import logging
 import os
+import threading
+import orjson
 from src.helper import *
 from src.prompt import *
+from src.memory import ConversationMemory
+from src.router import router_stats
+from src.rerank import rerank_stats
+from src.hedge import hedge_stats
+from src.deadline import parse_deadline
+from src.profiler import PROFILE_MAX_SECONDS, SamplingProfiler, profile_for, profile_store, profiled_threads, tag_thread
+from src.ratelimit import RATE_LIMIT_ENABLED, get_rate_limiter
+from src.shards import search_stats
+from src.state import StateBackend, get_backend
+
+logger = logging.getLogger(__name__)
 
 # ---------------- Configuration ----------------
 SECRET_KEY = "codebasics"  # Use a more secure key in production!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Usernames allowed to use the /admin endpoints and the X-Profile header
+ADMIN_USERS = {name.strip() for name in os.environ.get("ADMIN_USERS", "").split(",") if name.strip()}
 
 app = FastAPI(title="ChatBot Pro API")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -33,51 +50,35 @@ def hash_password(password: str):
 
 # ---------------- User Management ----------------
 class UserManager:
-    def __init__(self, db_file="users.json"):
-        self.db_file = db_file
-        self.users = self.load_users()
-    
-    def load_users(self):
-        if os.path.exists(self.db_file):
-            with open(self.db_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def save_users(self):
-        with open(self.db_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
+    """Account operations on top of the shared state backend (see src/state.py)."""
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
     
     def register_user(self, username: str, department: str, email: str, password: str, full_name: str):
-        if username in self.users:
-            return False, "Username already exists"
-        if any(user.get('email') == email for user in self.users.values()):
-            return False, "Email already registered"
-        
-        self.users[username] = {
+        return self.backend.create_user(username, {
             'email': email,
             'department': department,
             'password': hash_password(password),
             'full_name': full_name,
             'created_at': datetime.now().isoformat(),
             'last_login': None
-        }
-        self.save_users()
-        return True, "Registration successful"
+        })
     
     def authenticate_user(self, username: str, password: str):
-        if username not in self.users:
+        user = self.backend.get_user(username)
+        if not user:
             return False, "User not found"
-        if self.users[username]['password'] != hash_password(password):
+        if user['password'] != hash_password(password):
             return False, "Invalid password"
         
-        self.users[username]['last_login'] = datetime.now().isoformat()
-        self.save_users()
+        self.backend.update_user(username, {'last_login': datetime.now().isoformat()})
         return True, "Login successful"
     
     def get_user_info(self, username: str):
-        return self.users.get(username, {})
+        return self.backend.get_user(username) or {}
 
-user_manager = UserManager()
+state_backend = get_backend()
+user_manager = UserManager(state_backend)
 
 # ---------------- Pydantic Models ----------------
 class RegisterData(BaseModel):
@@ -99,9 +100,31 @@ class LoginData(BaseModel):
 class ChatMessage(BaseModel):
     message: str
 
+class Citation(BaseModel):
+    id: Optional[str] = None
+    source: str
+    score: Optional[float] = None
+    snippet: str
+
 class ChatResponse(BaseModel):
     response: str
-    context: Optional[Any] = None
+    context: List[Citation] = []
+    # True when the LLM was unavailable and the answer quotes the context instead
+    degraded: bool = False
+    # Stages skipped or cut short to meet the request deadline
+    cut_stages: List[str] = []
+
+class UserInfo(BaseModel):
+    username: str
+    full_name: Optional[str] = None
+    department: Optional[str] = None
+    email: Optional[str] = None
+
+class ChunkResponse(BaseModel):
+    id: str
+    source: str
+    text: str
+    metadata: Dict[str, Any]
 
 # ---------------- Dummy Chat Logic ----------------
 # def answer(question: str, input_department: str):
@@ -127,8 +150,82 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
     return {"username": username, "department": user.get("department")}
 
-# ---------------- Chat History Storage ----------------
-chat_histories: Dict[str, List[Dict[str, Any]]] = {}
+def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user["username"] not in ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+    return current_user
+
+def is_admin_token(authorization: Optional[str]):
+    """Whether an Authorization header carries a valid token of an admin user."""
+    if not authorization or not authorization.startswith("Bearer "):
+        return False
+    try:
+        return decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub") in ADMIN_USERS
+    except Exception:
+        return False
+
+# ---------------- Middleware: Per-request Profiling ----------------
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """With "X-Profile: 1" from an admin, sample this request and return an X-Profile-Id.
+
+    Sampled are the event loop thread (async code, response encoding) and,
+    while they work for this request, the threads it hands work to: route
+    code run with run_in_request_thread and the deadline threads that search
+    the shards and call the LLM. Other requests on those threads are left out.
+    """
+    if request.headers.get("X-Profile") != "1" or not is_admin_token(request.headers.get("Authorization")):
+        return await call_next(request)
+    threads = {threading.get_ident()}
+    token = profiled_threads.set(threads)
+    profiler = SamplingProfiler(interval=0.001, thread_ids=threads)
+    try:
+        with profiler:
+            response = await call_next(request)
+    finally:
+        profiled_threads.reset(token)
+    response.headers["X-Profile-Id"] = profile_store.add(profiler.collapsed())
+    return response
+
+async def run_in_request_thread(function, *args):
+    """run_in_threadpool, counting the worker thread as part of the request while it runs (for profiling)."""
+    def run():
+        with tag_thread():
+            return function(*args)
+    return await run_in_threadpool(run)
+
+# ---------------- Dependency: Rate Limit ----------------
+def rate_limit(response: Response, current_user: dict = Depends(get_current_user)):
+    """Per-user and per-department token buckets (see src/ratelimit.py)."""
+    if not RATE_LIMIT_ENABLED:
+        return current_user
+    decision = get_rate_limiter().check(current_user["username"], current_user["department"])
+    headers = {
+        "X-RateLimit-Limit": str(decision.limit),
+        "X-RateLimit-Remaining": str(decision.remaining),
+        "X-RateLimit-Reset": str(decision.reset),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(decision.retry_after)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please slow down.", headers=headers)
+    response.headers.update(headers)
+    return current_user
+
+# ---------------- Dependency: Request Deadline ----------------
+def request_deadline(x_request_deadline: Optional[str] = Header(None)):
+    """Time budget of the request: X-Request-Deadline seconds, or REQUEST_DEADLINE_SECONDS."""
+    try:
+        return parse_deadline(x_request_deadline)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Deadline must be a positive number of seconds.")
+
+# ---------------- Background Ingestion ----------------
+@app.on_event("startup")
+def start_data_watcher():
+    # Enable in a single process only (e.g. one worker or a separate `python -m src.watcher`)
+    if os.environ.get("WATCH_DATA") == "1":
+        from src.watcher import start_watcher
+        app.state.data_watcher = start_watcher()
 
 # ---------------- Endpoints ----------------
 @app.post("/register", response_model=Token)
@@ -153,25 +250,146 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     access_token = create_access_token(data={"sub": form_data.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(chat: ChatMessage, current_user: dict = Depends(get_current_user)):
+def save_turn(username, session, memory, user_message, response_text, citations):
+    session["memory"] = memory.to_dict()
+    state_backend.set_session(username, session)
+    
+    # History lives in the shared backend so any worker can serve the next request
+    state_backend.append_history(username, user_message, {
+        "role": "assistant",
+        "content": response_text,
+        "timestamp": datetime.now().strftime("%I:%M %p"),
+        "context": citations,
+    })
+
+# Chat routes return orjson-encoded bodies; citations replace full Documents in
+# responses and history, and /chunks/{chunk_id} expands one on demand
+@app.post("/chat", response_model=ChatResponse, response_class=ORJSONResponse)
+async def chat_endpoint(chat: ChatMessage, current_user: dict = Depends(rate_limit),
+                        deadline: Deadline = Depends(request_deadline)):
+    username = current_user["username"]
+    department = current_user["department"]
+    
+    user_message = {"role": "user", "content": chat.message, "timestamp": datetime.now().strftime("%I:%M %p")}
+    
+    # Conversation memory (rolling summary + recent turns) is stored with the session
+    session = state_backend.get_session(username)
+    memory = ConversationMemory.from_dict(session.get("memory"))
+    
+    timer = StageTimer()
+    # answer() blocks on retrieval and the LLM, so it runs off the event loop
+    response_text, context = await run_in_request_thread(answer, chat.message, department, memory, None, timer, deadline)
+    citations = to_citations(context)
+    save_turn(username, session, memory, user_message, response_text, citations)
+    
+    return {"response": response_text, "context": citations, "degraded": timer.degraded,
+            "cut_stages": deadline.cut_stages}
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat: ChatMessage, response: Response, current_user: dict = Depends(rate_limit),
+                               deadline: Deadline = Depends(request_deadline)):
+    """/chat as newline-delimited JSON events, sent as the LLM writes the answer:
+
+    {"type": "context", "context": [citations]}, then {"type": "token", "text": ...}
+    per piece of the answer, then {"type": "done", "degraded": false, "cut_stages": []}.
+    If the answer fails part-way, {"type": "error", "detail": ...} replaces "done".
+    """
     username = current_user["username"]
     department = current_user["department"]
     
-    history = chat_histories.get(username, [])
-    history.append({"role": "user", "content": chat.message, "timestamp": datetime.now().strftime("%I:%M %p")})
+    user_message = {"role": "user", "content": chat.message, "timestamp": datetime.now().strftime("%I:%M %p")}
+    session = state_backend.get_session(username)
+    memory = ConversationMemory.from_dict(session.get("memory"))
     
-    response_text, context = answer(chat.message, department)
+    timer = StageTimer()
+    # Retrieval runs before the response starts, so a failure is still a plain error response
+    context, pieces = await run_in_request_thread(stream_answer, chat.message, department, memory, None, timer, deadline)
+    citations = to_citations(context)
     
-    history.append({"role": "assistant", "content": response_text, "timestamp": datetime.now().strftime("%I:%M %p"), "context": context})
-    chat_histories[username] = history
+    def events():
+        # A sync generator: Starlette iterates it in a worker thread, off the event loop
+        yield orjson.dumps({"type": "context", "context": citations}) + b"\n"
+        parts = []
+        try:
+            for piece in pieces:
+                parts.append(piece)
+                yield orjson.dumps({"type": "token", "text": piece}) + b"\n"
+        except Exception:
+            # The status line is already sent, so the error has to be an event
+            logger.exception("Streaming answer failed")
+            yield orjson.dumps({"type": "error", "detail": "The answer could not be completed."}) + b"\n"
+            return
+        save_turn(username, session, memory, user_message, "".join(parts), citations)
+        yield orjson.dumps({"type": "done", "degraded": timer.degraded,
+                            "cut_stages": deadline.cut_stages}) + b"\n"
     
-    return {"response": response_text, "context": context}
+    # Headers set by dependencies only reach responses FastAPI builds itself
+    headers = {name: value for name, value in response.headers.items() if name.lower().startswith("x-ratelimit-")}
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/chunks/{chunk_id}", response_model=ChunkResponse, response_class=ORJSONResponse)
+async def get_chunk_endpoint(chunk_id: str, current_user: dict = Depends(get_current_user)):
+    doc = get_chunk(chunk_id, current_user["department"])
+    if doc is None:
+        # Same answer for unknown, expired and forbidden chunks, so ids cannot be probed
+        raise HTTPException(status_code=404, detail="Chunk not found.")
+    return {
+        "id": doc.id,
+        "source": doc.metadata.get("source", ""),
+        "text": doc.page_content,
+        "metadata": doc.metadata,
+    }
 
-@app.get("/chat/history")
+@app.get("/chat/history", response_class=ORJSONResponse)
 async def get_chat_history(current_user: dict = Depends(get_current_user)):
     username = current_user["username"]
-    return chat_histories.get(username, [])
+    return state_backend.get_history(username)
+
+@app.delete("/chat/history", status_code=204)
+async def clear_chat_history(current_user: dict = Depends(get_current_user)):
+    """Forget the history and the conversation memory, like "Clear Chat History" in the UI."""
+    username = current_user["username"]
+    state_backend.clear_history(username)
+    session = state_backend.get_session(username)
+    session.pop("memory", None)
+    state_backend.set_session(username, session)
+
+@app.get("/me", response_model=UserInfo)
+async def get_me(current_user: dict = Depends(get_current_user)):
+    return {"username": current_user["username"], **user_manager.get_user_info(current_user["username"])}
+
+@app.get("/stats/router")
+async def get_router_stats(current_user: dict = Depends(get_current_user)):
+    return router_stats.snapshot()
+
+@app.get("/stats/rerank")
+async def get_rerank_stats(current_user: dict = Depends(get_current_user)):
+    return rerank_stats.snapshot()
+
+@app.get("/stats/shards")
+async def get_shard_stats(current_user: dict = Depends(get_current_user)):
+    return search_stats.snapshot()
+
+@app.get("/stats/llm")
+async def get_llm_stats(current_user: dict = Depends(get_current_user)):
+    return {**hedge_stats.snapshot(), "breaker": llm_breaker.snapshot()}
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def get_profile(seconds: float = 10, interval_ms: float = 5, idle: bool = False,
+                      current_user: dict = Depends(get_admin_user)):
+    """Sample this worker for `seconds` and return collapsed stacks (flame graph input)."""
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or interval_ms < 1:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and interval_ms >= 1.")
+    # Sleep in a worker thread so the event loop keeps serving the traffic being profiled
+    profiler = await run_in_threadpool(profile_for, seconds, interval_ms / 1000, idle)
+    return PlainTextResponse(profiler.collapsed(), headers={"X-Profile-Samples": str(profiler.samples)})
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str, current_user: dict = Depends(get_admin_user)):
+    collapsed = profile_store.get(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return collapsed
 
 @app.get("/")
 async def root():
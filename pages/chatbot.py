@@ -1,8 +1,10 @@
 # pages/chatbot.py
 from src.helper import *
+from src.api_client import APIError
+from src.memory import ConversationMemory
+from src.querylog import StageTimer
+from src.router import router_stats
 import streamlit as st
-import json
-import os
 from datetime import datetime
 
 # Configure page
@@ -12,29 +14,87 @@ st.set_page_config(
     layout="wide"
 )
 
-def get_sample_questions():
-    """Return a sample question for each department based on available resources."""
-    return [
-        {"name": "Engineering", "question": "What is the main technology stack used in our backend services?"},
-        {"name": "Finance", "question": "Can you summarize the latest quarterly financial report?"},
-        {"name": "HR", "question": "What are the key benefits provided to employees?"},
-        {"name": "Marketing", "question": "Show me the highlights from the Q4 2024 marketing report."},
-        {"name": "General", "question": "How do I apply for maternity leave?"}
-    ]
+def stream_turn(prompt, department):
+    """(citations, iterator of answer text pieces, outcome) from the API in thin client mode, else in-process.
+
+    outcome["degraded"] is set once the pieces are exhausted: True if the answer
+    quotes the documents because the LLM was unavailable.
+    """
+    outcome = {}
+    if CHATBOT_API_URL:
+        events = get_api_client().chat_stream(st.session_state.get('api_token'), prompt)
+        first = next(events)  # the citations come before the answer text
+
+        def pieces():
+            # chat_stream raises on an error event or a stream cut off before "done"
+            for event in events:
+                if event['type'] == 'token':
+                    yield event['text']
+                elif event['type'] == 'done':
+                    outcome['degraded'] = event.get('degraded', False)
+
+        return first.get('context', []), pieces(), outcome
+
+    timer = StageTimer()
+    context, answer_pieces = stream_answer(prompt, department, memory=st.session_state.memory, timer=timer)
+
+    def pieces():
+        yield from answer_pieces
+        outcome['degraded'] = timer.degraded
+
+    # Only compact citations are kept in the session; chunk text is fetched when shown
+    return to_citations(context), pieces(), outcome
+
+
+def load_history(greeting):
+    if CHATBOT_API_URL:
+        # The API keeps the history, so it follows the user across UI replicas
+        history = get_api_client().history(st.session_state.get('api_token'))
+        for message in history:
+            message['citations'] = message.pop('context', None)
+        if history:
+            return history
+    return [{"role": "assistant", "content": greeting, "timestamp": datetime.now().strftime("%I:%M %p")}]
+
+
+def end_session(message):
+    st.session_state.authenticated = False
+    st.session_state.api_token = None
+    st.warning(message)
+    st.markdown("[← Go back to login](../)")
+    st.stop()
+
+
+def show_message(index, message, department):
+    display_chat_message(message['role'], message['content'], message.get('timestamp'))
+    if message.get('error'):
+        st.caption(f"Error: {message['error']}")
+    elif message.get('degraded'):
+        st.caption("The assistant was unavailable, so this answer quotes the documents directly.")
+    show_context_sources(message.get('citations'), department, key=index)
+
+
+# A fragment, so paging back and opening sources rerun only the history, not the whole page
+@st.fragment
+def show_history(department):
+    history = st.session_state.chat_history
+    window = st.session_state.setdefault('history_window', CHAT_PAGE_SIZE)
+    start = max(0, len(history) - window)
+    if start and st.button(f"Show {min(start, CHAT_PAGE_SIZE)} earlier messages ({start} hidden)"):
+        st.session_state.history_window += CHAT_PAGE_SIZE
+        st.rerun(scope="fragment")
+    for index in range(start, len(history)):
+        show_message(index, history[index], department)
+
 
 def main():
     # Check authentication
     check_auth()
     
-    # Get current user and department
-    username = st.session_state.get('username')
+    # Get current department
     selected_department = st.session_state.get('selected_department')
     dept_config = dept_configs.get(selected_department, dept_configs['general'])
     
-    # Load user info
-    users = load_users()
-    user_info = users.get(username, {})
-
     # --- Move Sample Questions to Top of Sidebar ---
     with st.sidebar:
         st.subheader("Sample Questions")
@@ -46,63 +106,78 @@ def main():
             st.session_state.authenticated = False
             st.session_state.username = None
             st.session_state.selected_department = None
+            st.session_state.user_info = None
+            st.session_state.api_token = None
             st.switch_page("main.py")
         
         st.subheader("Chat Statistics")
-        chat_count = len(st.session_state.get('chat_history', []))
-        st.write(f"Messages: {chat_count}")
+        # Filled in at the end, once this run's turn has been added
+        message_count = st.empty()
+        # Routing happens in the API process in thin client mode, so local stats would stay at zero
+        stats = router_stats.snapshot()
+        if not CHATBOT_API_URL and stats['total']:
+            st.write(f"Answered without search: {stats['fraction_skipped']:.0%}")
         
         if st.button("Clear Chat History"):
+            if CHATBOT_API_URL:
+                get_api_client().clear_history(st.session_state.get('api_token'))
             st.session_state.chat_history = []
+            st.session_state.memory = ConversationMemory()
+            st.session_state.history_window = CHAT_PAGE_SIZE
             st.rerun()
 
     # Main content area
     show_department_header(dept_config)
     
+    if 'memory' not in st.session_state:
+        st.session_state.memory = ConversationMemory()
+
     if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "content": dept_config['greeting'],
-            "timestamp": datetime.now().strftime("%I:%M %p")
-        })
+        try:
+            st.session_state.chat_history = load_history(dept_config['greeting'])
+        except APIError as e:
+            if e.status_code == 401:
+                end_session("Your session has expired. Please login again.")
+            raise
     
-    # Display chat history
-    for message in st.session_state.chat_history:
-        display_chat_message(
-            message['role'], 
-            message['content'],
-            message.get('timestamp')
-        )
+    # Display the most recent messages; earlier ones are paged in on request
+    show_history(selected_department)
     
     # Chat input
     prompt = st.chat_input("Type your message here...")
     if prompt:
-        current_time = datetime.now().strftime("%I:%M %p")
-        st.session_state.chat_history.append({
+        # Only the new turn is rendered here; the history above is already on screen
+        history = st.session_state.chat_history
+        history.append({
             "role": "user", 
             "content": prompt,
-            "timestamp": current_time
-        })
-        with st.spinner("Thinking..."):
-            try:
-                response, context = answer(question=prompt, input_department=selected_department)
-            except Exception as e:
-                response = "I apologize, but an error occurred while processing your request."
-                context = f"Error: {str(e)}"
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.now().strftime("%I:%M %p"),
-            "context": context
+            "timestamp": datetime.now().strftime("%I:%M %p")
         })
-        st.rerun()
-    
-    # Show context for last message if available
-    if st.session_state.chat_history and st.session_state.chat_history[-1]['role'] == 'assistant':
-        last_message = st.session_state.chat_history[-1]
-        if last_message.get('context'):
-            show_context_sources(last_message['context'])
+        show_message(len(history) - 1, history[-1], selected_department)
+        message = {"role": "assistant"}
+        # The answer is shown as it is written, then replaced by the finished message
+        placeholder = st.empty()
+        parts = []
+        try:
+            with st.spinner("Thinking..."):
+                citations, pieces, outcome = stream_turn(prompt, selected_department)
+            for piece in pieces:
+                parts.append(piece)
+                placeholder.markdown(f"**Assistant:** {''.join(parts)}▌")
+            message.update(content="".join(parts), citations=citations, degraded=outcome.get('degraded', False))
+        except APIError as e:
+            if e.status_code == 401:
+                history.pop()
+                end_session("Your session has expired. Please login again.")
+            message.update(content="I apologize, but an error occurred while processing your request.", error=str(e))
+        except Exception as e:
+            message.update(content="I apologize, but an error occurred while processing your request.", error=str(e))
+        placeholder.empty()
+        message["timestamp"] = datetime.now().strftime("%I:%M %p")
+        history.append(message)
+        show_message(len(history) - 1, message, selected_department)
+
+    message_count.write(f"Messages: {len(st.session_state.chat_history)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
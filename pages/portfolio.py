@@ -1,5 +1,6 @@
 import streamlit as st
-import requests
+import httpx
+from src import github_client
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
@@ -202,25 +203,16 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Function to fetch GitHub data with caching ---
-@st.cache_data(ttl=3600)
+# Responses are also cached on disk with their ETags (see src/github_client.py), so
+# this short in-process TTL only saves the conditional requests between reruns.
+@st.cache_data(ttl=300)
 def fetch_github_data(username):
     """
     Fetches user profile and repository data from GitHub API.
     """
-    user_url = f"https://api.github.com/users/{username}"
-    repos_url = f"https://api.github.com/users/{username}/repos?sort=updated&per_page=100"
-
     try:
-        user_response = requests.get(user_url)
-        user_response.raise_for_status()
-        user_data = user_response.json()
-
-        repos_response = requests.get(repos_url)
-        repos_response.raise_for_status()
-        repos_data = repos_response.json()
-
-        return user_data, repos_data
-    except requests.exceptions.RequestException as e:
+        return github_client.fetch_github_data(username)
+    except httpx.HTTPError as e:
         st.error(f"Error fetching data from GitHub: {e}. Please check your internet connection or the username.")
         return None, []
 
@@ -5,8 +5,11 @@ import json
 import os
 from datetime import datetime
 import time
-from src.helper import UserManager
-from src.helper import load_data_path,update_metadata_into_docs,create_and_store_vs
+import httpx
+from src.api_client import CHATBOT_API_URL, APIError
+from src.helper import get_user_manager, get_api_client
+from src.helper import update_metadata_into_docs,create_and_store_vs
+from src.loaders import iter_documents
 
 # Configure page
 st.set_page_config(
@@ -17,8 +20,8 @@ st.set_page_config(
 )
 
 
-# Initialize user manager
-user_manager = UserManager()
+# Initialize user manager (shared across reruns and sessions)
+user_manager = get_user_manager()
 
 # Initialize session state
 if 'authenticated' not in st.session_state:
@@ -30,6 +33,29 @@ if 'selected_department' not in st.session_state:
 if 'show_register' not in st.session_state:
     st.session_state.show_register = False
 
+def log_in(username, password):
+    """(success, message, user info); in thin client mode the API token is kept in the session."""
+    if CHATBOT_API_URL:
+        api = get_api_client()
+        try:
+            token = api.login(username, password)
+            user_info = api.me(token)
+        except (APIError, httpx.HTTPError) as e:
+            return False, getattr(e, "detail", f"The chat service is unreachable: {e}"), None
+        st.session_state.api_token = token
+        return True, "Login successful", user_info
+    success, message = user_manager.authenticate_user(username, password)
+    return success, message, user_manager.get_user_info(username) if success else None
+
+def register(username, department, email, password, full_name):
+    if CHATBOT_API_URL:
+        try:
+            get_api_client().register(username, department, email, password, full_name)
+        except (APIError, httpx.HTTPError) as e:
+            return False, getattr(e, "detail", f"The chat service is unreachable: {e}")
+        return True, "Registration successful"
+    return user_manager.register_user(username, department, email, password, full_name)
+
 def show_header():
     st.title("🤖 ChatBot Pro")
     st.subheader("Your intelligent assistant for all departments")
@@ -37,11 +63,14 @@ def show_header():
 def show_login_form():
     st.subheader("Login to Your Account")
     
-    if st.button('Update Vector DB'):
-        docs = load_data_path(path = 'resources/data')
+    # In thin client mode the index belongs to the API side (see src/watcher.py)
+    if not CHATBOT_API_URL and st.button('Update Vector DB'):
+        # Documents stream from the loader pool straight into the metadata tagging
+        docs = iter_documents('resources/data')
         updated_docs = update_metadata_into_docs(docs)
         db = create_and_store_vs(updated_docs)
-        st.success('The Data Is Updated Now')
+        collapsed = sum(duplicates for _, duplicates in db.values())
+        st.success(f'The Data Is Updated Now ({collapsed} duplicate chunks collapsed)' if collapsed else 'The Data Is Updated Now')
     # Demo credentials for quick login
     demo_users = [
         {"role": "HR", "username": "HR", "password": "123456"},
@@ -76,11 +105,11 @@ def show_login_form():
         auto_login = st.session_state.pop('auto_login', False) if 'auto_login' in st.session_state else False
         if login_button or auto_login:
             if username and password:
-                success, message = user_manager.authenticate_user(username, password)
+                success, message, user_info = log_in(username, password)
                 if success:
                     st.session_state.authenticated = True
                     st.session_state.username = username
-                    user_info = user_manager.get_user_info(username)
+                    st.session_state.user_info = user_info
                     st.session_state.selected_department = user_info.get('department')
                     st.success("Login successful!")
                     time.sleep(1)
@@ -122,7 +151,7 @@ def show_register_form():
                 elif len(password) < 6:
                     st.error("Password must be at least 6 characters long")
                 else:
-                    success, message = user_manager.register_user(username, department, email, password, full_name)
+                    success, message = register(username, department, email, password, full_name)
                     if success:
                         st.success("Registration successful! Please login.")
                         st.session_state.show_register = False
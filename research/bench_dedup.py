@@ -0,0 +1,61 @@
+"""Memory and throughput of near-duplicate detection (src/dedup.py) as a shard grows.
+
+    python research/bench_dedup.py
+    python research/bench_dedup.py --chunks 20000 60000 --duplicates 0.1
+
+Each run feeds random 80-word chunks, plus a share of exact copies, through one
+NearDuplicateIndex in a fresh process and reports chunks/s and how much the
+process RSS grew. Signatures live in a temporary SQLite database, so the growth
+should stay near DEDUP_CACHE_MB whatever the number of chunks.
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def max_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(chunks, duplicates):
+    from src.dedup import NearDuplicateIndex
+
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(5000)]
+    texts = [" ".join(rng.choices(words, k=80)) for _ in range(chunks)]
+    texts += rng.sample(texts, int(chunks * duplicates))
+
+    before = max_rss()
+    start = time.perf_counter()
+    index = NearDuplicateIndex()
+    found = sum(index.find_or_add(text, i) is not None for i, text in enumerate(texts))
+    elapsed = time.perf_counter() - start
+    index.close()
+    print(f"{len(texts):>10}{len(texts) / elapsed:>12.0f}{(max_rss() - before) / 2 ** 20:>12.0f}{found:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 30000, 90000])
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of chunks added again as copies")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.duplicates)
+        return
+    print(f"{'chunks':>10}{'chunks/s':>12}{'RSS MiB':>12}{'duplicates':>12}")
+    for chunks in args.chunks:
+        # A process per size, so RSS growth is not hidden by an earlier, larger run
+        subprocess.run([sys.executable, __file__, "--run", str(chunks), "--duplicates", str(args.duplicates)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Tail latency of the answer LLM with and without hedging, using stub models.
+
+The stub sleeps for a latency drawn from a mostly-fast distribution with a slow
+tail (like a loaded provider) and can fail a share of requests. Requests run on
+threads, as in the API, through invoke (latency of the whole answer) and stream
+(latency of the first chunk):
+
+    python research/bench_hedging.py
+    python research/bench_hedging.py --requests 400 --tail 0.1 --tail-seconds 3 --errors 0.02
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.runnables import Runnable  # noqa: E402
+
+from src.hedge import HedgeStats, HedgedRunnable, LatencyTracker  # noqa: E402
+
+
+class StubLLM(Runnable):
+    """~median latency to the first chunk, `tail` share of calls take ~tail_seconds."""
+
+    def __init__(self, rng, median, tail, tail_seconds, errors, chunks=5):
+        self.rng = rng
+        self.median = median
+        self.tail = tail
+        self.tail_seconds = tail_seconds
+        self.errors = errors
+        self.chunks = chunks
+
+    def stream(self, input, config=None, **kwargs):
+        slow = self.rng.random() < self.tail
+        time.sleep(self.rng.lognormvariate(0, 0.5) * (self.tail_seconds if slow else self.median))
+        if self.rng.random() < self.errors:
+            raise RuntimeError("stub provider error")
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.median / 10)
+            yield f"piece {i} of the answer to {input} "
+
+    def invoke(self, input, config=None, **kwargs):
+        return "".join(self.stream(input, config))
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in (50, 95, 99)}
+
+
+def run(llm, requests, concurrency, streaming):
+    """Percentiles of the latency to the full answer (invoke) or first chunk (stream), and failures."""
+    def one(i):
+        start = time.perf_counter()
+        try:
+            if streaming:
+                chunks = llm.stream(f"question {i}")
+                next(iter(chunks))
+                latency = time.perf_counter() - start
+                for _ in chunks:
+                    pass
+                return latency, False
+            llm.invoke(f"question {i}")
+        except RuntimeError:
+            return time.perf_counter() - start, True
+        return time.perf_counter() - start, False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    return percentiles([latency for latency, _ in results]), sum(failed for _, failed in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.1, help="typical latency in seconds")
+    parser.add_argument("--tail", type=float, default=0.05, help="share of slow requests")
+    parser.add_argument("--tail-seconds", type=float, default=1.5)
+    parser.add_argument("--errors", type=float, default=0.01, help="share of failing requests")
+    args = parser.parse_args()
+
+    def make():
+        return StubLLM(random.Random(), args.median, args.tail, args.tail_seconds, args.errors)
+
+    print(f"{'mode':<36}{'p50':>8}{'p95':>8}{'p99':>8}{'failed':>8}{'hedged':>8}{'abandoned':>10}")
+    for streaming in (False, True):
+        kind = "first chunk" if streaming else "full answer"
+        plain = run(make(), args.requests, args.concurrency, streaming)
+        print(f"{'single request, ' + kind:<36}" + "".join(f"{v:>8.2f}" for v in plain[0].values())
+              + f"{plain[1]:>8}{'-':>8}{'-':>10}")
+
+        # Warm the tracker up first so the hedge delay is the measured p95, as in a running worker
+        stats = HedgeStats()
+        hedged = HedgedRunnable(make(), make(), tracker=LatencyTracker(min_samples=20),
+                                first_chunk_tracker=LatencyTracker(min_samples=20), stats=stats)
+        run(hedged, 50, args.concurrency, streaming)
+        stats.__init__()
+        result = run(hedged, args.requests, args.concurrency, streaming)
+        print(f"{'hedged at tracked p95, ' + kind:<36}" + "".join(f"{v:>8.2f}" for v in result[0].values())
+              + f"{result[1]:>8}{stats.hedged:>8}{stats.abandoned:>10}")
+        delay = hedged.first_chunk_delay() if streaming else hedged.hedge_delay()
+        print(f"  hedge delay {delay:.2f} s, backup won {stats.backup_wins} of {stats.hedged} hedges\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Compare FAISS.load_local against the memory-mapped loader and chunk store.
+
+Each mode is loaded in several fresh worker processes (like uvicorn --workers N)
+and every worker reports its startup time and resident memory split into
+private (RssAnon) and shared page-cache (RssFile) pages.
+
+    python research/bench_index_load.py --workers 4
+    python research/bench_index_load.py --workers 4 --synthetic 200000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GOOGLE_API_KEY", "unused-for-benchmark")  # embeddings are never called
+
+
+def read_rss():
+    stats = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS", "RssAnon", "RssFile")):
+                name, value = line.split(":")
+                stats[name] = int(value.split()[0]) / 1024
+    return stats
+
+
+def worker(path, mmap, queue):
+    import numpy as np
+    from src.helper import load_faiss
+
+    before = read_rss()
+    start = time.perf_counter()
+    vector_store = load_faiss(path, mmap=mmap)
+    load_time = time.perf_counter() - start
+
+    # Touch the vectors with a brute-force search, as a real query would
+    query = np.random.rand(1, vector_store.index.d).astype("float32")
+    vector_store.index.search(query, 7)
+
+    after = read_rss()
+    queue.put({
+        "load_s": load_time,
+        "anon_mb": after["RssAnon"] - before["RssAnon"],
+        "file_mb": after["RssFile"] - before["RssFile"],
+        "rss_mb": after["VmRSS"],
+    })
+
+
+def build_synthetic_index(size, dim=768):
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+
+    path = tempfile.mkdtemp(prefix="faiss_bench_")
+    index = faiss.IndexFlatL2(dim)
+    for start in range(0, size, 50_000):
+        index.add(np.random.rand(min(50_000, size - start), dim).astype("float32"))
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+
+    docstore = InMemoryDocstore({
+        str(i): Document(page_content="x" * 500, metadata={"source": f"doc{i}.md", "department": ["general"]})
+        for i in range(size)
+    })
+    with open(os.path.join(path, "index.pkl"), "wb") as f:
+        pickle.dump((docstore, {i: str(i) for i in range(size)}), f)
+    return path
+
+
+def build_sqlite_copy(pkl_path):
+    from src.docstore import convert_pickled_docstore
+
+    path = tempfile.mkdtemp(prefix="faiss_bench_sqlite_")
+    shutil.copy(os.path.join(pkl_path, "index.faiss"), path)
+    shutil.copy(os.path.join(pkl_path, "index.pkl"), path)
+    convert_pickled_docstore(path)
+    return path
+
+
+def run(path, mmap, workers):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, mmap, queue)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    results = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="faiss_index")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark a random index with this many vectors")
+    args = parser.parse_args()
+
+    modes = []
+    if args.synthetic:
+        pkl_path = build_synthetic_index(args.synthetic)
+        sqlite_path = build_sqlite_copy(pkl_path)
+        modes += [("load_local", pkl_path, False), ("mmap+pickle", pkl_path, True)]
+    elif os.path.exists(os.path.join(args.path, "index.pkl")):
+        modes += [("load_local", args.path, False), ("mmap+pickle", args.path, True)]
+    else:
+        sqlite_path = args.path
+    if not modes or args.synthetic:
+        modes += [("read+sqlite", sqlite_path, False), ("mmap+sqlite", sqlite_path, True)]
+
+    print(f"{'mode':<14}{'load s (avg)':>14}{'private MB/worker':>20}{'shared MB/worker':>19}{'total private MB':>19}")
+    for mode, path, mmap in modes:
+        results = run(path, mmap, args.workers)
+        load = sum(r["load_s"] for r in results) / len(results)
+        anon = sum(r["anon_mb"] for r in results) / len(results)
+        shared = sum(r["file_mb"] for r in results) / len(results)
+        print(f"{mode:<14}{load:>14.3f}{anon:>20.1f}{shared:>19.1f}{anon * len(results):>19.1f}")
+
+    if args.synthetic:
+        shutil.rmtree(pkl_path)
+        shutil.rmtree(sqlite_path)
+
+
+if __name__ == "__main__":
+    main()
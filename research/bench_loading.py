@@ -0,0 +1,79 @@
+"""Time document loading on a synthetic corpus shaped like resources/data.
+
+    python research/bench_loading.py --files 5000
+    python research/bench_loading.py --files 5000 --directory-loader
+
+--directory-loader also times the old DirectoryLoader path (needs unstructured).
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.loaders import iter_documents  # noqa: E402
+
+
+DEPARTMENTS = ["engineering", "finance", "general", "hr", "marketing"]
+WORDS = "revenue budget policy leave employee campaign service latency quarter growth report audit".split()
+
+
+def paragraph(rng, words=80):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def build_corpus(files, seed=0):
+    rng = random.Random(seed)
+    root = tempfile.mkdtemp(prefix="corpus_bench_")
+    data = os.path.join(root, "data")
+    for dept in DEPARTMENTS:
+        os.makedirs(os.path.join(data, dept))
+    for i in range(files):
+        dept = DEPARTMENTS[i % len(DEPARTMENTS)]
+        if i % 10 == 0:
+            path = os.path.join(data, dept, f"table_{i}.csv")
+            with open(path, "w") as f:
+                f.write("employee_id,full_name,department,salary\n")
+                for row in range(50):
+                    f.write(f"EMP{i}{row},Name {row},{dept},{rng.randint(300000, 2000000)}\n")
+        else:
+            path = os.path.join(data, dept, f"doc_{i}.md")
+            with open(path, "w") as f:
+                for section in range(5):
+                    f.write(f"## Section {section}\n\n{paragraph(rng)}\n\n")
+    return root, data
+
+
+def timed(label, load):
+    start = time.perf_counter()
+    count = sum(1 for _ in load())
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed:>10.2f} s{count:>10} docs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--directory-loader", action="store_true")
+    args = parser.parse_args()
+
+    root, data = build_corpus(args.files)
+    try:
+        print(f"{args.files} files, {args.workers} workers")
+        if args.directory_loader:
+            from langchain_community.document_loaders import DirectoryLoader
+
+            timed("DirectoryLoader (serial)", lambda: DirectoryLoader(data).load())
+        timed("native loaders, serial", lambda: iter_documents(data, workers=1))
+        timed("native loaders, parallel", lambda: iter_documents(data, workers=args.workers))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
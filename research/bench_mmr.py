@@ -0,0 +1,141 @@
+"""Vectorised, department-masked MMR (src/mmr.py) against LangChain's MMR path.
+
+    python research/bench_mmr.py
+    python research/bench_mmr.py --k 7 --fetch-k 40 --lambda-mult 0.3
+
+Two comparisons:
+
+kernel      mmr_select against langchain_community's maximal_marginal_relevance
+            on the same random candidate matrix, for growing fetch_k.
+retrieval   the golden questions against the old path, which ran
+            as_retriever(search_type="mmr") on one index holding every
+            department and filtered afterwards, and against the same call
+            with LangChain's filter argument. For each: how many of the k
+            results the department may read, the latency, and the overlap
+            of the results with ShardedIndex.max_marginal_relevance_search.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DATASET = os.path.join(os.path.dirname(__file__), "golden_questions.jsonl")
+
+
+def time_ms(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def bench_kernel(k, lambda_mult, dimension=768, sizes=(20, 100, 500)):
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    from src.mmr import mmr_select
+
+    rng = np.random.RandomState(0)
+    print(f"{'fetch_k':>8}{'langchain ms':>14}{'numpy ms':>10}{'same picks':>12}")
+    for size in sizes:
+        query = rng.randn(dimension).astype("float32")
+        candidates = rng.randn(size, dimension).astype("float32")
+        repeat = max(3, 2000 // size)
+        theirs = maximal_marginal_relevance(query, candidates, lambda_mult=lambda_mult, k=k)
+        ours = mmr_select(query, candidates, k, lambda_mult)
+        print(f"{size:>8}"
+              f"{time_ms(lambda: maximal_marginal_relevance(query, candidates, lambda_mult=lambda_mult, k=k), repeat):>14.3f}"
+              f"{time_ms(lambda: mmr_select(query, candidates, k, lambda_mult), repeat):>10.3f}"
+              f"{str(theirs == ours):>12}")
+
+
+def single_store(index):
+    """One LangChain FAISS store over every shard's chunks, as before sharding."""
+    from langchain_community.vectorstores import FAISS
+
+    texts, vectors, metadatas = [], [], []
+    for store in index.shards.values():
+        vectors.append(store.index.reconstruct_n(0, store.index.ntotal))
+        for i in range(store.index.ntotal):
+            doc = store.docstore.search(store.index_to_docstore_id[i])
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+    return FAISS.from_embeddings(list(zip(texts, np.concatenate(vectors))), index.embeddings, metadatas=metadatas)
+
+
+def key(doc):
+    return doc.metadata.get("source", ""), doc.page_content
+
+
+def bench_retrieval(dataset, index, k, fetch_k, lambda_mult):
+    from src.helper import is_permitted
+
+    store = single_store(index)
+    paths = {"as_retriever, filter after": [], "langchain filter=": [], "masked numpy": []}
+    for item in dataset:
+        question, department = item["question"], item["department"]
+
+        def permitted(metadata):
+            return is_permitted(metadata, department)
+
+        def unfiltered():
+            hits = store.max_marginal_relevance_search(question, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+            return [doc for doc in hits if permitted(doc.metadata)]
+
+        def filtered():
+            return store.max_marginal_relevance_search(
+                question, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=permitted)
+
+        def masked():
+            hits = index.max_marginal_relevance_search(question, department, k, fetch_k, lambda_mult, filter=permitted)
+            return [doc for doc, _ in hits]
+
+        reference = {key(doc) for doc in masked()}
+        for name, function in zip(paths, (unfiltered, filtered, masked)):
+            docs = function()
+            found = {key(doc) for doc in docs}
+            paths[name].append({
+                "ms": time_ms(function, 5),
+                "kept": len(docs),
+                "overlap": len(found & reference) / len(found | reference) if found | reference else 1.0,
+            })
+
+    print(f"{'path':<28}{'results':>9}{'p50 ms':>9}{'mean ms':>9}{'overlap':>9}")
+    for name, runs in paths.items():
+        latencies = sorted(run["ms"] for run in runs)
+        print(f"{name:<28}{statistics.mean(run['kept'] for run in runs):>9.2f}{latencies[len(latencies) // 2]:>9.2f}"
+              f"{statistics.mean(latencies):>9.2f}{statistics.mean(run['overlap'] for run in runs):>9.2f}")
+    print(f"\nresults = mean permitted chunks of k={k}; overlap = Jaccard with the masked numpy results")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="resources/data", help="documents to index")
+    parser.add_argument("--index", help="use this published index instead of building one")
+    parser.add_argument("--embeddings", choices=["hashing", "google"], default="hashing")
+    parser.add_argument("--k", type=int, default=7)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    args = parser.parse_args()
+
+    # Read by src.helper at import time
+    os.environ["EMBEDDINGS_BACKEND"] = args.embeddings
+    from src.helper import create_and_store_vs, current_index_path, iter_documents, load_sharded_index, update_metadata_into_docs
+    from eval_retrieval import load_dataset
+
+    bench_kernel(args.k, args.lambda_mult)
+    print()
+    with tempfile.TemporaryDirectory(prefix="bench_mmr_") as root:
+        if not args.index:
+            create_and_store_vs(update_metadata_into_docs(iter_documents(args.data), args.data), root, data_path=args.data)
+        index = load_sharded_index(current_index_path(args.index or root))
+        bench_retrieval(load_dataset(DATASET), index, args.k, args.fetch_k, args.lambda_mult)
+
+
+if __name__ == "__main__":
+    main()
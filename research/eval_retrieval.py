@@ -0,0 +1,191 @@
+"""Evaluate retrieval quality, access control and latency on the golden questions.
+
+Builds an index from resources/data with the given chunking (or opens an
+existing one) and runs every question in golden_questions.jsonl through
+src.helper.retrieve as the asking department would:
+
+    python research/eval_retrieval.py                          # offline, hashing embeddings
+    python research/eval_retrieval.py --chunk-size 1000 --chunk-overlap 100
+    RERANK_MAX_K=4 python research/eval_retrieval.py --json results.json
+    python research/eval_retrieval.py --embeddings google --index faiss_index
+
+Each question lists the source files that answer it and optional keywords; a
+retrieved chunk is relevant if it comes from one of those files and contains a
+keyword. Reported per department:
+
+    recall@k   share of the expected source files found in the top k chunks
+    MRR        mean of 1 / rank of the first relevant chunk
+    ACL        chunks returned from a department the asker may not read
+    latency    retrieve() wall time per question (embedding + search + rerank)
+
+Questions tagged acl_probe ask for another department's data and only count
+towards ACL. Rerank settings come from the usual RERANK_* variables.
+--seed appends get_sample_questions() entries missing from the dataset, to be
+labelled by hand.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DATASET = os.path.join(os.path.dirname(__file__), "golden_questions.jsonl")
+
+
+def load_dataset(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed_dataset(path):
+    """Append sample questions that are not in the dataset yet; returns how many."""
+    from src.helper import get_sample_questions
+
+    existing = {(item["department"], item["question"]) for item in load_dataset(path)}
+    added = 0
+    with open(path, "a") as f:
+        for sample in get_sample_questions():
+            item = {"department": sample["name"].lower(), "question": sample["question"],
+                    "sources": [], "keywords": [], "origin": "sample"}
+            if (item["department"], item["question"]) not in existing:
+                f.write(json.dumps(item) + "\n")
+                added += 1
+    return added
+
+
+def may_read(department, source):
+    """Ground truth for access control, independent of the metadata filter under test."""
+    from src.shards import FULL_ACCESS_DEPARTMENTS, GENERAL_SHARD, shard_for_source
+
+    return department in FULL_ACCESS_DEPARTMENTS or shard_for_source(source) in (department, GENERAL_SHARD)
+
+
+def is_relevant(doc, item):
+    if doc.metadata.get("source") not in item["sources"]:
+        return False
+    text = doc.page_content.lower()
+    return not item["keywords"] or any(keyword.lower() in text for keyword in item["keywords"])
+
+
+def score_question(item, docs, ks):
+    result = {"acl_violations": sum(not may_read(item["department"], doc.metadata.get("source", "")) for doc in docs)}
+    if item.get("origin") == "acl_probe" or not item["sources"]:
+        return result
+
+    relevant = [is_relevant(doc, item) for doc in docs]
+    first = relevant.index(True) + 1 if True in relevant else None
+    result["reciprocal_rank"] = 1 / first if first else 0.0
+    for k in ks:
+        found = {doc.metadata.get("source") for doc, hit in zip(docs[:k], relevant[:k]) if hit}
+        result[f"recall@{k}"] = len(found) / len(set(item["sources"]))
+    return result
+
+
+def summarize(results, ks):
+    ranked = [result for result in results if "reciprocal_rank" in result]
+    latencies = sorted(result["latency_ms"] for result in results)
+    summary = {
+        "questions": len(results),
+        "mrr": statistics.mean(result["reciprocal_rank"] for result in ranked) if ranked else None,
+        "acl_violations": sum(result["acl_violations"] for result in results),
+        "avg_chunks": statistics.mean(result["chunks"] for result in results),
+        "latency_p50_ms": latencies[len(latencies) // 2],
+        "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+    for k in ks:
+        summary[f"recall@{k}"] = statistics.mean(result[f"recall@{k}"] for result in ranked) if ranked else None
+    return summary
+
+
+def evaluate(dataset, index, ks):
+    from src.helper import retrieve
+
+    # Warm up (first-use embedding and index page-in are not part of the latency)
+    retrieve(dataset[0]["question"], dataset[0]["department"], index=index)
+
+    results = []
+    for item in dataset:
+        start = time.perf_counter()
+        docs = [doc for doc, _ in retrieve(item["question"], item["department"], index=index)]
+        latency_ms = (time.perf_counter() - start) * 1000
+        result = score_question(item, docs, ks)
+        result.update(department=item["department"], latency_ms=latency_ms, chunks=len(docs))
+        results.append(result)
+
+    by_department = {}
+    for result in results:
+        by_department.setdefault(result["department"], []).append(result)
+    report = {department: summarize(group, ks) for department, group in sorted(by_department.items())}
+    report["overall"] = summarize(results, ks)
+    return report
+
+
+def print_report(report, ks):
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    columns = [f"recall@{k}" for k in ks]
+    print(f"{'department':<13}{'n':>4}" + "".join(f"{c:>11}" for c in columns)
+          + f"{'MRR':>7}{'ACL':>5}{'chunks':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for department, row in report.items():
+        print(f"{department:<13}{row['questions']:>4}" + "".join(fmt(row[c], '>11.2f') for c in columns)
+              + fmt(row["mrr"], ">7.2f") + f"{row['acl_violations']:>5}{row['avg_chunks']:>8.1f}"
+              + f"{row['latency_p50_ms']:>9.1f}{row['latency_p95_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DATASET)
+    parser.add_argument("--data", default="resources/data", help="documents to index")
+    parser.add_argument("--index", help="evaluate this published index instead of building one")
+    parser.add_argument("--embeddings", choices=["hashing", "google"], default="hashing")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--k", default="1,3,5", help="comma-separated cut-offs for recall@k")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--seed", action="store_true", help="add missing sample questions to the dataset and exit")
+    args = parser.parse_args()
+
+    # Read by src.helper at import time
+    os.environ["EMBEDDINGS_BACKEND"] = args.embeddings
+    from src.helper import (
+        create_and_store_vs, current_index_path, get_text_splitter, iter_documents,
+        load_sharded_index, update_metadata_into_docs,
+    )
+
+    if args.seed:
+        print(f"Added {seed_dataset(args.dataset)} sample questions to {args.dataset}")
+        return
+
+    ks = [int(k) for k in args.k.split(",")]
+    dataset = load_dataset(args.dataset)
+    with tempfile.TemporaryDirectory(prefix="eval_index_") as root:
+        if args.index:
+            index_root = args.index
+        else:
+            index_root = root
+            start = time.perf_counter()
+            create_and_store_vs(
+                update_metadata_into_docs(iter_documents(args.data), args.data),
+                root,
+                text_splitter=get_text_splitter(args.chunk_size, args.chunk_overlap),
+                data_path=args.data,
+            )
+            print(f"Built index in {time.perf_counter() - start:.1f} s "
+                  f"(chunk size {args.chunk_size}, overlap {args.chunk_overlap}, {args.embeddings} embeddings)")
+        index = load_sharded_index(current_index_path(index_root))
+        print(f"{index.ntotal} vectors in shards {sorted(index.shards)}, {len(dataset)} questions\n")
+        report = evaluate(dataset, index, ks)
+
+    print_report(report, ks)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
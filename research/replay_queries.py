@@ -0,0 +1,172 @@
+"""Replay a captured query log (QUERY_LOG_PATH) against an index and configuration.
+
+    QUERY_LOG_PATH=logs/queries-{pid}.jsonl uvicorn fastapi_app:app --workers 4
+    python research/replay_queries.py logs/queries-*.jsonl
+    python research/replay_queries.py logs/*.jsonl --index faiss_index/v20250101120000000000
+    RERANK_MAX_K=4 python research/replay_queries.py logs/*.jsonl --concurrency 8 --pace 1
+
+By default only routing and retrieval are replayed (no LLM calls); --with-llm
+runs the full answer() pipeline. Conversation memory is not captured, so every
+question is replayed as standalone. --pace 1 keeps the captured gaps between
+questions (2 = twice as fast, 0 = back to back). The report compares per-stage
+latency with the captured run and how many of the captured chunks came back.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def stage_summary(runs):
+    """{stage: {n, mean, p50, p95}} over the timings_ms of runs."""
+    stages = {}
+    for run in runs:
+        for name, ms in run["timings_ms"].items():
+            stages.setdefault(name, []).append(ms)
+        stages.setdefault("total", []).append(run["total_ms"])
+    return {
+        name: {"n": len(values), "mean": statistics.mean(values),
+               "p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+        for name, values in stages.items()
+    }
+
+
+def strip_version(chunk_id):
+    # "<version>:<shard>:<row>" -> "<shard>:<row>", to compare across index versions
+    return chunk_id.split(":", 1)[-1] if chunk_id else chunk_id
+
+
+def replay_one(entry, index, with_llm):
+    from src.helper import answer, retrieve
+    from src.querylog import StageTimer
+    from src.router import route
+
+    timer = StageTimer()
+    if with_llm:
+        _, context = answer(entry["question"], entry["department"], index=index, timer=timer)
+        docs = context
+    else:
+        with timer.stage("route"):
+            intent = route(entry["question"])
+        docs = []
+        if not intent:
+            with timer.stage("retrieve"):
+                docs = [doc for doc, _ in retrieve(entry["question"], entry["department"], index=index)]
+    return {"timings_ms": timer.timings, "total_ms": timer.total_ms(), "chunk_ids": [doc.id for doc in docs]}
+
+
+def replay(entries, index, with_llm=False, concurrency=1, pace=0.0):
+    """([result per entry], elapsed seconds); a question that raised gets {"error": ...}."""
+    start = time.perf_counter()
+    first_ts = entries[0]["ts"]
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            if pace:
+                # Keep the captured arrival pattern, scaled by pace
+                delay = (entry["ts"] - first_ts) / pace - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(replay_one, entry, index, with_llm))
+    elapsed = time.perf_counter() - start
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append({"error": f"{type(e).__name__}: {e}"})
+    return results, elapsed
+
+
+def chunk_agreement(entries, results):
+    """Mean share of the captured chunks that were retrieved again."""
+    shares = []
+    for entry, result in zip(entries, results):
+        captured = {strip_version(chunk_id) for chunk_id in entry["chunk_ids"]}
+        if captured:
+            replayed = {strip_version(chunk_id) for chunk_id in result["chunk_ids"]}
+            shares.append(len(captured & replayed) / len(captured))
+    return statistics.mean(shares) if shares else None
+
+
+def print_comparison(captured, replayed):
+    print(f"{'stage':<12}{'n':>6}{'captured p50':>14}{'p95':>9}{'replayed p50':>14}{'p95':>9}")
+    for name in sorted(set(captured) | set(replayed), key=lambda name: name == "total"):
+        before, after = captured.get(name), replayed.get(name)
+        row = f"{name:<12}{(after or before)['n']:>6}"
+        row += f"{before['p50']:>14.1f}{before['p95']:>9.1f}" if before else f"{'-':>14}{'-':>9}"
+        row += f"{after['p50']:>14.1f}{after['p95']:>9.1f}" if after else f"{'-':>14}{'-':>9}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="query log files")
+    parser.add_argument("--index", help="index root or version directory (default: the published index)")
+    parser.add_argument("--embeddings", choices=["hashing", "google"], help="override EMBEDDINGS_BACKEND")
+    parser.add_argument("--with-llm", action="store_true", help="replay the full pipeline including the LLM")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--pace", type=float, default=0.0, help="replay speed relative to capture; 0 = no gaps")
+    parser.add_argument("--limit", type=int, help="replay only the first N questions")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        os.environ["EMBEDDINGS_BACKEND"] = args.embeddings
+    from src.helper import FAISS_INDEX_PATH, current_index_path, load_sharded_index
+    from src.querylog import read_query_log
+
+    entries = read_query_log(*args.logs)
+    replayable = [entry for entry in entries if entry.get("question")]
+    if args.limit:
+        replayable = replayable[:args.limit]
+    skipped = len(entries) - len(replayable)
+    if not replayable:
+        sys.exit("No replayable entries (was the log written with QUERY_LOG_TEXT=0?)")
+
+    index_path = current_index_path(args.index or FAISS_INDEX_PATH)
+    index = load_sharded_index(index_path)
+    print(f"Replaying {len(replayable)} questions ({skipped} skipped) against {index_path}, "
+          f"{'full pipeline' if args.with_llm else 'retrieval only'}, concurrency {args.concurrency}\n")
+
+    # Warm up (first-use embedding and index page-in are not part of the profile)
+    replay_one(replayable[0], index, with_llm=False)
+    results, elapsed = replay(replayable, index, args.with_llm, args.concurrency, args.pace)
+
+    # Failed questions are reported, not compared
+    ok = [(entry, result) for entry, result in zip(replayable, results) if "error" not in result]
+    failures = [(entry, result) for entry, result in zip(replayable, results) if "error" in result]
+    for entry, result in failures[:10]:
+        print(f"FAILED {entry['question'][:60]!r}: {result['error']}")
+    if not ok:
+        sys.exit(f"All {len(failures)} replayed questions failed")
+
+    captured = stage_summary([entry for entry, _ in ok])
+    replayed = stage_summary([result for _, result in ok])
+    print_comparison(captured, replayed)
+    agreement = chunk_agreement([entry for entry, _ in ok], [result for _, result in ok])
+    print(f"\n{len(results) / elapsed:.1f} questions/s; {len(failures)} failed; "
+          f"captured chunks retrieved again: {'-' if agreement is None else f'{agreement:.0%}'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "index": index_path, "captured": captured,
+                       "replayed": replayed, "chunk_agreement": agreement,
+                       "failures": [{"question": entry["question"], "error": result["error"]} for entry, result in failures]},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""HTTP client for running the Streamlit UI against fastapi_app.py (thin client mode).
+
+With CHATBOT_API_URL set (e.g. http://chat-api:8000) the UI logs in, chats and
+expands citations through the API instead of running answer() and loading the
+index and LLM clients in the Streamlit process, so UI replicas and inference
+workers can be scaled separately. One pooled httpx.Client per process is shared
+by every session; a session only keeps its access token.
+"""
+import json
+import os
+
+import httpx
+
+
+CHATBOT_API_URL = os.environ.get("CHATBOT_API_URL", "").rstrip("/")
+# Generous read timeout: a streamed answer can take a while to finish
+CHATBOT_API_TIMEOUT_SECONDS = float(os.environ.get("CHATBOT_API_TIMEOUT_SECONDS", "120"))
+CHATBOT_API_MAX_CONNECTIONS = int(os.environ.get("CHATBOT_API_MAX_CONNECTIONS", "50"))
+
+
+class APIError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ChatbotAPIClient:
+    """Thread-safe client for the ChatBot Pro API over a keep-alive connection pool."""
+
+    def __init__(self, base_url=CHATBOT_API_URL, timeout=CHATBOT_API_TIMEOUT_SECONDS,
+                 max_connections=CHATBOT_API_MAX_CONNECTIONS, transport=None):
+        self._client = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    @staticmethod
+    def _headers(token):
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    @staticmethod
+    def _raise_for_status(response):
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise APIError(response.status_code, detail)
+
+    def _request(self, method, path, token=None, **kwargs):
+        response = self._client.request(method, path, headers=self._headers(token), **kwargs)
+        self._raise_for_status(response)
+        return response
+
+    def login(self, username, password):
+        """Access token for the user; raises APIError with the API's message otherwise."""
+        return self._request("POST", "/login", data={"username": username, "password": password}).json()["access_token"]
+
+    def register(self, username, department, email, password, full_name):
+        return self._request("POST", "/register", json={
+            "full_name": full_name, "username": username, "department": department,
+            "email": email, "password": password, "confirm_password": password,
+        }).json()["access_token"]
+
+    def me(self, token):
+        return self._request("GET", "/me", token).json()
+
+    def chat(self, token, message):
+        return self._request("POST", "/chat", token, json={"message": message}).json()
+
+    def chat_stream(self, token, message):
+        """Yield the /chat/stream events (dicts) as they arrive, ending with "done".
+
+        The request is sent when iteration starts. Errors before the first
+        event, an "error" event and a stream that ends without "done" (cut off
+        by the server or the network) raise APIError.
+        """
+        with self._client.stream("POST", "/chat/stream", headers=self._headers(token), json={"message": message}) as response:
+            if response.status_code >= 400:
+                response.read()
+                self._raise_for_status(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "error":
+                    raise APIError(502, event.get("detail", "The answer could not be completed."))
+                yield event
+                if event.get("type") == "done":
+                    return
+        raise APIError(502, "The answer was cut off before it was complete.")
+
+    def history(self, token):
+        return self._request("GET", "/chat/history", token).json()
+
+    def clear_history(self, token):
+        self._request("DELETE", "/chat/history", token)
+
+    def chunk(self, token, chunk_id):
+        """The chunk behind a citation id, or None if it is unknown, expired or not permitted."""
+        try:
+            return self._request("GET", f"/chunks/{chunk_id}", token).json()
+        except APIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,130 @@
+"""Circuit breaker around the answer LLM, with an extractive fallback answer.
+
+While Gemini keeps failing or answering slower than LLM_SLOW_SECONDS, calling
+it only adds latency before the same failure. After LLM_BREAKER_FAILURES such
+calls in a row the breaker opens and answer() replies at once with the
+sentences of the retrieved (already permitted) chunks that best match the
+question, with their sources. After LLM_BREAKER_RESET_SECONDS one request is
+let through as a probe (half-open): if it succeeds the breaker closes, if not
+it stays open for another period.
+"""
+import os
+import re
+import threading
+import time
+
+from src.rerank import tokenize
+
+
+LLM_BREAKER_ENABLED = os.environ.get("LLM_BREAKER_ENABLED", "1") == "1"
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+# Answers slower than this count as failures (but are still used)
+LLM_SLOW_SECONDS = float(os.environ.get("LLM_SLOW_SECONDS", "20"))
+EXTRACTIVE_SENTENCES = int(os.environ.get("EXTRACTIVE_SENTENCES", "3"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker; allow() says whether to call, record() reports how it went."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS,
+                 slow_seconds=LLM_SLOW_SECONDS, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.slow_seconds = slow_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                # Exactly one probe at a time; everyone else keeps the fallback
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_closed(self):
+        with self._lock:
+            return self.state == CLOSED
+
+    def record(self, ok, seconds=0.0):
+        """Report a call allowed by allow(): ok=False for an error; slow calls count as failures."""
+        failed = not ok or seconds > self.slow_seconds
+        with self._lock:
+            self.probing = False
+            if not failed:
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.max_failures:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+llm_breaker = CircuitBreaker()
+
+
+def split_sentences(text):
+    """Sentences and lines of a text, with markdown emphasis removed and table rows as "cell: cell"."""
+    sentences = []
+    for part in re.split(r"(?<=[.!?])\s+|\n+", re.sub(r"\*\*|__", "", text)):
+        if part.strip().startswith("|"):
+            part = ": ".join(cell.strip() for cell in part.strip().strip("|").split("|"))
+        part = " ".join(part.strip(" -*#>").split())
+        if part:
+            sentences.append(part)
+    return sentences
+
+
+def extractive_answer(question, context, max_sentences=EXTRACTIVE_SENTENCES):
+    """The sentences of the context documents that best cover the question, with their sources."""
+    terms = set(tokenize(question))
+    candidates = []
+    for rank, doc in enumerate(context):
+        for sentence in split_sentences(doc.page_content):
+            words = set(tokenize(sentence))
+            if len(words) < 3:
+                continue
+            overlap = len(terms & words) / (len(terms) or 1)
+            # Term overlap first; between equals, prefer the better-ranked chunk
+            candidates.append((overlap, -rank, sentence, doc.metadata.get("source", "")))
+    candidates.sort(key=lambda item: item[:2], reverse=True)
+
+    picked, seen = [], set()
+    for overlap, _, sentence, source in candidates:
+        if overlap == 0 and picked:
+            break
+        if sentence.lower() not in seen:
+            seen.add(sentence.lower())
+            picked.append(f"- {sentence} ({os.path.basename(source)})")
+        if len(picked) >= max_sentences:
+            break
+    if not picked:
+        return "I am sorry, I cannot answer the question right now. Please try again in a moment."
+    return ("The assistant is temporarily unavailable, so here are the most relevant passages "
+            "from your documents:\n\n" + "\n".join(picked))
@@ -0,0 +1,159 @@
+"""Per-request deadlines, propagated through retrieval and generation.
+
+A Deadline is created when a request starts (REQUEST_DEADLINE_SECONDS, or the
+X-Request-Deadline header of the API) and passed down through answer(). Every
+stage checks the remaining budget: condensing and generation are skipped when
+too little is left for an LLM call, blocking calls (index load, embedding and
+search, the LLM stream) are abandoned when the deadline passes, and a
+fan-out search keeps the shards that answered in time. Each stage that was
+skipped or cut short is recorded in cut_stages, which the API returns.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.profiler import carry_tag
+
+
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "30"))
+# Upper bound on the deadline a client may ask for with X-Request-Deadline
+REQUEST_DEADLINE_MAX_SECONDS = float(os.environ.get("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+# Least time left worth starting an LLM call for; below it the stage is skipped
+CONDENSE_MIN_SECONDS = float(os.environ.get("DEADLINE_CONDENSE_MIN_SECONDS", "2"))
+GENERATE_MIN_SECONDS = float(os.environ.get("DEADLINE_GENERATE_MIN_SECONDS", "2"))
+
+# Threads for calls run under a deadline. A call abandoned at its deadline keeps
+# its thread until it returns (bounded by LLM_TIMEOUT_SECONDS); when all of them
+# are taken, calls get a thread of their own instead of queueing behind those.
+DEADLINE_THREADS = int(os.environ.get("DEADLINE_THREADS", "32"))
+
+_deadline_pool = ThreadPoolExecutor(max_workers=DEADLINE_THREADS, thread_name_prefix="deadline")
+_pooled = 0  # calls submitted to _deadline_pool that have not returned
+_pooled_lock = threading.Lock()
+
+
+def _submit(function, *args, **kwargs):
+    """Future of function(*args, **kwargs) on a deadline thread that is free now.
+
+    A profiled request also samples the thread doing its work (see carry_tag).
+    """
+    global _pooled
+    function = carry_tag(function)
+    future = Future()
+    with _pooled_lock:
+        pooled = _pooled < DEADLINE_THREADS
+        if pooled:
+            _pooled += 1
+
+    def work():
+        global _pooled
+        try:
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        finally:
+            if pooled:
+                with _pooled_lock:
+                    _pooled -= 1
+
+    if pooled:
+        _deadline_pool.submit(work)
+    else:
+        threading.Thread(target=work, name="deadline-overflow", daemon=True).start()
+    return future
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """The time budget of one request, and the stages that were cut to meet it."""
+
+    def __init__(self, seconds=REQUEST_DEADLINE_SECONDS, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires_at = clock() + seconds
+        self.cut_stages = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, seconds):
+        """Whether at least `seconds` of the budget are left."""
+        return self.remaining() >= seconds
+
+    def cut(self, stage):
+        with self._lock:
+            if stage not in self.cut_stages:
+                self.cut_stages.append(stage)
+
+    def run(self, function, *args, **kwargs):
+        """function(*args, **kwargs), or DeadlineExceeded if it has not returned in time."""
+        if self.expired():
+            raise DeadlineExceeded()
+        future = _submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=self.remaining())
+        except FutureTimeoutError:
+            raise DeadlineExceeded() from None
+
+    def iterate(self, iterable):
+        """Yield from iterable (read in a worker thread) until it ends or the deadline passes.
+
+        Raises DeadlineExceeded when the next item does not arrive in time. The
+        iterable is closed (ending e.g. an LLM stream) once it is abandoned.
+        """
+        if self.expired():
+            raise DeadlineExceeded()
+        items = queue.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in iterable:
+                    if stop.is_set():
+                        return
+                    items.put((True, item))
+            except Exception as e:
+                items.put((False, e))
+                return
+            finally:
+                close = getattr(iterable, "close", None)
+                if close is not None:
+                    close()
+            items.put((False, None))
+
+        _submit(produce)
+        try:
+            while True:
+                try:
+                    ok, item = items.get(timeout=self.remaining())
+                except queue.Empty:
+                    raise DeadlineExceeded() from None
+                if ok:
+                    yield item
+                elif item is None:
+                    return
+                else:
+                    raise item
+        finally:
+            stop.set()
+
+
+def parse_deadline(value):
+    """Deadline from an X-Request-Deadline value in seconds (None: the default), capped at the maximum."""
+    if value is None or value == "":
+        return Deadline()
+    seconds = float(value)
+    if not seconds > 0:
+        raise ValueError("The deadline must be a positive number of seconds.")
+    return Deadline(min(seconds, REQUEST_DEADLINE_MAX_SECONDS))
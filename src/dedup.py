@@ -0,0 +1,191 @@
+"""Near-duplicate chunk detection with MinHash and LSH banding.
+
+Each chunk is reduced to a MinHash signature of its word 3-shingles; chunks
+whose estimated Jaccard similarity to an earlier chunk of the same shard is at
+least DEDUP_THRESHOLD are dropped before embedding and their source is merged
+into the kept chunk's metadata (``duplicate_sources``). Near-duplicates must
+also contain exactly the same numbers: chunks that differ only in a figure or
+a quarter label ("Q1" vs "Q3") say different things and stay separate.
+
+The signatures and LSH buckets of kept chunks are kept in a private temporary
+SQLite database rather than in Python objects (about 7 KiB per chunk), so
+memory stays within DEDUP_CACHE_MB however many chunks a shard has.
+
+Report what a build would save without embedding anything:
+
+    python -m src.dedup resources/data
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+import numpy as np
+
+
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.9"))
+NUM_PERMUTATIONS = 128
+# 32 bands of 4 rows: pairs above ~0.4 similarity become candidates, and every
+# candidate is then checked against the threshold
+NUM_BANDS = 32
+SHINGLE_SIZE = 3
+# SQLite page cache of each NearDuplicateIndex; the rest stays on disk
+DEDUP_CACHE_MB = int(os.environ.get("DEDUP_CACHE_MB", "16"))
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+# Mixes each band (and its position) into one 64-bit bucket key
+_BAND_MIX = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERMUTATIONS // NUM_BANDS + 1, dtype=np.uint64)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    # Numbers and short words are kept: "Q1" vs "Q3" or $2.1B vs $2.6B matter
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def numbers_key(text):
+    """Hash of the digit-bearing words of a text (figures, dates, "q1")."""
+    numbers = sorted(set(re.findall(r"\w*\d\w*", text.lower())))
+    return hashlib.sha1(" ".join(numbers).encode()).digest()[:8]
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERMUTATIONS uint64 values) of a text's shingles."""
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles(text)],
+        dtype=np.uint64,
+    )
+    # (a * x + b) mod p per permutation; a, x < 2**32 so nothing overflows
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0)
+
+
+def band_buckets(signature):
+    """LSH bucket key (a signed 64-bit int) of each band of a signature."""
+    bands = signature.reshape(NUM_BANDS, -1)
+    with np.errstate(over="ignore"):
+        keys = bands @ _BAND_MIX[1:] + np.arange(NUM_BANDS, dtype=np.uint64) * _BAND_MIX[0]
+    return keys.view(np.int64).tolist()
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(signature_a == signature_b))
+
+
+class NearDuplicateIndex:
+    """Remembers kept chunks and finds the one a new chunk duplicates, if any.
+
+    Keys are integers (the chunk's row). Call close() when done to delete the
+    temporary database.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, cache_mb=DEDUP_CACHE_MB):
+        self.threshold = threshold
+        # An empty name opens a temporary on-disk database, deleted on close
+        self._conn = sqlite3.connect("", isolation_level=None, check_same_thread=False)
+        self._conn.executescript(f"""
+            PRAGMA cache_size = -{cache_mb * 1024};
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE kept (
+                key INTEGER PRIMARY KEY,
+                digest BLOB UNIQUE NOT NULL,  -- sha1 of the text, for exact duplicates
+                numbers BLOB NOT NULL,        -- numbers_key of the text
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE buckets (bucket INTEGER NOT NULL, key INTEGER NOT NULL);
+            CREATE INDEX buckets_bucket ON buckets (bucket);
+        """)
+        self._uncommitted = 0
+
+    def find_or_add(self, text, key):
+        """Key of the kept chunk that text duplicates, or None after remembering it under key."""
+        digest = hashlib.sha1(text.encode()).digest()
+        exact = self._conn.execute("SELECT key FROM kept WHERE digest = ?", (digest,)).fetchone()
+        if exact is not None:
+            return exact[0]
+
+        signature = minhash(text)
+        numbers = numbers_key(text)
+        buckets = band_buckets(signature)
+        candidates = self._conn.execute(
+            f"""SELECT key, signature FROM kept WHERE numbers = ? AND key IN
+                (SELECT key FROM buckets WHERE bucket IN ({",".join("?" * len(buckets))})) ORDER BY key""",
+            (numbers, *buckets),
+        )
+        best, best_similarity = None, self.threshold
+        for candidate, candidate_signature in candidates:
+            candidate_similarity = similarity(signature, np.frombuffer(candidate_signature, dtype=np.uint64))
+            # The earliest kept chunk wins ties
+            if candidate_similarity >= best_similarity and (best is None or candidate_similarity > best_similarity):
+                best, best_similarity = candidate, candidate_similarity
+        if best is not None:
+            return best
+
+        # Inserts are grouped into transactions of a thousand chunks; reads on
+        # this connection already see the uncommitted ones
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+        self._conn.execute("INSERT INTO kept VALUES (?, ?, ?, ?)", (key, digest, numbers, signature.tobytes()))
+        self._conn.executemany("INSERT INTO buckets VALUES (?, ?)", [(bucket, key) for bucket in buckets])
+        self._uncommitted += 1
+        if self._uncommitted >= 1000:
+            self._conn.execute("COMMIT")
+            self._uncommitted = 0
+        return None
+
+    def close(self):
+        self._conn.close()
+
+
+def merge_duplicate(metadata, duplicate):
+    """Fold a duplicate chunk's source and departments into the kept chunk's metadata."""
+    source = duplicate.get("source", "")
+    if source and source != metadata.get("source"):
+        metadata["duplicate_sources"] = sorted(set(metadata.get("duplicate_sources", [])) | {source})
+    departments = metadata.get("department", [])
+    for name in duplicate.get("department", []):
+        if name not in departments:
+            departments = list(departments) + [name]
+    metadata["department"] = departments
+
+
+def dedup_report(documents, text_splitter, threshold=DEDUP_THRESHOLD, data_path=None):
+    """{shard: (chunks, duplicates)} for documents (from data_path), without embedding them."""
+    from src.shards import DATA_PATH, shard_for_source
+
+    indexes, report = {}, {}
+    for document in documents:
+        for chunk in text_splitter.split_documents([document]):
+            shard = shard_for_source(chunk.metadata.get("source", ""), data_path or DATA_PATH)
+            index = indexes.setdefault(shard, NearDuplicateIndex(threshold))
+            chunks, duplicates = report.get(shard, (0, 0))
+            duplicate = index.find_or_add(chunk.page_content, chunks - duplicates) is not None
+            report[shard] = (chunks + 1, duplicates + duplicate)
+    for index in indexes.values():
+        index.close()
+    return report
+
+
+def main():
+    from src.helper import get_text_splitter, iter_documents, update_metadata_into_docs
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "resources/data"
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else DEDUP_THRESHOLD
+    report = dedup_report(update_metadata_into_docs(iter_documents(path, workers=1), path), get_text_splitter(), threshold, path)
+    print(f"{'shard':<14}{'chunks':>8}{'duplicates':>12}")
+    for shard, (chunks, duplicates) in sorted(report.items()):
+        print(f"{shard:<14}{chunks:>8}{duplicates:>12}")
+    total, saved = sum(c for c, _ in report.values()), sum(d for _, d in report.values())
+    print(f"{'total':<14}{total:>8}{saved:>12}  ({saved / total:.1%} of vectors saved at threshold {threshold})")
+
+
+if __name__ == "__main__":
+    main()
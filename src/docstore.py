@@ -0,0 +1,271 @@
+"""SQLite-backed chunk store used in place of LangChain's pickled index.pkl.
+
+Row ``i`` of ``chunks.sqlite`` holds the text of vector ``i`` in ``index.faiss``.
+Only the small interned department/source tables are read at load time; chunk
+text is fetched lazily for the hits a query actually uses.
+
+Convert an existing index.pkl once with:
+
+    python -m src.docstore faiss_index
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import Mapping
+
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+
+SCHEMA = """
+CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE sources (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL);
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY,          -- row in index.faiss
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    dept_mask INTEGER NOT NULL,      -- bit n set => departments.id = n may read it
+    text TEXT NOT NULL,
+    extra TEXT                       -- any other metadata, as JSON
+);
+"""
+
+
+class ReadOnlyDocstoreError(TypeError):
+    """Raised when a published chunk store would be modified in place."""
+
+
+class _Interner:
+    def __init__(self):
+        self.ids = {}
+
+    def __call__(self, value):
+        return self.ids.setdefault(value, len(self.ids))
+
+
+class ChunkStoreWriter:
+    """Appends documents (in index order) to a new chunk store in batches.
+
+    Rows go to disk as they arrive, so memory use does not grow with the number
+    of chunks; the store appears at path only once close() succeeds.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.batch_size = batch_size
+        self.size = 0
+        self._departments, self._sources = _Interner(), _Interner()
+        self._rows = []
+        self._conn = sqlite3.connect(self.tmp_path)
+        self._conn.executescript(SCHEMA)
+
+    def add(self, documents):
+        for doc in documents:
+            metadata = dict(doc.metadata)
+            source = metadata.pop("source", "")
+            dept = metadata.pop("department", [])
+            if isinstance(dept, str):
+                dept = [dept]
+            mask = 0
+            for name in dept:
+                mask |= 1 << self._departments(name)
+            self._rows.append((self.size, self._sources(source), mask, doc.page_content, json.dumps(metadata) if metadata else None))
+            self.size += 1
+            if len(self._rows) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", self._rows)
+        self._rows = []
+
+    def metadata_of(self, row):
+        """Metadata of a row that was already added."""
+        self._flush()
+        source_id, mask, extra = self._conn.execute(
+            "SELECT source_id, dept_mask, extra FROM chunks WHERE id = ?", (row,)
+        ).fetchone()
+        sources = {i: path_ for path_, i in self._sources.ids.items()}
+        departments = sorted(self._departments.ids.items(), key=lambda item: item[1])
+        metadata = {"source": sources[source_id], "department": [name for name, i in departments if mask & (1 << i)]}
+        if extra:
+            metadata.update(json.loads(extra))
+        return metadata
+
+    def update_metadata(self, row, metadata):
+        """Replace the departments and extra metadata of a row that was already added."""
+        self._flush()
+        metadata = dict(metadata)
+        metadata.pop("source", None)
+        mask = 0
+        for name in metadata.pop("department", []):
+            mask |= 1 << self._departments(name)
+        self._conn.execute(
+            "UPDATE chunks SET dept_mask = ?, extra = ? WHERE id = ?",
+            (mask, json.dumps(metadata) if metadata else None, row),
+        )
+
+    def close(self):
+        try:
+            self._flush()
+            self._conn.executemany("INSERT INTO departments VALUES (?, ?)", [(i, name) for name, i in self._departments.ids.items()])
+            self._conn.executemany("INSERT INTO sources VALUES (?, ?)", [(i, path_) for path_, i in self._sources.ids.items()])
+            self._conn.commit()
+        finally:
+            self._conn.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def write_chunk_store(path, documents):
+    """Write documents (in index order) to a new SQLite chunk store at path."""
+    writer = ChunkStoreWriter(path)
+    writer.add(documents)
+    writer.close()
+
+
+class ChunkStore:
+    """Read-only, thread-safe access to a chunk store."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.departments = dict(self._conn.execute("SELECT id, name FROM departments"))
+            self.sources = dict(self._conn.execute("SELECT id, path FROM sources"))
+            self.size = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        self._dept_lists = {}
+
+    def __len__(self):
+        return self.size
+
+    def department_names(self, mask):
+        # Masks repeat a lot, so share one list per distinct mask
+        if mask not in self._dept_lists:
+            self._dept_lists[mask] = [name for i, name in sorted(self.departments.items()) if mask & (1 << i)]
+        return list(self._dept_lists[mask])
+
+    def _to_document(self, row, source_id, mask, text, extra):
+        metadata = {"source": self.sources[source_id], "department": self.department_names(mask)}
+        if extra:
+            metadata.update(json.loads(extra))
+        return Document(id=str(row), page_content=text, metadata=metadata)
+
+    def get(self, row):
+        with self._lock:
+            result = self._conn.execute(
+                "SELECT id, source_id, dept_mask, text, extra FROM chunks WHERE id = ?", (int(row),)
+            ).fetchone()
+        return self._to_document(*result) if result else None
+
+    def get_many(self, rows, with_text=True):
+        """Documents for rows in one query (None for a missing row); with_text=False
+        leaves page_content empty, for callers that only need the metadata."""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        text = "text" if with_text else "''"
+        with self._lock:
+            results = self._conn.execute(
+                f"SELECT id, source_id, dept_mask, {text}, extra FROM chunks WHERE id IN ({placeholders})", rows
+            ).fetchall()
+        by_row = {result[0]: self._to_document(*result) for result in results}
+        return [by_row.get(row) for row in rows]
+
+    def iter_documents(self, batch_size=1000):
+        """Yield all documents in index order without holding them all in memory."""
+        for start in range(0, self.size, batch_size):
+            yield from self.get_many(range(start, min(start + batch_size, self.size)))
+
+    def rows_excluding_sources(self, sources):
+        """Rows (in index order) whose source is not one of sources."""
+        sources = set(sources)
+        excluded = [i for i, path in self.sources.items() if path in sources]
+        placeholders = ",".join("?" * len(excluded))
+        with self._lock:
+            return [row for (row,) in self._conn.execute(
+                f"SELECT id FROM chunks WHERE source_id NOT IN ({placeholders}) ORDER BY id", excluded
+            )]
+
+    def linked_sources(self, sources):
+        """sources plus every source that shares a chunk with one of them, transitively.
+
+        A near-duplicate chunk kept for several files lists the others in
+        duplicate_sources (src/dedup.py), so dropping it for one file drops it
+        for all of them.
+        """
+        with self._lock:
+            groups = [
+                {self.sources[source_id], *json.loads(extra).get("duplicate_sources", [])}
+                for source_id, extra in self._conn.execute(
+                    "SELECT source_id, extra FROM chunks WHERE extra LIKE '%duplicate_sources%'"
+                )
+            ]
+        linked = set(sources)
+        grown = True
+        while grown:
+            grown = False
+            for group in groups:
+                if group & linked and not group <= linked:
+                    linked |= group
+                    grown = True
+        return linked
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteDocstore(Docstore):
+    """LangChain Docstore adapter: ids are the FAISS row numbers as strings."""
+
+    def __init__(self, path):
+        self.store = ChunkStore(path)
+
+    def search(self, search):
+        doc = self.store.get(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def delete(self, ids):
+        # Indexes are immutable once published; the watcher builds a new version instead
+        raise ReadOnlyDocstoreError("The SQLite chunk store is read-only; rebuild the index instead.")
+
+
+class RowIdMapping(Mapping):
+    """index_to_docstore_id for a chunk store: row i maps to id "i", without a dict."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return str(i)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+def convert_pickled_docstore(index_path):
+    """Write chunks.sqlite for an index saved by FAISS.save_local, then drop index.pkl."""
+    import pickle
+
+    pkl_file = os.path.join(index_path, "index.pkl")
+    with open(pkl_file, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    documents = (docstore.search(index_to_docstore_id[i]) for i in range(len(index_to_docstore_id)))
+    write_chunk_store(os.path.join(index_path, CHUNK_STORE_FILE), documents)
+    os.remove(pkl_file)
+
+
+if __name__ == "__main__":
+    convert_pickled_docstore(sys.argv[1] if len(sys.argv) > 1 else "faiss_index")
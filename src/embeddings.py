@@ -0,0 +1,46 @@
+"""Deterministic local embeddings for offline runs and retrieval evaluation.
+
+HashingEmbeddings maps the words and word pairs of a text into a fixed number
+of signed buckets (the hashing trick) and L2-normalises the result. It needs
+no network or API key and always gives the same vector for the same text, so
+evaluation runs are reproducible. It only captures lexical overlap, so its
+scores are a baseline for comparing index configurations, not a stand-in for
+the quality of the Google embeddings. An index must be queried with the same
+embeddings it was built with.
+"""
+import hashlib
+import math
+
+from langchain_core.embeddings import Embeddings
+
+from src.rerank import tokenize
+
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dimension=768):
+        self.dimension = dimension
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        # The lowest bit picks the sign so that collisions tend to cancel out
+        return (value >> 1) % self.dimension, 1.0 if value & 1 else -1.0
+
+    def _embed(self, text):
+        words = tokenize(text)
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = [0.0] * self.dimension
+        for feature, count in counts.items():
+            bucket, sign = self._bucket(feature)
+            vector[bucket] += sign * (1 + math.log(count))
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
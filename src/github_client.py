@@ -0,0 +1,147 @@
+"""Concurrent, conditional and disk-cached GitHub API client for the portfolio page.
+
+Responses are cached on disk with their ETag/Last-Modified, and later requests
+send If-None-Match/If-Modified-Since, so unchanged data costs a 304 (which does
+not count against the GitHub rate limit) and survives restarts. Point
+GITHUB_API_URL at a local stand-in server to test it offline.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+
+import httpx
+
+
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+GITHUB_CACHE_DIR = os.environ.get("GITHUB_CACHE_DIR", os.path.join(".cache", "github"))
+GITHUB_TIMEOUT_SECONDS = float(os.environ.get("GITHUB_TIMEOUT_SECONDS", "10"))
+REPOS_PER_PAGE = 100
+
+
+class DiskCache:
+    """One JSON file per URL holding the body and its validators."""
+
+    def __init__(self, directory=GITHUB_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, url, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(f"{path}.tmp", path)
+
+
+def parse_link_header(header):
+    """{'next': url, 'last': url, ...} from a GitHub Link header."""
+    return {rel: url for url, rel in re.findall(r'<([^>]+)>;\s*rel="([^"]+)"', header or "")}
+
+
+class GitHubClient:
+    def __init__(self, base_url=GITHUB_API_URL, cache=None, token=None, client=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache or DiskCache()
+        headers = {"Accept": "application/vnd.github+json"}
+        token = token or os.environ.get("GITHUB_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        # One pooled client: connections are reused across all requests
+        self.client = client or httpx.AsyncClient(
+            headers=headers,
+            timeout=GITHUB_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def get(self, url):
+        """GET a JSON resource, revalidating any cached copy; returns (body, links)."""
+        if not url.startswith("http"):
+            url = f"{self.base_url}{url}"
+        cached = self.cache.get(url)
+        if cached and "body" not in cached:
+            cached = None  # validators without a body cannot be revalidated
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response = await self.client.get(url, headers=headers)
+        except httpx.TransportError:
+            if cached:
+                # Offline or GitHub unreachable: serve the last known copy
+                return cached["body"], cached.get("links", {})
+            raise
+
+        if response.status_code == 304:
+            if cached:
+                return cached["body"], cached.get("links", {})
+            # Not modified, but there is no copy to reuse: ask again for the body
+            response = await self.client.get(url, headers={"Cache-Control": "no-cache"})
+        response.raise_for_status()
+
+        body = response.json()
+        links = parse_link_header(response.headers.get("Link"))
+        self.cache.set(url, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "links": links,
+            "body": body,
+        })
+        return body, links
+
+    async def get_user(self, username):
+        body, _ = await self.get(f"/users/{username}")
+        return body
+
+    async def get_repos(self, username):
+        """All repositories of a user; pages after the first are fetched concurrently."""
+        first_url = f"/users/{username}/repos?sort=updated&per_page={REPOS_PER_PAGE}&page=1"
+        repos, links = await self.get(first_url)
+        repos = list(repos)
+
+        last_page = re.search(r"[?&]page=(\d+)", links.get("last", ""))
+        if last_page:
+            pages = range(2, int(last_page.group(1)) + 1)
+            results = await asyncio.gather(*(
+                self.get(f"/users/{username}/repos?sort=updated&per_page={REPOS_PER_PAGE}&page={page}")
+                for page in pages
+            ))
+            for body, _ in results:
+                repos.extend(body)
+        else:
+            # No "last" link: follow "next" links one page at a time
+            while links.get("next"):
+                body, links = await self.get(links["next"])
+                repos.extend(body)
+        return repos
+
+
+async def fetch_github_data_async(username, base_url=GITHUB_API_URL, cache_dir=GITHUB_CACHE_DIR):
+    async with GitHubClient(base_url, DiskCache(cache_dir)) as github:
+        return await asyncio.gather(github.get_user(username), github.get_repos(username))
+
+
+def fetch_github_data(username, base_url=GITHUB_API_URL, cache_dir=GITHUB_CACHE_DIR):
+    """Blocking wrapper for Streamlit: returns (user_data, repos_data)."""
+    user_data, repos_data = asyncio.run(fetch_github_data_async(username, base_url, cache_dir))
+    return user_data, repos_data
@@ -0,0 +1,243 @@
+"""Hedged LLM requests: cut tail latency by racing a second request.
+
+HedgedRunnable sends a request to the primary model. If no answer has come
+back after the hedge delay, it fires the same request at a backup (the same
+model or a fallback model) and returns whichever answers first; if the primary
+fails outright the backup is tried at once. The delay tracks the recent p95
+latency of the primary, so only about 1 in 20 requests is hedged and the extra
+load stays around 5%.
+
+stream() hedges on the time to the first chunk instead (tracked separately):
+the request that starts answering first is streamed, and the other one is
+closed as soon as its next chunk arrives. With invoke a losing request that has
+already started cannot be interrupted; it runs to completion and its result is
+discarded. Both kinds of loser are counted as "abandoned" in the stats.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_core.runnables import Runnable
+
+
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "0") == "1"
+LLM_FALLBACK_MODEL = os.environ.get("LLM_FALLBACK_MODEL")
+# Hedge delay used until enough latencies have been seen, and its bounds
+LLM_HEDGE_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_DELAY_SECONDS", "2.0"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_SECONDS", "0.3"))
+LLM_HEDGE_MAX_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_MAX_DELAY_SECONDS", "10"))
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "0.95"))
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_HEDGE_THREADS", "16")), thread_name_prefix="llm-hedge")
+
+
+class LatencyTracker:
+    """Rolling window of request latencies and the percentile used as hedge delay."""
+
+    def __init__(self, window=200, min_samples=20, percentile=LLM_HEDGE_PERCENTILE,
+                 default=LLM_HEDGE_DELAY_SECONDS, bounds=(LLM_HEDGE_MIN_DELAY_SECONDS, LLM_HEDGE_MAX_DELAY_SECONDS)):
+        self._lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.default = default
+        self.bounds = bounds
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def delay(self):
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.default
+            ordered = sorted(self.samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        return min(max(value, self.bounds[0]), self.bounds[1])
+
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self.primary_errors = 0
+        self.abandoned = 0
+
+    def record(self, hedged, backup_won, primary_error):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.backup_wins += backup_won
+            self.primary_errors += primary_error
+
+    def record_abandoned(self):
+        with self._lock:
+            self.abandoned += 1
+
+    def snapshot(self):
+        with self._lock:
+            requests = self.requests or 1
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "backup_wins": self.backup_wins,
+                "primary_errors": self.primary_errors,
+                "abandoned": self.abandoned,
+                "fraction_hedged": self.hedged / requests,
+            }
+
+
+hedge_stats = HedgeStats()
+
+
+_END = object()
+
+
+class _HedgeStream:
+    """A stream() call running on its own thread, feeding its chunks to a queue.
+
+    The thread is put on the started queue once, when the first chunk, the end
+    of the stream or an error arrives; started_ok tells which.
+    """
+
+    def __init__(self, runnable, input, config, kwargs, started):
+        self.chunks = queue.Queue()
+        self.error = None
+        self.started_ok = False
+        self._closed = threading.Event()
+        self._started = started
+        # A thread per stream rather than the pool: streams hold it for the whole answer
+        threading.Thread(target=self._run, args=(runnable, input, config, kwargs),
+                         name="llm-hedge-stream", daemon=True).start()
+
+    def _run(self, runnable, input, config, kwargs):
+        first = True
+        iterator = None
+        try:
+            iterator = iter(runnable.stream(input, config, **kwargs))
+            for chunk in iterator:
+                if self._closed.is_set():
+                    break
+                self.chunks.put(chunk)
+                if first:
+                    first, self.started_ok = False, True
+                    self._started.put(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()  # releases the HTTP stream of an abandoned request
+            self.chunks.put(_END)
+            if first:
+                self.started_ok = self.error is None
+                self._started.put(self)
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is _END:
+                break
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+class HedgedRunnable(Runnable):
+    """Runs primary, and backup too if primary is slower than the hedge delay."""
+
+    def __init__(self, primary, backup, tracker=None, stats=hedge_stats, delay=None, first_chunk_tracker=None):
+        self.primary = primary
+        self.backup = backup
+        self.tracker = tracker or LatencyTracker()
+        self.first_chunk_tracker = first_chunk_tracker or LatencyTracker()
+        self.stats = stats
+        # A fixed delay overrides the tracked percentile (useful for tests)
+        self.fixed_delay = delay
+
+    def hedge_delay(self):
+        return self.fixed_delay if self.fixed_delay is not None else self.tracker.delay()
+
+    def first_chunk_delay(self):
+        return self.fixed_delay if self.fixed_delay is not None else self.first_chunk_tracker.delay()
+
+    def _timed_primary(self, input, config):
+        start = time.perf_counter()
+        result = self.primary.invoke(input, config)
+        self.tracker.record(time.perf_counter() - start)
+        return result
+
+    def invoke(self, input, config=None, **kwargs):
+        primary = _hedge_pool.submit(self._timed_primary, input, config)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done and primary.exception() is None:
+            self.stats.record(False, False, False)
+            return primary.result()
+
+        primary_error = bool(done)
+        backup = _hedge_pool.submit(self.backup.invoke, input, config)
+        pending = {backup} if primary_error else {primary, backup}
+        error = primary.exception() if primary_error else None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        # Only a request that has not started can be cancelled
+                        if not other.cancel():
+                            self.stats.record_abandoned()
+                    self.stats.record(True, future is backup, primary_error)
+                    return future.result()
+                error = future.exception()
+        self.stats.record(True, False, primary_error)
+        raise error
+
+    def stream(self, input, config=None, **kwargs):
+        started = queue.Queue()
+        start = time.perf_counter()
+        primary = _HedgeStream(self.primary, input, config, kwargs, started)
+        streams = [primary]
+        try:
+            try:
+                first = started.get(timeout=self.first_chunk_delay())
+            except queue.Empty:
+                first = None
+            if first is primary and primary.started_ok:
+                self.first_chunk_tracker.record(time.perf_counter() - start)
+                self.stats.record(False, False, False)
+                yield from primary
+                return
+
+            primary_error = first is primary
+            backup = _HedgeStream(self.backup, input, config, kwargs, started)
+            streams.append(backup)
+            pending = {backup} if primary_error else {primary, backup}
+            error = primary.error if primary_error else None
+            while pending:
+                stream = started.get()
+                pending.discard(stream)
+                if stream.started_ok:
+                    if stream is primary or primary in pending:
+                        # A losing primary took at least this long, which keeps
+                        # the percentile from drifting down as it gets abandoned
+                        self.first_chunk_tracker.record(time.perf_counter() - start)
+                    for other in pending:
+                        other.close()
+                        self.stats.record_abandoned()
+                    self.stats.record(True, stream is backup, primary_error)
+                    yield from stream
+                    return
+                error = stream.error
+            self.stats.record(True, False, primary_error)
+            raise error
+        finally:
+            # Also reached when the caller stops reading early
+            for stream in streams:
+                stream.close()
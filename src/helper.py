@@ -6,164 +6,645 @@ from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.document_loaders import DirectoryLoader
+import logging
 import re
 import streamlit as st
-import os
 import json
 from datetime import datetime
 import hashlib
-from src.prompt import RBC
+import pickle
+import time
+import shutil
+import tempfile
+import faiss
+from src.prompt import RBC, CONDENSE, SUMMARIZE
+from src.router import route, small_talk_response
+from src.state import LocalBackend, get_backend
+from src.rerank import RERANK_FETCH_K, RERANK_MAX_K, estimate_tokens, select_context
+from src.mmr import MMR_ENABLED, MMR_FETCH_K, MMR_LAMBDA
+from src.memory import needs_condensing
+from src.loaders import iter_documents
+from src.shards import DATA_PATH, ShardedIndex, list_shards, parse_chunk_id, source_department
+from src.embeddings import HashingEmbeddings
+from src.ingest import build_shards
+from src.hedge import LLM_FALLBACK_MODEL, LLM_HEDGE_ENABLED, HedgedRunnable
+from src.querylog import StageTimer, get_query_log
+from src.breaker import LLM_BREAKER_ENABLED, extractive_answer, llm_breaker
+from src.api_client import CHATBOT_API_URL, ChatbotAPIClient
+from src.deadline import CONDENSE_MIN_SECONDS, GENERATE_MIN_SECONDS, Deadline, DeadlineExceeded
+from src.summaries import SUMMARY_FILE
+from src.docstore import CHUNK_STORE_FILE, RowIdMapping, SQLiteDocstore, write_chunk_store
 
 
 load_dotenv()  # take environment variables
-GOOGLE_API_KEY = os.environ['GOOGLE_API_KEY']
+logger = logging.getLogger(__name__)
+# Only needed for the Google models, so offline runs (EMBEDDINGS_BACKEND=hashing) can do without it
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+
+
+FAISS_INDEX_PATH = "faiss_index"
+# "google" or "hashing" (deterministic and offline, see src/embeddings.py); an
+# index must be queried with the embeddings it was built with
+EMBEDDINGS_BACKEND = os.environ.get("EMBEDDINGS_BACKEND", "google")
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "50"))
+# Characters of chunk text sent with each citation; the rest is fetched on demand
+CITATION_SNIPPET_CHARS = int(os.environ.get("CITATION_SNIPPET_CHARS", "160"))
+# Chat messages rendered at first on the chatbot page; older ones are shown on request
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "20"))
+# "full" sends every selected chunk to the LLM; "summary" sends the top
+# CONTEXT_EXPAND_K in full and precomputed summaries for the rest (src/summaries.py)
+CONTEXT_TIER = os.environ.get("CONTEXT_TIER", "full")
+CONTEXT_EXPAND_K = int(os.environ.get("CONTEXT_EXPAND_K", "2"))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+# Memory-map the index read-only so every worker process shares one page-cache copy
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "1") == "1"
+
+
+# Shared resources: st.cache_resource keeps one instance per process, so they
+# survive Streamlit reruns and are shared across sessions (and the API workers).
+@st.cache_resource(show_spinner=False)
+def get_llm(model="gemini-2.0-flash"):
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=0.5,
+        max_tokens=None,
+        # Bounds how long a call abandoned at a request deadline keeps its thread
+        timeout=LLM_TIMEOUT_SECONDS,
+        max_retries=2,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_llm():
+    """The LLM used for answers: hedged against a second request when LLM_HEDGE_ENABLED=1."""
+    if not LLM_HEDGE_ENABLED:
+        return get_llm()
+    # The backup is the fallback model if one is set, otherwise a second request to the same one
+    backup = get_llm(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else get_llm()
+    return HedgedRunnable(get_llm(), backup)
+
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings():
+    if EMBEDDINGS_BACKEND == "hashing":
+        return HashingEmbeddings()
+    return GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key = GOOGLE_API_KEY)
+
+
+def read_faiss_index(path=FAISS_INDEX_PATH, mmap=FAISS_MMAP):
+    index_file = os.path.join(path, "index.faiss")
+    if not mmap:
+        return faiss.read_index(index_file)
+    # Vectors stay on disk and are paged in on demand; the mapping is read-only,
+    # so the index must not be modified (rebuild it with create_and_store_vs instead).
+    return faiss.read_index(index_file, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+
+
+def load_faiss(path=FAISS_INDEX_PATH, mmap=FAISS_MMAP):
+    index = read_faiss_index(path, mmap=mmap)
+
+    chunk_file = os.path.join(path, CHUNK_STORE_FILE)
+    if os.path.exists(chunk_file):
+        # Chunk text is fetched from SQLite only for the hits a query uses
+        return FAISS(get_embeddings(), index, SQLiteDocstore(chunk_file), RowIdMapping(index.ntotal))
 
+    # Legacy layout written by FAISS.save_local (convert with `python -m src.docstore`)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+
+
+def write_index_files(index, documents, path):
+    """Write index.faiss plus a SQLite chunk store (documents in index order) to path."""
+    os.makedirs(path, exist_ok=True)
+    index_file = os.path.join(path, "index.faiss")
+    faiss.write_index(index, f"{index_file}.tmp")
+    os.replace(f"{index_file}.tmp", index_file)
+    write_chunk_store(os.path.join(path, CHUNK_STORE_FILE), documents)
+
+
+def iter_vector_store_documents(vector_store):
+    return (
+        vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+        for i in range(vector_store.index.ntotal)
+    )
+
+
+def save_faiss(vector_store, path=FAISS_INDEX_PATH):
+    """Write index.faiss plus a SQLite chunk store instead of the pickled docstore."""
+    write_index_files(vector_store.index, iter_vector_store_documents(vector_store), path)
+
+    # A stale pickle would no longer match the new index
+    pkl_file = os.path.join(path, "index.pkl")
+    if os.path.exists(pkl_file):
+        os.remove(pkl_file)
+
+
+# Published indexes live in versioned sub-directories of FAISS_INDEX_PATH and the
+# CURRENT file names the live one, so a new version can be swapped in atomically
+# while running workers keep serving (and memory-mapping) the previous one.
+def current_index_path(root=FAISS_INDEX_PATH):
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        # Unversioned layout: the index files sit directly in root
+        return root
+
+
+def read_manifest(path):
+    """Source file -> fingerprint of the files an index version was built from."""
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0.5,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
 
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key = GOOGLE_API_KEY)
+def file_fingerprint(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
 
 
-def load_data_path(path = '../resources/data'):
-    loader = DirectoryLoader(path)
-    docs = loader.load()
-    return docs
+def publish_index(shards, manifest, root=FAISS_INDEX_PATH, keep=2, reuse=None):
+    """Write a new index version and point CURRENT at it; returns its directory.
 
+    shards maps shard name -> (faiss index, documents in index order) to write;
+    reuse maps shard name -> directory of an unchanged shard to carry over.
+    """
+    version = datetime.now().strftime("v%Y%m%d%H%M%S%f")
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    for name, (index, documents) in shards.items():
+        write_index_files(index, documents, os.path.join(path, name))
+    for name, shard_path in (reuse or {}).items():
+        # Files are never modified in place, so hard links are a free copy
+        os.makedirs(os.path.join(path, name))
+        for file_name in ("index.faiss", CHUNK_STORE_FILE, SUMMARY_FILE):
+            if file_name == SUMMARY_FILE and not os.path.exists(os.path.join(shard_path, file_name)):
+                continue  # summaries are optional
+            os.link(os.path.join(shard_path, file_name), os.path.join(path, name, file_name))
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
 
-def update_metadata_into_docs(docs): 
+    current_file = os.path.join(root, "CURRENT")
+    with open(f"{current_file}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{current_file}.tmp", current_file)
+
+    # Keep the previous version around for workers that have not switched yet
+    versions = sorted(name for name in os.listdir(root) if re.fullmatch(r"v\d+", name))
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return path
+
+
+def load_sharded_index(path, mmap=FAISS_MMAP):
+    paths = list_shards(path)
+    shards = {name: load_faiss(shard_path, mmap=mmap) for name, shard_path in paths.items()}
+    # The version directory name prefixes chunk ids, so they stay resolvable
+    # while that version is kept around (see publish_index)
+    return ShardedIndex(shards, get_embeddings(), version=os.path.basename(os.path.normpath(path)), paths=paths)
+
+
+# Keyed by version directory, so publishing a new version is picked up on the next question
+@st.cache_resource(show_spinner="Loading knowledge base...", max_entries=2)
+def load_vector_store(path=None):
+    return load_sharded_index(path or current_index_path())
+
+
+@st.cache_resource(show_spinner=False)
+def get_prompt(department):
+    prompt = PromptTemplate(template=RBC, input_variables=["context", "question", "department"])
+    return prompt.partial(department=department)
+
+
+@st.cache_resource(show_spinner=False)
+def get_chain(department):
+    return get_prompt(department) | get_answer_llm() | StrOutputParser()
+
+
+@st.cache_resource(show_spinner=False)
+def get_condense_chain():
+    prompt = PromptTemplate(template=CONDENSE, input_variables=["history", "question"])
+    return prompt | get_llm() | StrOutputParser()
+
+
+@st.cache_resource(show_spinner=False)
+def get_summary_chain(department):
+    prompt = PromptTemplate(template=SUMMARIZE, input_variables=["summary", "transcript", "max_words"])
+    return prompt.partial(department=department) | get_llm() | StrOutputParser()
+
+
+def condense_question(question, memory):
+    """Rewrite a follow-up ("and for Q3?") into a standalone question using the memory."""
+    if memory is None or memory.is_empty() or not needs_condensing(question):
+        return question
+    condensed = get_condense_chain().invoke({"history": memory.render(), "question": question}).strip()
+    return condensed or question
+
+
+def remember_turn(memory, question, response, input_department, summarize=True, deadline=None):
+    """Add a turn to the memory, summarizing older turns to stay within the token budget.
+
+    With summarize=False the older turns are dropped instead (no LLM call). With
+    a deadline, they are also dropped (and "remember" is cut) when less than
+    CONDENSE_MIN_SECONDS is left or the summary does not arrive in time.
+    """
+    deadline = deadline or Deadline()
+
+    def summarize_turns(summary, transcript):
+        if not deadline.allows(CONDENSE_MIN_SECONDS):
+            deadline.cut("remember")
+            return summary
+        try:
+            return deadline.run(lambda: get_summary_chain(input_department).invoke({
+                "summary": summary or "(none)",
+                "transcript": transcript,
+                "max_words": memory.token_budget // 2,
+            }).strip())
+        except DeadlineExceeded:
+            deadline.cut("remember")
+            return summary
+        except Exception:
+            logger.exception("Summarizing the conversation failed; keeping the raw turns")
+            # Keep the raw lines; add_turn trims them to the budget
+            return f"{summary} {transcript}".strip()
+
+    memory.add_turn(question, response, summarize=summarize_turns if summarize else None)
+
+
+def load_data_path(path = '../resources/data', workers=None):
+    # Native parsers for .md/.csv, unstructured for the rest, in a process pool
+    return list(iter_documents(path, workers=workers))
+
+
+def update_metadata_into_docs(docs, data_path=DATA_PATH):
+    """Tag each document with the departments that may read it (a generator).
+
+    The department is the document's directory below data_path; documents
+    directly in data_path are left out.
+    """
     department_list = ['engineering', 'finance', 'hr', 'marketing']
     all_access_departments = department_list + ['c_level']
-    updated_docs = []
     for doc in docs:
-        source = doc.metadata.get('source', '')
-        match = re.search(r'/data/([^/]+)/', source)
-        if match:
-            dept = match.group(1)
+        dept = source_department(doc.metadata.get('source', ''), data_path)
+        if dept:
             if dept == 'general':
                 # For general documents, give access to all departments and c_level
                 doc.metadata['department'] = all_access_departments
             else:
                 # For specific department documents, add c_level as well
                 doc.metadata['department'] = [dept, 'c_level']
-            updated_docs.append(doc)
-    updated_docs
-    return updated_docs
+            yield doc
 
 
-def create_and_store_vs(updated_docs):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+def get_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
-    split_text = text_splitter.split_documents(updated_docs)
 
-    vector_store = FAISS.from_documents(split_text, embedding=embeddings)
+def create_and_store_vs(updated_docs, root=FAISS_INDEX_PATH, text_splitter=None, data_path=DATA_PATH):
+    """Build and publish a new index version from documents.
 
-    vector_store.save_local("faiss_index")
+    Returns {shard: (vectors written, near-duplicate chunks collapsed)}.
 
-    return vector_store
+    updated_docs may be any iterable (e.g. the iter_documents generator): each
+    document is split, embedded in batches and appended to its shard's files on
+    disk as it arrives, so memory use does not grow with the corpus.
+    """
+    os.makedirs(root, exist_ok=True)
+    # Shards are built next to the versions (same filesystem) and hard-linked in
+    staging = tempfile.mkdtemp(prefix=".build-", dir=root)
+    try:
+        # One index per <data_path>/<dept>/ directory, so shards can be searched
+        # and rebuilt independently
+        counts, sources = build_shards(updated_docs, text_splitter or get_text_splitter(), get_embeddings(), staging,
+                                       data_path=data_path)
 
-def answer(question, input_department):
-    # Step 1: Use retriever with the actual question
-    vector_store = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    retriever = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 7})
-    results = retriever.invoke(question)
+        # Record what the index was built from so the watcher can update it incrementally
+        manifest = {source: file_fingerprint(source) for source in sources if os.path.exists(source)}
+        publish_index({}, manifest, root, reuse={shard: os.path.join(staging, shard) for shard in counts})
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
-    # Step 2: Enhanced filtering to handle both string and list departments
-    filtered_results = []
-    for doc in results:
-        department = doc.metadata.get("department", "")
-        source = doc.metadata.get("source", "")
-        
-        # Check if document should be included based on department
-        should_include = False
-        
-        # Handle case where department is a list
-        if isinstance(department, list):
-            if "general" in department or input_department in department:
-                should_include = True
-        # Handle case where department is a string
-        elif isinstance(department, str):
-            if department.lower() == "general" or department.lower() == input_department.lower():
-                should_include = True
-        
-        # Also check source field for department or general
-        if "general" in source.lower() or input_department.lower() in source.lower():
-            should_include = True
-        
-        if should_include:
-            filtered_results.append(doc)
-
-    if not filtered_results:
-        return "I am sorry, I cannot answer the question as no relevant documents were found.", []
-
-    context = filtered_results
-    
-    TEMPLATE = RBC    
-    prompt = PromptTemplate(template=TEMPLATE, input_variables=["context", "question", 'department'])
+    vectors, collapsed = sum(v for v, _ in counts.values()), sum(c for _, c in counts.values())
+    if collapsed:
+        logger.info("Collapsed %d near-duplicate chunks: %d vectors instead of %d", collapsed, vectors, vectors + collapsed)
+    return counts
 
-    chain = prompt | llm | StrOutputParser()
+def is_permitted(metadata, input_department):
+    """Enhanced filtering to handle both string and list departments."""
+    department = metadata.get("department", "")
+    source = metadata.get("source", "")
     
-    response = chain.invoke({"context": context, "question": question, 'department':input_department})
+    # Handle case where department is a list
+    if isinstance(department, list):
+        if "general" in department or input_department in department:
+            return True
+    # Handle case where department is a string
+    elif isinstance(department, str):
+        if department.lower() == "general" or department.lower() == input_department.lower():
+            return True
     
-    return response, context
+    # Also check source field for department or general
+    return "general" in source.lower() or input_department.lower() in source.lower()
+
+
+def retrieve(question, input_department, index=None, deadline=None):
+    """Two-stage retrieval: cheap vector candidates, then local rerank with adaptive k.
+
+    Returns [(Document, score)] for the permitted chunks worth sending to the LLM.
+    index defaults to the published ShardedIndex; with a Deadline, shards that
+    miss it are left out of a fan-out search.
+    """
+    index = index or load_vector_store(current_index_path())
+    permitted = lambda metadata: is_permitted(metadata, input_department)
+    # Only the department's shard and general are searched (all shards for c_level)
+    if MMR_ENABLED:
+        # Diverse candidates, chosen only among chunks the department may read
+        candidates = index.max_marginal_relevance_search(
+            question, input_department, k=RERANK_MAX_K, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA, filter=permitted,
+            deadline=deadline,
+        )
+    else:
+        candidates = index.search(
+            question, input_department, k=RERANK_FETCH_K, fetch_k=RERANK_FETCH_K * 4, filter=permitted,
+            deadline=deadline,
+        )
+    return select_context(question, candidates)
+
+
+def format_context(docs):
+    # Only the text and its source go into the prompt, not the whole Document repr
+    return "\n\n".join(f"[{doc.metadata.get('source', '')}]\n{doc.page_content}" for doc in docs)
+
+
+def format_tiered_context(docs, index, expand_k=CONTEXT_EXPAND_K):
+    """Context with the top expand_k chunks in full and summaries for the rest.
+
+    Lower hits from the same section are replaced by that section's summary,
+    once; hits without a summary (e.g. not summarised yet) keep their full text.
+    """
+    summaries = index.summaries_for(docs[expand_k:])
+    sections = {}
+    for doc in docs[expand_k:]:
+        if doc.id in summaries:
+            sections.setdefault(summaries[doc.id][1], []).append(doc)
+
+    parts, emitted = [], set()
+    for i, doc in enumerate(docs):
+        source = doc.metadata.get('source', '')
+        if i < expand_k or doc.id not in summaries:
+            parts.append(f"[{source}]\n{doc.page_content}")
+            continue
+        summary, section, section_summary = summaries[doc.id]
+        if len(sections[section]) == 1:
+            parts.append(f"[{source} (summary)]\n{summary}")
+        elif section not in emitted:
+            emitted.add(section)
+            parts.append(f"[{source} (section summary)]\n{section_summary}")
+    return "\n\n".join(parts)
+
+
+def answer(question, input_department, memory=None, index=None, timer=None, deadline=None):
+    """Answer a question for a department.
+
+    If a ConversationMemory is given, follow-ups are condensed into standalone
+    questions and the memory is updated in place with the new turn. Stage
+    timings go into timer (a StageTimer) and, if enabled, the query log. If the
+    LLM fails or its circuit breaker is open, the answer is extractive (an
+    "extract" stage instead of "generate"; see src/breaker.py) and
+    timer.degraded is set. Stages that do
+    not fit in the deadline (a Deadline, by default REQUEST_DEADLINE_SECONDS)
+    are skipped or cut short and listed in deadline.cut_stages.
+    """
+    context, pieces = stream_answer(question, input_department, memory=memory, index=index, timer=timer, deadline=deadline)
+    return "".join(pieces), context
+
+
+def stream_answer(question, input_department, memory=None, index=None, timer=None, deadline=None):
+    """Like answer(), but returns (context, iterator of answer text pieces) once
+    retrieval is done, so the answer can be shown while the LLM writes it.
+
+    The memory and the query log are updated when the iterator is exhausted.
+    """
+    timer = timer or StageTimer()
+    deadline = deadline or Deadline()
+
+    # Step 0: Greetings and small talk need no context, so skip embedding and search
+    with timer.stage("route"):
+        intent = route(question)
+    if intent:
+        response = small_talk_response(intent, input_department)
+        log_query(input_department, question, [], timer, intent=intent)
+        return [], iter([response])
+
+    # Step 1: Resolve follow-ups against the conversation so far
+    with timer.stage("condense"):
+        standalone_question = question
+        if memory is None or memory.is_empty() or not needs_condensing(question):
+            pass
+        elif LLM_BREAKER_ENABLED and not llm_breaker.is_closed():
+            pass  # the LLM is down, so the follow-up is searched as asked
+        elif not deadline.allows(CONDENSE_MIN_SECONDS):
+            deadline.cut("condense")
+        else:
+            try:
+                standalone_question = deadline.run(condense_question, question, memory)
+            except DeadlineExceeded:
+                deadline.cut("condense")
+            except Exception:
+                if not LLM_BREAKER_ENABLED:
+                    raise
+                logger.exception("Condensing the question failed; using it as asked")
+
+    # Step 2: Retrieve permitted chunks and keep only the relevant ones
+    with timer.stage("retrieve"):
+        context = []
+        try:
+            # Loading the index (first request after a publish) counts against the deadline too
+            index = index or deadline.run(load_vector_store, current_index_path())
+            hits = deadline.run(retrieve, standalone_question, input_department, index, deadline)
+        except DeadlineExceeded:
+            deadline.cut("retrieve")
+            hits = []
+        for doc, score in hits:
+            doc.metadata["score"] = round(float(score), 4)
+            context.append(doc)
+
+    pieces = _answer_pieces(question, standalone_question, context, input_department, memory, index, timer, deadline)
+    return context, pieces
+
+
+def _answer_pieces(question, standalone_question, context, input_department, memory, index, timer, deadline):
+    parts = []
+    context_tokens = 0
+    if not context:
+        if "retrieve" in deadline.cut_stages:
+            parts.append("I am sorry, I could not search the documents in time. Please try again.")
+        else:
+            parts.append("I am sorry, I cannot answer the question as no relevant documents were found.")
+        yield parts[-1]
+    else:
+        # Step 3: Generate the answer from the selected chunks
+        interrupted = None
+        if not deadline.allows(GENERATE_MIN_SECONDS):
+            deadline.cut("generate")
+        else:
+            if CONTEXT_TIER == "summary":
+                context_text = format_tiered_context(context, index)
+            else:
+                context_text = format_context(context)
+            context_tokens = estimate_tokens(context_text)
+            allowed = failed = finished = False
+            start = time.perf_counter()
+            try:
+                allowed = not LLM_BREAKER_ENABLED or llm_breaker.allow()
+                timer.degraded = not allowed
+                if allowed:
+                    with timer.stage("generate"):
+                        chain = get_chain(input_department)
+                        for piece in deadline.iterate(chain.stream({"context": context_text, "question": standalone_question})):
+                            parts.append(piece)
+                            yield piece
+                    finished = True
+            except DeadlineExceeded:
+                deadline.cut("generate")
+                interrupted = "to meet the response deadline"
+                # Counts as a failure only if it was slower than LLM_SLOW_SECONDS
+                finished = True
+            except Exception:
+                if not LLM_BREAKER_ENABLED:
+                    raise
+                logger.exception("Answer LLM failed; falling back to an extractive answer")
+                failed = timer.degraded = True
+                interrupted = "because the assistant became unavailable"
+            finally:
+                # Every call the breaker let through is reported however it ended, so a
+                # half-open probe is always released; a reader that went away (e.g. a
+                # closed stream) leaves an LLM that was writing counted as fine
+                if LLM_BREAKER_ENABLED and allowed:
+                    llm_breaker.record(not failed and (finished or bool(parts)), time.perf_counter() - start)
+        if not parts:
+            # No time for the LLM, or it is failing (or the breaker is open): quote the best-matching sentences instead
+            with timer.stage("extract"):
+                parts.append(extractive_answer(standalone_question, context))
+            yield parts[-1]
+        elif interrupted:
+            parts.append(f"\n\n(The answer was cut short {interrupted}.)")
+            yield parts[-1]
+
+    response = "".join(parts)
+    if memory is not None:
+        with timer.stage("remember"):
+            # Folding old turns into the summary is an LLM call; while the LLM is down they
+            # are dropped instead, as remember_turn does when the deadline leaves no time for it
+            summarize = not LLM_BREAKER_ENABLED or llm_breaker.is_closed()
+            remember_turn(memory, standalone_question, response, input_department, summarize=summarize, deadline=deadline)
+
+    log_query(input_department, question, [doc.id for doc in context], timer, context_tokens=context_tokens,
+              cut_stages=deadline.cut_stages, degraded=timer.degraded)
+
+
+def log_query(input_department, question, chunk_ids, timer, **extra):
+    query_log = get_query_log()
+    if query_log is not None:
+        query_log.record(input_department, question, chunk_ids, timer, **extra)
 
 
 # User database operations
 class UserManager:
-    def __init__(self, db_file="users.json"):
+    def __init__(self, db_file="users.json", backend=None):
         self.db_file = db_file
-        self.users = self.load_users()
+        # Users live behind a StateBackend so every worker sees the same accounts
+        self.backend = backend or LocalBackend(db_file)
     
-    def load_users(self):
-        if os.path.exists(self.db_file):
-            with open(self.db_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def save_users(self):
-        with open(self.db_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
+    @property
+    def users(self):
+        return self.backend.get_users()
     
     def hash_password(self, password):
         return hashlib.sha256(password.encode()).hexdigest()
     
     def register_user(self, username, department, email, password, full_name):
-        if username in self.users:
-            return False, "Username already exists"
-        if any(user.get('email') == email for user in self.users.values()):
-            return False, "Email already registered"
-        
-        self.users[username] = {
+        return self.backend.create_user(username, {
             'email': email,
             'department': department,
             'password': self.hash_password(password),
             'full_name': full_name,
             'created_at': datetime.now().isoformat(),
             'last_login': None
-        }
-        self.save_users()
-        return True, "Registration successful"
+        })
     
     def authenticate_user(self, username, password):
-        if username not in self.users:
+        user = self.backend.get_user(username)
+        if not user:
             return False, "User not found"
         
-        if self.users[username]['password'] != self.hash_password(password):
+        if user['password'] != self.hash_password(password):
             return False, "Invalid password"
         
         # Update last login timestamp
-        self.users[username]['last_login'] = datetime.now().isoformat()
-        self.save_users()
+        self.backend.update_user(username, {'last_login': datetime.now().isoformat()})
         return True, "Login successful"
     
     def get_user_info(self, username):
-        return self.users.get(username, {})
+        return self.backend.get_user(username) or {}
+
+
+@st.cache_resource(show_spinner=False)
+def get_user_manager():
+    return UserManager(backend=get_backend())
+
+
+@st.cache_resource(show_spinner=False)
+def get_api_client():
+    """The pooled API client used by the UI in thin client mode (CHATBOT_API_URL)."""
+    return ChatbotAPIClient(CHATBOT_API_URL)
+
+
+def to_citations(context, snippet_chars=CITATION_SNIPPET_CHARS):
+    """Compact references to the retrieved chunks; the full text is fetched with get_chunk."""
+    citations = []
+    for doc in context:
+        text = " ".join(doc.page_content.split())
+        citations.append({
+            "id": doc.id,
+            "source": doc.metadata.get("source", ""),
+            "score": doc.metadata.get("score"),
+            "snippet": text if len(text) <= snippet_chars else text[:snippet_chars].rstrip() + "...",
+        })
+    return citations
+
+
+def get_chunk(chunk_id, input_department, root=FAISS_INDEX_PATH):
+    """Resolve a citation id to its Document, or None if unknown, expired or not permitted."""
+    parsed = parse_chunk_id(chunk_id)
+    if parsed is None:
+        return None
+    version = parsed[0]
+    path = current_index_path(root)
+    if version != os.path.basename(os.path.normpath(path)):
+        # Citations from the previous version resolve until it is pruned
+        path = os.path.join(root, version)
+        if not re.fullmatch(r"v\d+", version) or not os.path.isdir(path):
+            return None
+    doc = load_vector_store(path).get(chunk_id, input_department)
+    if doc is None or not is_permitted(doc.metadata, input_department):
+        return None
+    return doc
+
+
+def get_sample_questions():
+    """Return a sample question for each department based on available resources."""
+    return [
+        {"name": "Engineering", "question": "What is the main technology stack used in our backend services?"},
+        {"name": "Finance", "question": "Can you summarize the latest quarterly financial report?"},
+        {"name": "HR", "question": "What are the key benefits provided to employees?"},
+        {"name": "Marketing", "question": "Show me the highlights from the Q4 2024 marketing report."},
+        {"name": "General", "question": "How do I apply for maternity leave?"}
+    ]
 
 
 # Department configurations
@@ -202,10 +683,7 @@ dept_configs = {
 
 # Load user database
 def load_users():
-    if os.path.exists("users.json"):
-        with open("users.json", 'r') as f:
-            return json.load(f)
-    return {}
+    return get_backend().get_users()
 
 # Check authentication
 def check_auth():
@@ -232,6 +710,26 @@ def display_chat_message(role, content, timestamp=None):
     else:
         st.markdown(f"**Assistant:** {content}{ts}")
 
-def show_context_sources(context):
-    if context:
-        st.info(f"Sources & Context: {context}")
\ No newline at end of file
+def show_context_sources(citations, input_department, key):
+    """Collapsed list of the cited sources; chunk text is only loaded when asked for."""
+    if not citations:
+        return
+    with st.expander(f"Sources ({len(citations)})"):
+        for citation in citations:
+            score = f" · score {citation['score']:.2f}" if citation.get("score") is not None else ""
+            st.markdown(f"**{os.path.basename(citation['source'])}**{score}")
+            st.caption(citation["snippet"])
+        if st.toggle("Show full text", key=f"sources-{key}"):
+            for citation in citations:
+                text = fetch_chunk_text(citation["id"], input_department) if citation.get("id") else None
+                st.markdown(f"**{citation['source']}**")
+                st.text(text if text is not None else "This chunk is no longer in the index.")
+
+
+def fetch_chunk_text(chunk_id, input_department):
+    if CHATBOT_API_URL:
+        # The API checks the department from the session's token
+        chunk = get_api_client().chunk(st.session_state.get("api_token"), chunk_id)
+        return chunk["text"] if chunk else None
+    doc = get_chunk(chunk_id, input_department)
+    return doc.page_content if doc is not None else None
\ No newline at end of file
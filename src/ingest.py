@@ -0,0 +1,147 @@
+"""Streaming index build: load -> tag department -> split -> embed in batches -> write.
+
+Documents flow through as generators and each shard's vectors and chunk text
+are appended to its files on disk batch by batch, so memory holds at most one
+source document, its chunks and one pending embedding batch per shard, however
+large the corpus. The shard files are written in the layout publish_index
+expects (index.faiss + chunks.sqlite per shard directory).
+"""
+import os
+import struct
+
+import faiss
+import numpy as np
+
+from src.dedup import DEDUP_ENABLED, NearDuplicateIndex, merge_duplicate
+from src.docstore import CHUNK_STORE_FILE, ChunkStoreWriter
+from src.shards import DATA_PATH, shard_for_source
+
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "100"))
+
+
+class FlatIndexWriter:
+    """Writes an IndexFlatL2 file by appending vectors, without holding them in memory.
+
+    The header and length fields come from faiss' own serialization of an empty
+    index, so the file is exactly what faiss.write_index would produce.
+    """
+
+    def __init__(self, path, dimension):
+        self.path = path
+        self.dimension = dimension
+        self.ntotal = 0
+        empty = faiss.serialize_index(faiss.IndexFlatL2(dimension)).tobytes()
+        # Layout: fourcc, d (int32), ntotal (int64), ..., then the vector data
+        # as a length (uint64, in floats) followed by the floats themselves
+        self._ntotal_offset = 8
+        self._length_offset = len(empty) - 8
+        if empty[self._ntotal_offset:self._ntotal_offset + 8] != bytes(8) or empty[self._length_offset:] != bytes(8):
+            raise RuntimeError(f"Unexpected IndexFlatL2 layout in faiss {faiss.__version__}")
+        self._file = open(f"{path}.tmp", "wb")
+        self._file.write(empty)
+
+    def add(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got shape {vectors.shape}")
+        self._file.write(vectors.tobytes())
+        self.ntotal += len(vectors)
+
+    def close(self):
+        self._file.seek(self._ntotal_offset)
+        self._file.write(struct.pack("<q", self.ntotal))
+        self._file.seek(self._length_offset)
+        self._file.write(struct.pack("<Q", self.ntotal * self.dimension))
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class ShardBuilder:
+    """Embeds one shard's chunks in batches and appends them to its files.
+
+    With dedup, near-duplicates of an earlier chunk are not embedded; their
+    source and departments are merged into the kept chunk instead. A chunk
+    added with its vector (carried over from a published shard) is not embedded
+    again.
+    """
+
+    def __init__(self, path, embeddings, batch_size=EMBED_BATCH_SIZE, dedup=DEDUP_ENABLED):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_vectors = []  # a vector, or None for chunks still to embed
+        self.index = None
+        self.chunks = ChunkStoreWriter(os.path.join(path, CHUNK_STORE_FILE))
+        self.duplicates = NearDuplicateIndex() if dedup else None
+        self.kept = 0
+        self.collapsed = 0
+        # Merged metadata of kept chunks that were already written, by row
+        self.merged = {}
+
+    def add(self, chunk, vector=None):
+        if self.duplicates is not None:
+            row = self.duplicates.find_or_add(chunk.page_content, self.kept)
+            if row is not None:
+                self._merge(row, chunk)
+                return
+        self.pending.append(chunk)
+        self.pending_vectors.append(vector)
+        self.kept += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _merge(self, row, duplicate):
+        self.collapsed += 1
+        written = self.kept - len(self.pending)
+        if row >= written:
+            merge_duplicate(self.pending[row - written].metadata, duplicate.metadata)
+        else:
+            merge_duplicate(self.merged.setdefault(row, dict(self.chunks.metadata_of(row))), duplicate.metadata)
+
+    def flush(self):
+        if not self.pending:
+            return
+        missing = [i for i, vector in enumerate(self.pending_vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([self.pending[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                self.pending_vectors[i] = vector
+        vectors = np.array(self.pending_vectors, dtype="float32")
+        if self.index is None:
+            self.index = FlatIndexWriter(os.path.join(self.path, "index.faiss"), vectors.shape[1])
+        self.index.add(vectors)
+        self.chunks.add(self.pending)
+        self.pending = []
+        self.pending_vectors = []
+
+    def close(self):
+        self.flush()
+        for row, metadata in self.merged.items():
+            self.chunks.update_metadata(row, metadata)
+        self.index.close()
+        self.chunks.close()
+        if self.duplicates is not None:
+            self.duplicates.close()
+        return self.index.ntotal
+
+
+def build_shards(documents, text_splitter, embeddings, path, batch_size=EMBED_BATCH_SIZE, data_path=DATA_PATH):
+    """Stream documents (from data_path) into per-shard index files under path.
+
+    Returns ({shard: (vectors written, duplicates collapsed)}, set of the sources seen).
+    """
+    builders = {}
+    sources = set()
+    for document in documents:
+        # Split one source document at a time instead of the whole corpus
+        for chunk in text_splitter.split_documents([document]):
+            source = chunk.metadata.get("source", "")
+            sources.add(source)
+            shard = shard_for_source(source, data_path)
+            if shard not in builders:
+                builders[shard] = ShardBuilder(os.path.join(path, shard), embeddings, batch_size)
+            builders[shard].add(chunk)
+    return {shard: (builder.close(), builder.collapsed) for shard, builder in builders.items()}, sources
@@ -0,0 +1,95 @@
+"""Format-specific, parallel document loading for ingestion.
+
+Markdown, text and CSV files are parsed natively; anything else goes through
+the generic unstructured loader that DirectoryLoader used for every file.
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+
+def load_text(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [Document(page_content=f.read(), metadata={"source": path})]
+
+
+def load_csv(path):
+    # One document per row, rendered as "column: value" lines
+    docs = []
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        for row_number, row in enumerate(csv.DictReader(f)):
+            content = "\n".join(f"{key}: {value}" for key, value in row.items() if key)
+            docs.append(Document(page_content=content, metadata={"source": path, "row": row_number}))
+    return docs
+
+
+def load_unstructured(path):
+    from langchain_community.document_loaders import UnstructuredFileLoader
+
+    return UnstructuredFileLoader(path).load()
+
+
+LOADERS = {
+    ".md": load_text,
+    ".markdown": load_text,
+    ".txt": load_text,
+    ".csv": load_csv,
+}
+
+
+def load_file(path):
+    loader = LOADERS.get(os.path.splitext(path)[1].lower(), load_unstructured)
+    return loader(path)
+
+
+def load_files(paths):
+    docs = []
+    for path in paths:
+        docs.extend(load_file(path))
+    return docs
+
+
+def iter_files(path):
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                yield os.path.join(root, name)
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_documents(path, workers=None, batch_size=16, max_pending=None):
+    """Yield the documents under path, parsing files in a process pool.
+
+    Files are sent to the workers in batches to amortise IPC. Results come back
+    in file order and at most max_pending batches are in flight, so memory stays
+    bounded however large the corpus is.
+    """
+    files = iter_files(path)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for file_path in files:
+            yield from load_file(file_path)
+        return
+
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch in iter_batches(files, batch_size):
+            pending.append(pool.submit(load_files, batch))
+            if len(pending) >= max_pending:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
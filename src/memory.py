@@ -0,0 +1,75 @@
+import os
+import re
+
+from src.rerank import estimate_tokens
+
+
+# Upper bound on the tokens of conversation context carried between turns
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "400"))
+# Stored answers are clipped; the full text stays in the chat history
+MEMORY_ANSWER_CHARS = 400
+
+# Cues that a message depends on earlier turns ("and for Q3?", "what about it")
+FOLLOW_UP_CUES = re.compile(
+    r"^(and|also|what about|how about|same|then|so)\b|\b(it|its|they|them|their|that|those|this|these|he|she|there|above|previous|same)\b",
+    re.IGNORECASE,
+)
+
+
+def needs_condensing(question):
+    """Short or referential questions are rewritten using the conversation so far."""
+    return len(question.split()) <= 6 or bool(FOLLOW_UP_CUES.search(question))
+
+
+class ConversationMemory:
+    """Rolling summary plus the most recent turns, kept within a token budget.
+
+    Older turns are folded into the summary by a summarize(summary, transcript)
+    callable, so the memory never grows past MEMORY_TOKEN_BUDGET tokens.
+    """
+
+    def __init__(self, summary="", turns=None, token_budget=MEMORY_TOKEN_BUDGET):
+        self.summary = summary
+        self.turns = list(turns or [])
+        self.token_budget = token_budget
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(summary=data.get("summary", ""), turns=data.get("turns", []))
+
+    def to_dict(self):
+        return {"summary": self.summary, "turns": self.turns}
+
+    def is_empty(self):
+        return not self.summary and not self.turns
+
+    @staticmethod
+    def _render_turns(turns):
+        return "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+
+    def render(self):
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        if self.turns:
+            parts.append(self._render_turns(self.turns))
+        return "\n".join(parts)
+
+    def token_count(self):
+        return estimate_tokens(self.render()) if not self.is_empty() else 0
+
+    def add_turn(self, question, answer, summarize=None):
+        self.turns.append({"question": question, "answer": answer[:MEMORY_ANSWER_CHARS]})
+
+        # Fold the oldest turns into the summary until we are back under budget
+        folded = []
+        while self.token_count() > self.token_budget and len(self.turns) > 1:
+            folded.append(self.turns.pop(0))
+        if folded and summarize is not None:
+            self.summary = summarize(self.summary, self._render_turns(folded))
+
+        # The summary itself must fit in what is left of the budget; drop its oldest part
+        while self.summary and self.token_count() > self.token_budget:
+            excess_chars = (self.token_count() - self.token_budget) * 4
+            self.summary = self.summary[excess_chars:].lstrip()
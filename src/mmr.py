@@ -0,0 +1,58 @@
+"""Maximal marginal relevance over a department-masked candidate matrix.
+
+LangChain's MMR recomputes the similarity of every candidate to the whole
+selected set on each step and runs over candidates before any access check, so
+part of its diversity budget goes to chunks the department then drops. Here the
+candidates a department may not read are masked out first, the candidate
+similarity matrix is computed once, and each step is a single vectorised
+update of every candidate's maximum similarity to the selection.
+"""
+import os
+
+import numpy as np
+
+from src.rerank import RERANK_FETCH_K
+
+
+MMR_ENABLED = os.environ.get("MMR_ENABLED", "0") == "1"
+# Permitted candidates MMR chooses from, and relevance (1) against diversity (0)
+MMR_FETCH_K = int(os.environ.get("MMR_FETCH_K", str(RERANK_FETCH_K)))
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.5"))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(query, candidates, k, lambda_mult=MMR_LAMBDA, mask=None):
+    """Indices of up to k rows of candidates, in MMR order (cosine similarity).
+
+    mask is an optional boolean array; rows where it is False are never chosen.
+    """
+    candidates = np.asarray(candidates, dtype="float32")
+    if candidates.ndim != 2 or not len(candidates):
+        return []
+    allowed = np.ones(len(candidates), dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+    k = min(k, int(allowed.sum()))
+    if k <= 0:
+        return []
+
+    unit = _normalize(candidates)
+    relevance = unit @ _normalize(np.asarray(query, dtype="float32"))
+    similarity = unit @ unit.T
+
+    selected = []
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = np.full(len(candidates), -np.inf, dtype="float32")
+    for _ in range(k):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~allowed] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        allowed[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
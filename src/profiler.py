@@ -0,0 +1,197 @@
+"""Low-overhead sampling profiler for live API workers.
+
+A background thread snapshots the Python stacks of the worker's threads
+(sys._current_frames) every few milliseconds and counts identical stacks. The
+result is in the "collapsed stack" format read by flamegraph.pl, speedscope and
+inferno: one line per distinct stack, frames root first, then the sample count.
+
+    main (uvicorn/main.py:1);run (asyncio/runners.py:86);... 42
+
+Threads that are only waiting (on a lock, queue, socket or the event loop
+selector) are left out by default, so the profile shows where CPU goes.
+"""
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+# Per-request profiles kept for GET /admin/profiles/{id}
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+# (file name, function) of leaf frames that mean the thread is blocked, not busy
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("thread.py", "_worker"),
+}
+
+
+# Thread ids working for the request being profiled; set by the API middleware and
+# seen by the threads that inherit its context (run_in_threadpool, Deadline workers)
+profiled_threads = contextvars.ContextVar("profiled_threads", default=None)
+
+
+@contextmanager
+def tag_thread(threads=None):
+    """While in the block, count this thread as working for the profiled request, if any.
+
+    threads defaults to profiled_threads of the current context; pass it for
+    threads that do not inherit the context (e.g. ThreadPoolExecutor workers).
+    """
+    threads = threads if threads is not None else profiled_threads.get()
+    if threads is None:
+        yield
+        return
+    ident = threading.get_ident()
+    threads.add(ident)
+    try:
+        yield
+    finally:
+        threads.discard(ident)
+
+
+def carry_tag(function):
+    """function, tagged for the request profiled in the calling context wherever it later runs.
+
+    For work handed to executors, whose threads do not inherit the context.
+    """
+    threads = profiled_threads.get()
+    if threads is None:
+        return function
+
+    def run(*args, **kwargs):
+        with tag_thread(threads):
+            return function(*args, **kwargs)
+    return run
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename
+    # Keep the last two path components: enough to tell modules apart
+    short = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Samples thread stacks until stopped; use as a context manager or start()/stop().
+
+    thread_ids limits sampling to those threads. A set is read at every sample,
+    so threads can be added and removed while the profiler runs (see tag_thread).
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None, include_idle=False, exclude_ids=()):
+        self.interval = interval
+        self.thread_ids = thread_ids if thread_ids is None or isinstance(thread_ids, set) else set(thread_ids)
+        self.exclude_ids = set(exclude_ids)
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or thread_id in self.exclude_ids or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            if not self.include_idle and _is_idle(frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def collapsed(self):
+        """The profile in collapsed-stack format, heaviest stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_for(seconds, interval=0.005, include_idle=False):
+    """Sample every thread of this process for `seconds`; blocks the calling thread."""
+    # The calling thread only sleeps, so leave it out
+    profiler = SamplingProfiler(interval, include_idle=include_idle, exclude_ids=[threading.get_ident()])
+    with profiler:
+        time.sleep(min(seconds, PROFILE_MAX_SECONDS))
+    return profiler
+
+
+class ProfileStore:
+    """The most recent per-request profiles, as files shared by the workers of a host."""
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def _path(self, profile_id):
+        return os.path.join(self.directory, f"{profile_id}.collapsed")
+
+    def add(self, collapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._count += 1
+            profile_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._count}"
+        with open(self._path(profile_id), "w") as f:
+            f.write(collapsed)
+
+        # Ids start with a timestamp, so name order is age order
+        for name in sorted(os.listdir(self.directory))[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # pruned by another worker
+        return profile_id
+
+    def get(self, profile_id):
+        if not re.fullmatch(r"[\w-]+", profile_id):
+            return None
+        try:
+            with open(self._path(profile_id)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+profile_store = ProfileStore()
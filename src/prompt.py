@@ -29,4 +29,32 @@ If the question is "What is the status of Project X?" and no such info is in the
 
 If the question is "Hi!" or "How are you?", respond in a friendly and relevant way, such as "Hello! How can I assist you with {department} department information today?"
 
-'''
\ No newline at end of file
+'''
+
+CONDENSE = '''Given the conversation below and a follow-up question, rewrite the follow-up question as a single standalone question that can be understood without the conversation. Keep names, periods, figures and the department context from the conversation when the follow-up refers to them. If the question is already standalone, return it unchanged.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:'''
+
+
+SUMMARIZE = '''Progressively summarize the conversation between an employee and the {department} department assistant. Add the new lines to the existing summary and return a new summary of at most {max_words} words. Keep the topics, entities, periods and figures that later questions may refer to; drop greetings and filler.
+
+Existing summary:
+{summary}
+
+New lines:
+{transcript}
+
+New summary:'''
+
+
+CHUNK_SUMMARY = '''Summarize the following excerpt from the document "{source}" in one sentence of at most {max_words} words. Keep the names, periods and figures a reader would search for; do not add anything that is not in the excerpt.
+
+Excerpt:
+{text}
+
+Summary:'''
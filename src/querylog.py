@@ -0,0 +1,116 @@
+"""Opt-in query log: one JSON line per answered question, written off the request path.
+
+Set QUERY_LOG_PATH to enable it (``{pid}`` in the path gives each worker its
+own file). Every entry records the department, a hash of the question (and
+its text unless QUERY_LOG_TEXT=0), the intent if it was small talk, the chunk
+ids sent to the LLM and per-stage timings in milliseconds. Replay a log against
+another index or configuration with research/replay_queries.py.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH")
+QUERY_LOG_TEXT = os.environ.get("QUERY_LOG_TEXT", "1") == "1"
+# Entries waiting to be written; when full, new entries are dropped rather than
+# slowing requests down
+QUERY_LOG_QUEUE_SIZE = int(os.environ.get("QUERY_LOG_QUEUE_SIZE", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+def question_hash(question):
+    return hashlib.sha1(" ".join(question.lower().split()).encode()).hexdigest()[:16]
+
+
+class StageTimer:
+    """Collects wall-clock milliseconds per named stage of a request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        # Set when the LLM failed or its breaker was open, so the answer quotes the context
+        self.degraded = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+class QueryLog:
+    """Appends entries to a JSONL file from a background thread."""
+
+    def __init__(self, path, include_text=QUERY_LOG_TEXT, queue_size=QUERY_LOG_QUEUE_SIZE):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.include_text = include_text
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def record(self, department, question, chunk_ids, timer, intent=None, **extra):
+        entry = {
+            "ts": time.time(),
+            "department": department,
+            "question_hash": question_hash(question),
+            "intent": intent,
+            "chunk_ids": chunk_ids,
+            "timings_ms": {name: round(ms, 3) for name, ms in timer.timings.items()},
+            "total_ms": round(timer.total_ms(), 3),
+        }
+        if self.include_text:
+            entry["question"] = question
+        entry.update(extra)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", buffering=1) as f:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    return
+                try:
+                    f.write(json.dumps(entry) + "\n")
+                except (TypeError, ValueError):
+                    logger.exception("Could not write query log entry")
+
+    def close(self):
+        """Write out queued entries and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+@lru_cache(maxsize=None)
+def get_query_log():
+    """The process-wide query log, or None when QUERY_LOG_PATH is not set."""
+    return QueryLog(QUERY_LOG_PATH) if QUERY_LOG_PATH else None
+
+
+def read_query_log(*paths):
+    """Entries from one or more log files, oldest first."""
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
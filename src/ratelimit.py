@@ -0,0 +1,173 @@
+"""Token-bucket rate limiting for the chat API, per user and per department.
+
+A quota is "<requests>/<seconds>": a bucket holds up to <requests> tokens and
+refills continuously at <requests>/<seconds> tokens per second, so short bursts
+are allowed while the long-run rate is capped. Every department gets
+RATE_LIMIT_USER per user and RATE_LIMIT_DEPARTMENT shared by all its users;
+RATE_LIMIT_OVERRIDES adjusts them per department, e.g.
+
+    RATE_LIMIT_OVERRIDES='{"c_level": {"user": "60/60"}, "marketing": {"department": "30/60"}}'
+
+Buckets live in process memory unless the state backend is Redis, in which case
+they are kept in Redis so every worker draws from the same buckets.
+"""
+import json
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+
+from src.state import InMemoryRedis, RedisBackend, get_backend
+
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_USER = os.environ.get("RATE_LIMIT_USER", "20/60")
+RATE_LIMIT_DEPARTMENT = os.environ.get("RATE_LIMIT_DEPARTMENT", "120/60")
+RATE_LIMIT_OVERRIDES = json.loads(os.environ.get("RATE_LIMIT_OVERRIDES", "{}"))
+
+
+class Quota:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def rate(self):
+        """Tokens refilled per second."""
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, spec):
+        requests, _, seconds = spec.partition("/")
+        return cls(int(requests), float(seconds or 60))
+
+
+def quotas_for(department):
+    """(per-user quota, department quota) for a department."""
+    override = RATE_LIMIT_OVERRIDES.get(department, {})
+    return (
+        Quota.parse(override.get("user", RATE_LIMIT_USER)),
+        Quota.parse(override.get("department", RATE_LIMIT_DEPARTMENT)),
+    )
+
+
+class Decision:
+    """Outcome of taking a token: whether it was allowed and the bucket state."""
+
+    def __init__(self, allowed, quota, tokens):
+        self.allowed = allowed
+        self.limit = quota.capacity
+        self.remaining = int(tokens)
+        # Seconds until the next token (retry) and until the bucket is full (reset)
+        self.retry_after = 0 if allowed else max(1, math.ceil((1 - tokens) / quota.rate))
+        self.reset = math.ceil((quota.capacity - tokens) / quota.rate)
+
+
+class LocalBuckets:
+    """Buckets in process memory; each worker enforces its own share."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, *buckets):
+        """Take a token from every (key, quota) bucket, or from none if any is empty.
+
+        Returns one Decision per bucket; a bucket that had a token is reported
+        as allowed even when another bucket denied the request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, quota in buckets:
+                tokens, updated = self._buckets.get(key, (quota.capacity, now))
+                levels.append(min(quota.capacity, tokens + (now - updated) * quota.rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            for (key, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens, now)
+        return [Decision(allowed or tokens >= 1, quota, tokens)
+                for (_, quota), tokens in zip(buckets, levels)]
+
+
+# Refill every bucket, then take a token from all of them or none, atomically on
+# the server and using the server clock so that all workers agree on elapsed
+# time. ARGV holds capacity, rate for each key. Returns {allowed, tokens as a
+# string for each key}.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    if levels[i] < 1 then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    if allowed == 1 then
+        levels[i] = levels[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(levels[i]), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    result[i + 1] = tostring(levels[i])
+end
+return result
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every worker and node through Redis."""
+
+    def __init__(self, client, prefix="chatbot"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, *buckets):
+        """Like LocalBuckets.take, in one round trip."""
+        args = [value for _, quota in buckets for value in (quota.capacity, quota.rate)]
+        allowed, *levels = self._script(keys=[f"{self.prefix}:ratelimit:{key}" for key, _ in buckets], args=args)
+        return [Decision(bool(allowed) or float(tokens) >= 1, quota, float(tokens))
+                for (_, quota), tokens in zip(buckets, levels)]
+
+
+class RateLimiter:
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    def check(self, username, department):
+        """Take a token from both the user's and the department's bucket.
+
+        Both are checked before either is charged, so a request denied by one
+        bucket costs nothing from the other. Returns the Decision that denied
+        the request, or else the one with the fewest tokens left (the one worth
+        reporting in headers).
+        """
+        user_quota, department_quota = quotas_for(department)
+        user, shared = self.buckets.take((f"user:{username}", user_quota), (f"department:{department}", department_quota))
+        # A user over their own quota is reported first: that is what they can fix
+        for decision in (user, shared):
+            if not decision.allowed:
+                return decision
+        return min(user, shared, key=lambda decision: decision.remaining)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    """Limiter using the same store as the state backend (Redis if configured)."""
+    backend = get_backend()
+    if isinstance(backend, RedisBackend) and not isinstance(backend.client, InMemoryRedis):
+        return RateLimiter(RedisBuckets(backend.client, backend.prefix))
+    return RateLimiter(LocalBuckets())
@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+
+
+# Candidates fetched cheaply from the vector index before reranking
+RERANK_FETCH_K = int(os.environ.get("RERANK_FETCH_K", "20"))
+# Bounds on how many chunks are sent to the LLM
+RERANK_MIN_K = int(os.environ.get("RERANK_MIN_K", "1"))
+RERANK_MAX_K = int(os.environ.get("RERANK_MAX_K", "7"))
+# Weight of the vector score against term overlap in the combined score
+RERANK_ALPHA = float(os.environ.get("RERANK_ALPHA", "0.7"))
+# Cut the list where the score drops by more than this between neighbours...
+RERANK_MAX_GAP = float(os.environ.get("RERANK_MAX_GAP", "0.15"))
+# ...or falls below this fraction of the best score
+RERANK_MIN_RATIO = float(os.environ.get("RERANK_MIN_RATIO", "0.5"))
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "by", "at", "from",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "what", "which", "who",
+    "whom", "how", "when", "where", "why", "can", "could", "should", "would", "will", "i",
+    "me", "my", "we", "our", "you", "your", "it", "its", "this", "that", "these", "those",
+    "about", "tell", "show", "give", "please", "there", "any", "all", "as", "into", "us",
+}
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def term_overlap(query_terms, text):
+    """Fraction of the (unique) query terms that occur in text."""
+    if not query_terms:
+        return 0.0
+    doc_terms = set(tokenize(text))
+    return len(query_terms & doc_terms) / len(query_terms)
+
+
+def rerank(question, docs_and_distances, alpha=RERANK_ALPHA):
+    """Rescore (Document, L2 distance) candidates; returns [(Document, score)] best first.
+
+    The vector part is the distance min-max normalised over the candidate set
+    (1.0 = closest candidate), the lexical part is query term overlap.
+    """
+    if not docs_and_distances:
+        return []
+    query_terms = set(tokenize(question))
+    distances = [float(distance) for _, distance in docs_and_distances]
+    nearest, farthest = min(distances), max(distances)
+    spread = farthest - nearest
+
+    scored = []
+    for (doc, _), distance in zip(docs_and_distances, distances):
+        vector_score = (farthest - distance) / spread if spread else 1.0
+        score = alpha * vector_score + (1 - alpha) * term_overlap(query_terms, doc.page_content)
+        scored.append((doc, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored
+
+
+def adaptive_cutoff(scored, min_k=RERANK_MIN_K, max_k=RERANK_MAX_K, max_gap=RERANK_MAX_GAP, min_ratio=RERANK_MIN_RATIO):
+    """Keep the leading hits up to the first large score gap (score-gap rule)."""
+    kept = scored[:max_k]
+    if not kept:
+        return kept
+    best = kept[0][1]
+    for i in range(min_k, len(kept)):
+        gap = kept[i - 1][1] - kept[i][1]
+        if gap > max_gap or kept[i][1] < best * min_ratio:
+            return kept[:i]
+    return kept
+
+
+class RerankStats:
+    """Tracks context tokens sent to the LLM against sending the top max_k candidates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.baseline_tokens = 0
+        self.context_tokens = 0
+        self.chunks_sent = 0
+
+    def record(self, baseline, kept):
+        with self._lock:
+            self.queries += 1
+            self.baseline_tokens += sum(estimate_tokens(doc.page_content) for doc, _ in baseline)
+            self.context_tokens += sum(estimate_tokens(doc.page_content) for doc, _ in kept)
+            self.chunks_sent += len(kept)
+
+    def snapshot(self):
+        with self._lock:
+            queries = self.queries or 1
+            return {
+                "queries": self.queries,
+                "avg_chunks_sent": self.chunks_sent / queries,
+                "avg_context_tokens": self.context_tokens / queries,
+                "avg_baseline_tokens": self.baseline_tokens / queries,
+                "avg_tokens_saved": (self.baseline_tokens - self.context_tokens) / queries,
+            }
+
+
+rerank_stats = RerankStats()
+
+
+def select_context(question, docs_and_distances):
+    """Rerank candidates and cut them off adaptively; returns [(Document, score)]."""
+    scored = rerank(question, docs_and_distances)
+    kept = adaptive_cutoff(scored)
+    rerank_stats.record(scored[:RERANK_MAX_K], kept)
+    return kept
@@ -0,0 +1,100 @@
+import re
+import threading
+
+
+# Intent patterns for messages that do not need the knowledge base.
+# Each pattern must match at the start of the normalised message.
+SMALL_TALK_PATTERNS = {
+    "greeting": r"(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening|day))",
+    "how_are_you": r"(how are you( doing)?|how is it going|hows it going|how are things|whats up|sup)",
+    "thanks": r"(thanks|thank you|thx|ty|cheers|much appreciated|appreciate it)",
+    "goodbye": r"(bye|goodbye|see you|see ya|good night|take care|thats all)",
+    "identity": r"(who are you|what are you|what can you do|what do you do)",
+    "acknowledgement": r"(ok|okay|cool|great|nice|awesome|got it|sounds good|perfect)",
+}
+
+# Words allowed around a small talk phrase without turning it into a real question
+FILLER_WORDS = {
+    "there", "again", "so", "much", "very", "a", "lot", "bot", "assistant", "chatbot",
+    "buddy", "friend", "team", "all", "everyone", "and", "you", "too", "today", "then",
+    "for", "the", "help", "your", "oh", "well", "yes", "yeah", "no", "please",
+}
+
+MAX_SMALL_TALK_WORDS = 8
+
+SMALL_TALK_RESPONSES = {
+    "greeting": "Hello! How can I assist you with {department} department information today?",
+    "how_are_you": "I'm doing well, thank you for asking! What can I help you with in the {department} department?",
+    "thanks": "You're welcome! Let me know if you have any other questions about the {department} department.",
+    "goodbye": "Goodbye! Feel free to come back any time you need help with {department} department information.",
+    "identity": "I'm your {department} department assistant. Ask me about policies, reports and documents available to your role.",
+    "acknowledgement": "Glad to help! Is there anything else you'd like to know about the {department} department?",
+}
+
+_compiled = {
+    intent: re.compile(rf"^{pattern}\b") for intent, pattern in SMALL_TALK_PATTERNS.items()
+}
+
+
+def normalize(text):
+    text = text.lower().replace("'", "")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def classify_intent(question):
+    """Return the small talk intent of a message, or None if it needs retrieval."""
+    text = normalize(question)
+    if not text or len(text.split()) > MAX_SMALL_TALK_WORDS:
+        return None
+
+    for intent, pattern in _compiled.items():
+        match = pattern.match(text)
+        if not match:
+            continue
+        rest = text[match.end():].split()
+        # Anything beyond filler words ("hi, what is the leave policy") is a real question
+        if all(word in FILLER_WORDS for word in rest):
+            return intent
+    return None
+
+
+def small_talk_response(intent, department):
+    name = (department or "general").replace("_", " ")
+    return SMALL_TALK_RESPONSES[intent].format(department=name)
+
+
+class RouterStats:
+    """Counts how many questions were answered without touching the vector store."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.small_talk = 0
+        self.by_intent = {}
+
+    def record(self, intent):
+        with self._lock:
+            self.total += 1
+            if intent:
+                self.small_talk += 1
+                self.by_intent[intent] = self.by_intent.get(intent, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "total": self.total,
+                "small_talk": self.small_talk,
+                "retrieval": self.total - self.small_talk,
+                "fraction_skipped": self.small_talk / self.total if self.total else 0.0,
+                "by_intent": dict(self.by_intent),
+            }
+
+
+router_stats = RouterStats()
+
+
+def route(question):
+    """Classify a question and record it in the routing statistics."""
+    intent = classify_intent(question)
+    router_stats.record(intent)
+    return intent
@@ -0,0 +1,279 @@
+"""Per-department index shards.
+
+Each published index version holds one FAISS index + chunk store per
+resources/data/<dept>/ directory (engineering, finance, hr, marketing, general).
+A department user searches only their shard and ``general``; ``c_level``
+queries fan out across every shard concurrently and the hits are merged.
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.deadline import DeadlineExceeded
+from src.docstore import SQLiteDocstore
+from src.mmr import MMR_LAMBDA, mmr_select
+from src.profiler import carry_tag
+
+
+# Root of the corpus: the first directory of a source below it is its department
+DATA_PATH = os.environ.get("DATA_PATH", "resources/data")
+GENERAL_SHARD = "general"
+# Name used for an unsharded (legacy) index that holds every department
+ALL_SHARD = "all"
+FULL_ACCESS_DEPARTMENTS = {"c_level"}
+
+# FAISS releases the GIL during search, so shard searches really run in parallel
+_search_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("SHARD_SEARCH_THREADS", "8")))
+
+
+def source_department(source, data_path=DATA_PATH):
+    """Department directory of a source: its first directory below data_path, or None.
+
+    For a source outside data_path, the directory after the last /data/ in its
+    path (a /data/ higher up, e.g. in the checkout's location, is ignored).
+    """
+    relative = os.path.relpath(os.path.abspath(source), os.path.abspath(data_path))
+    if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+        parts = relative.split(os.sep)
+        return parts[0] if len(parts) > 1 else None
+    matches = re.findall(r'/data/([^/]+)/', source)
+    return matches[-1] if matches else None
+
+
+def shard_for_source(source, data_path=DATA_PATH):
+    return source_department(source, data_path) or GENERAL_SHARD
+
+
+def shards_for_department(department, available):
+    """Shards a department may search, limited to those that exist."""
+    if ALL_SHARD in available:
+        return [ALL_SHARD]
+    if department in FULL_ACCESS_DEPARTMENTS:
+        return sorted(available)
+    return [shard for shard in (department, GENERAL_SHARD) if shard in available]
+
+
+def list_shards(path):
+    """Shard directories of an index version; the legacy layout is a single 'all' shard."""
+    if os.path.exists(os.path.join(path, "index.faiss")):
+        return {ALL_SHARD: path}
+    if not os.path.isdir(path):
+        return {}
+    return {
+        name: os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if os.path.exists(os.path.join(path, name, "index.faiss"))
+    }
+
+
+class SearchStats:
+    """Vectors actually searched per query against the size of the whole index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.searched = 0
+        self.total = 0
+
+    def record(self, searched, total):
+        with self._lock:
+            self.queries += 1
+            self.searched += searched
+            self.total += total
+
+    def snapshot(self):
+        with self._lock:
+            queries = self.queries or 1
+            return {
+                "queries": self.queries,
+                "avg_vectors_searched": self.searched / queries,
+                "avg_index_size": self.total / queries,
+                "fraction_searched": self.searched / self.total if self.total else 0.0,
+            }
+
+
+search_stats = SearchStats()
+
+
+def gather_shards(futures, deadline=None):
+    """Results of {shard: future}; with a deadline, shards that miss it are cut and left out."""
+    if deadline is None:
+        return [future.result() for future in futures.values()]
+    done, _ = wait(futures.values(), timeout=deadline.remaining())
+    for name, future in futures.items():
+        if future not in done:
+            deadline.cut(f"search:{name}")
+    if not done:
+        raise DeadlineExceeded()
+    return [future.result() for future in futures.values() if future in done]
+
+
+def parse_chunk_id(chunk_id):
+    """(version, shard, docstore id) from a chunk id, or None if it is malformed."""
+    parts = chunk_id.split(":", 2)
+    return tuple(parts) if len(parts) == 3 and all(parts) else None
+
+
+class ShardedIndex:
+    """A set of per-department FAISS stores searched as one index.
+
+    Hits carry a chunk id "<version>:<shard>:<docstore id>" that get() resolves
+    back to the full chunk, so clients can cite chunks without their text.
+    """
+
+    def __init__(self, shards, embeddings, version="", paths=None):
+        self.shards = shards
+        self.embeddings = embeddings
+        self.version = version
+        # Shard directories, where precomputed summaries (src/summaries.py) may appear later
+        self.paths = paths or {}
+        self._summary_stores = {}
+
+    @property
+    def ntotal(self):
+        return sum(store.index.ntotal for store in self.shards.values())
+
+    def _tag(self, name, doc):
+        # A copy, so per-query fields never leak into a shared in-memory docstore
+        chunk_id = f"{self.version}:{name}:{doc.id}" if doc.id is not None else None
+        return Document(id=chunk_id, page_content=doc.page_content, metadata=dict(doc.metadata))
+
+    def _search_shard(self, name, embedding, k, fetch_k, filter):
+        store = self.shards[name]
+        # Department shards are access-controlled by construction; only the
+        # legacy all-in-one shard needs the metadata filter inside the search
+        if name == ALL_SHARD:
+            hits = store.similarity_search_with_score_by_vector(embedding, k=k, fetch_k=fetch_k, filter=filter)
+        else:
+            hits = store.similarity_search_with_score_by_vector(embedding, k=k)
+        return [(self._tag(name, doc), score) for doc, score in hits]
+
+    def _shard_candidates(self, name, embedding, fetch_k):
+        """[(Document, L2 distance)] and the vectors of a shard's fetch_k nearest chunks.
+
+        From a chunk store the candidates come in one query and without their
+        text; _load_text fills it in for the few that are kept.
+        """
+        store = self.shards[name]
+        distances, ids = store.index.search(np.asarray([embedding], dtype="float32"), fetch_k)
+        found = ids[0] >= 0
+        ids, distances = ids[0][found], distances[0][found]
+        if isinstance(store.docstore, SQLiteDocstore):
+            docs = store.docstore.store.get_many(ids, with_text=False)
+        else:
+            docs = [store.docstore.search(store.index_to_docstore_id[int(i)]) for i in ids]
+        kept = [i for i, doc in enumerate(docs) if isinstance(doc, Document)]
+        if not kept:
+            return [], np.empty((0, store.index.d), dtype="float32")
+        vectors = store.index.reconstruct_batch(ids[kept])
+        return [(self._tag(name, docs[i]), float(distances[i])) for i in kept], vectors
+
+    def _load_text(self, hits):
+        """Fill in the text of hits from chunk stores, one query per shard."""
+        rows = {}
+        for doc, _ in hits:
+            _, name, row = parse_chunk_id(doc.id)
+            if isinstance(self.shards[name].docstore, SQLiteDocstore):
+                rows.setdefault(name, []).append(row)
+        texts = {}
+        for name, shard_rows in rows.items():
+            for doc in self.shards[name].docstore.store.get_many(shard_rows):
+                if doc is not None:
+                    texts[f"{self.version}:{name}:{doc.id}"] = doc.page_content
+        for doc, _ in hits:
+            doc.page_content = texts.get(doc.id, doc.page_content)
+        return hits
+
+    def get(self, chunk_id, department):
+        """The chunk behind a chunk id if this department may search its shard, else None."""
+        parsed = parse_chunk_id(chunk_id)
+        if parsed is None:
+            return None
+        version, name, doc_id = parsed
+        if version != self.version or name not in shards_for_department(department, self.shards):
+            return None
+        doc = self.shards[name].docstore.search(doc_id)
+        # Docstores answer a miss with an error string rather than raising
+        return self._tag(name, doc) if isinstance(doc, Document) else None
+
+    def _summary_store(self, name):
+        # Summaries may be written after the index was loaded, so keep looking until found
+        if name not in self._summary_stores:
+            from src.summaries import SUMMARY_FILE, SummaryStore
+
+            path = os.path.join(self.paths.get(name, ""), SUMMARY_FILE)
+            if not os.path.exists(path):
+                return None
+            self._summary_stores[name] = SummaryStore(path)
+        return self._summary_stores[name]
+
+    def summaries_for(self, docs):
+        """{chunk id: (chunk summary, section key, section summary)} for the docs that have summaries."""
+        rows = {}
+        for doc in docs:
+            parsed = parse_chunk_id(doc.id or "")
+            if parsed is not None and parsed[0] == self.version and parsed[2].isdigit():
+                rows.setdefault(parsed[1], []).append(int(parsed[2]))
+        found = {}
+        for name, shard_rows in rows.items():
+            store = self._summary_store(name)
+            if store is None:
+                continue
+            for row, (summary, section_id, section_summary) in store.get_many(shard_rows).items():
+                found[f"{self.version}:{name}:{row}"] = (summary, (name, section_id), section_summary)
+        return found
+
+    def search(self, question, department, k=4, fetch_k=20, filter=None, deadline=None):
+        """[(Document, L2 distance)] of the k nearest chunks the department may read.
+
+        With a Deadline (src/deadline.py), shards that have not answered when it
+        passes are left out of a fan-out search.
+        """
+        names = shards_for_department(department, self.shards)
+        if not names:
+            return []
+        embedding = self.embeddings.embed_query(question)
+        search_stats.record(sum(self.shards[name].index.ntotal for name in names), self.ntotal)
+
+        if len(names) == 1:
+            results = self._search_shard(names[0], embedding, k, fetch_k, filter)
+        else:
+            futures = {name: _search_pool.submit(carry_tag(self._search_shard), name, embedding, k, fetch_k, filter) for name in names}
+            results = [hit for hits in gather_shards(futures, deadline) for hit in hits]
+
+        if filter is not None:
+            # Defence in depth: the department check still applies to every hit
+            results = [(doc, score) for doc, score in results if filter(doc.metadata)]
+        results.sort(key=lambda hit: float(hit[1]))
+        return results[:k]
+
+    def max_marginal_relevance_search(self, question, department, k=4, fetch_k=20, lambda_mult=MMR_LAMBDA, filter=None,
+                                      deadline=None):
+        """[(Document, L2 distance)] of k diverse chunks, chosen by MMR among the
+        fetch_k nearest chunks the department may read (see src/mmr.py)."""
+        names = shards_for_department(department, self.shards)
+        if not names:
+            return []
+        embedding = self.embeddings.embed_query(question)
+        search_stats.record(sum(self.shards[name].index.ntotal for name in names), self.ntotal)
+
+        # The legacy all-in-one shard holds other departments' chunks too, so
+        # fetch more there to still have fetch_k candidates once they are masked
+        per_shard = {name: fetch_k * 4 if name == ALL_SHARD and filter is not None else fetch_k for name in names}
+        futures = {name: _search_pool.submit(carry_tag(self._shard_candidates), name, embedding, per_shard[name]) for name in names}
+        parts = gather_shards(futures, deadline)
+        hits = [hit for part_hits, _ in parts for hit in part_hits]
+        if not hits:
+            return []
+        vectors = np.concatenate([part_vectors for _, part_vectors in parts])
+
+        permitted = np.array([filter is None or filter(doc.metadata) for doc, _ in hits], dtype=bool)
+        # Keep the fetch_k nearest permitted candidates across shards
+        distances = np.array([distance for _, distance in hits], dtype="float32")
+        order = np.argsort(np.where(permitted, distances, np.inf), kind="stable")[:min(fetch_k, int(permitted.sum()))]
+        selected = mmr_select(embedding, vectors[order], k, lambda_mult)
+        return self._load_text([hits[order[i]] for i in selected])
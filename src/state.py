@@ -0,0 +1,372 @@
+import fnmatch
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "200"))
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+class StateBackend(ABC):
+    """Interface for the user, session and chat history state shared by API workers.
+
+    Implementations must be safe to use from several threads; the Redis backend
+    is also safe across processes and nodes.
+    """
+
+    @abstractmethod
+    def get_users(self):
+        ...
+
+    @abstractmethod
+    def get_user(self, username):
+        ...
+
+    @abstractmethod
+    def create_user(self, username, record):
+        """Store a new user. Returns (success, message) like UserManager."""
+
+    @abstractmethod
+    def update_user(self, username, fields):
+        ...
+
+    @abstractmethod
+    def get_history(self, username):
+        ...
+
+    @abstractmethod
+    def append_history(self, username, *messages):
+        ...
+
+    @abstractmethod
+    def clear_history(self, username):
+        ...
+
+    @abstractmethod
+    def get_session(self, username):
+        ...
+
+    @abstractmethod
+    def set_session(self, username, data):
+        ...
+
+
+class LocalBackend(StateBackend):
+    """Single-process backend: users in a JSON file, history and sessions in memory.
+
+    The user file is re-read whenever its mtime changes, so several workers on
+    one host see each other's registrations, but chat history is per process.
+    """
+
+    def __init__(self, db_file="users.json"):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self._users = {}
+        self._mtime = None
+        self._histories = {}
+        self._sessions = {}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.db_file)
+        except OSError:
+            return self._users
+        if mtime != self._mtime:
+            with open(self.db_file, 'r') as f:
+                self._users = json.load(f)
+            self._mtime = mtime
+        return self._users
+
+    def _save(self):
+        tmp_file = f"{self.db_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self._users, f, indent=2)
+        os.replace(tmp_file, self.db_file)
+        self._mtime = os.path.getmtime(self.db_file)
+
+    def get_users(self):
+        # Copies, so callers cannot change stored records without update_user
+        with self._lock:
+            return {username: dict(record) for username, record in self._load().items()}
+
+    def get_user(self, username):
+        with self._lock:
+            record = self._load().get(username)
+            return dict(record) if record is not None else None
+
+    def create_user(self, username, record):
+        with self._lock:
+            users = self._load()
+            if username in users:
+                return False, "Username already exists"
+            if any(user.get('email') == record.get('email') for user in users.values()):
+                return False, "Email already registered"
+            users[username] = dict(record)
+            self._save()
+        return True, "Registration successful"
+
+    def update_user(self, username, fields):
+        with self._lock:
+            users = self._load()
+            if username not in users:
+                return False
+            users[username].update(fields)
+            self._save()
+        return True
+
+    def get_history(self, username):
+        with self._lock:
+            return list(self._histories.get(username, []))
+
+    def append_history(self, username, *messages):
+        with self._lock:
+            history = self._histories.setdefault(username, [])
+            history.extend(messages)
+            del history[:-HISTORY_MAX_MESSAGES]
+
+    def clear_history(self, username):
+        with self._lock:
+            self._histories.pop(username, None)
+
+    def get_session(self, username):
+        with self._lock:
+            session = self._sessions.get(username)
+            if session is None or session[0] < time.time():
+                return {}
+            return dict(session[1])
+
+    def set_session(self, username, data):
+        with self._lock:
+            self._sessions[username] = (time.time() + SESSION_TTL_SECONDS, dict(data))
+
+
+class RedisBackend(StateBackend):
+    """Networked backend for multiple workers and nodes.
+
+    Works with any client exposing the redis-py API with decode_responses=True,
+    including InMemoryRedis below.
+    """
+
+    def __init__(self, client, prefix="chatbot"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ":".join((self.prefix,) + parts)
+
+    def get_users(self):
+        users = self.client.hgetall(self._key("users"))
+        return {username: json.loads(record) for username, record in users.items()}
+
+    def get_user(self, username):
+        record = self.client.hget(self._key("users"), username)
+        return json.loads(record) if record else None
+
+    def create_user(self, username, record):
+        email = record.get('email')
+        if self.client.hexists(self._key("users"), username):
+            return False, "Username already exists"
+        # Claim the email first so two workers cannot register it concurrently
+        if email and not self.client.hsetnx(self._key("emails"), email, username):
+            return False, "Email already registered"
+        if not self.client.hsetnx(self._key("users"), username, json.dumps(record)):
+            if email:
+                self.client.hdel(self._key("emails"), email)
+            return False, "Username already exists"
+        return True, "Registration successful"
+
+    def update_user(self, username, fields):
+        key = self._key("users")
+
+        # Read-modify-write under WATCH, retried if another worker changes the
+        # users hash in between, so concurrent updates cannot drop each other's fields
+        def apply(pipe):
+            record = pipe.hget(key, username)
+            if record is None:
+                return False
+            record = json.loads(record)
+            record.update(fields)
+            pipe.multi()
+            pipe.hset(key, username, json.dumps(record))
+            return True
+
+        return self.client.transaction(apply, key, value_from_callable=True)
+
+    def import_users(self, users):
+        """Seed the backend from a users.json style mapping, keeping existing entries."""
+        for username, record in users.items():
+            self.create_user(username, record)
+
+    def get_history(self, username):
+        return [json.loads(message) for message in self.client.lrange(self._key("history", username), 0, -1)]
+
+    def append_history(self, username, *messages):
+        key = self._key("history", username)
+        self.client.rpush(key, *(json.dumps(message, default=str) for message in messages))
+        self.client.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+
+    def clear_history(self, username):
+        self.client.delete(self._key("history", username))
+
+    def get_session(self, username):
+        data = self.client.get(self._key("session", username))
+        return json.loads(data) if data else {}
+
+    def set_session(self, username, data):
+        self.client.set(self._key("session", username), json.dumps(data, default=str), ex=SESSION_TTL_SECONDS)
+
+
+class InMemoryRedis:
+    """Local stand-in for a Redis server implementing the commands used here.
+
+    Behaves like redis.Redis(decode_responses=True) for a single process; use it
+    for tests and for running the Redis code path without a server.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data = {}
+        self._expiry = {}
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        # The lock makes func's reads and writes atomic, which is what WATCH/MULTI
+        # gives on a server; multi() is a no-op as commands run immediately
+        with self._lock:
+            result = func(self)
+        return result if value_from_callable else []
+
+    def multi(self):
+        pass
+
+    def _get(self, key, default=None):
+        expires_at = self._expiry.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+        return self._data.get(key, default)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._get(key) is not None:
+                return None
+            self._data[key] = str(value)
+            if ex is not None:
+                self._expiry[key] = time.time() + ex
+            else:
+                self._expiry.pop(key, None)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._get(key) is not None:
+                    removed += 1
+                self._data.pop(key, None)
+                self._expiry.pop(key, None)
+            return removed
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._expiry[key] = time.time() + seconds
+            return True
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            return [key for key in list(self._data) if self._get(key) is not None and fnmatch.fnmatchcase(key, pattern)]
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._get(key, {}).get(field)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._get(key, {}))
+
+    def hexists(self, key, field):
+        with self._lock:
+            return field in self._get(key, {})
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            hash_ = self._data.setdefault(key, self._get(key, {}))
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for name in items if name not in hash_)
+            hash_.update({name: str(val) for name, val in items.items()})
+            return added
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            hash_ = self._data.setdefault(key, self._get(key, {}))
+            if field in hash_:
+                return False
+            hash_[field] = str(value)
+            return True
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            hash_ = self._get(key, {})
+            return sum(1 for field in fields if hash_.pop(field, None) is not None)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            list_ = self._data.setdefault(key, self._get(key, []))
+            list_.extend(str(value) for value in values)
+            return len(list_)
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            list_ = self._get(key, [])
+            end = len(list_) if end == -1 else end + 1
+            return list_[start:end]
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            list_ = self._get(key)
+            if list_ is None:
+                return True
+            end = len(list_) if end == -1 else end + 1
+            self._data[key] = list_[start:end]
+            return True
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """Build the process-wide state backend from STATE_BACKEND / REDIS_URL.
+
+    STATE_BACKEND=local (default) keeps the users.json file, redis uses REDIS_URL,
+    and memory runs the Redis code path against InMemoryRedis.
+    """
+    kind = os.environ.get("STATE_BACKEND", "redis" if os.environ.get("REDIS_URL") else "local")
+    db_file = os.environ.get("USERS_DB_FILE", "users.json")
+
+    if kind == "local":
+        return LocalBackend(db_file)
+
+    if kind == "redis":
+        import redis  # optional dependency, only needed for the networked backend
+
+        client = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    elif kind == "memory":
+        client = InMemoryRedis()
+    else:
+        raise ValueError(f"Unknown STATE_BACKEND: {kind}")
+
+    backend = RedisBackend(client, prefix=os.environ.get("STATE_PREFIX", "chatbot"))
+    # Carry over accounts from users.json the first time a shared backend is used
+    if os.path.exists(db_file) and not backend.get_users():
+        with open(db_file, 'r') as f:
+            backend.import_users(json.load(f))
+    return backend
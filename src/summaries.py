@@ -0,0 +1,190 @@
+"""Precomputed chunk and section summaries used as a compact context tier.
+
+An offline step writes summaries.sqlite next to each shard's chunk store: one
+short summary per chunk, and one per section (a markdown heading of a source
+file, or the whole file when it has none). With CONTEXT_TIER=summary, answer()
+sends the top CONTEXT_EXPAND_K hits as full text and the rest as summaries,
+collapsing several hits from one section into its section summary.
+
+    python -m src.summaries                      # extractive, no API calls
+    python -m src.summaries --method llm         # one Gemini call per chunk and section
+
+Shards that already have summaries are skipped, so it can be re-run after every
+watcher update (which also runs it when CONTEXT_TIER=summary).
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+from collections import Counter
+
+from src.docstore import CHUNK_STORE_FILE, ChunkStore
+from src.rerank import tokenize
+
+
+SUMMARY_FILE = "summaries.sqlite"
+SUMMARY_METHOD = os.environ.get("SUMMARY_METHOD", "extractive")
+SUMMARY_MAX_CHARS = int(os.environ.get("SUMMARY_MAX_CHARS", "160"))
+
+SCHEMA = """
+CREATE TABLE sections (id INTEGER PRIMARY KEY, source TEXT NOT NULL, heading TEXT, summary TEXT NOT NULL);
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY,          -- row in index.faiss / chunks.sqlite
+    section_id INTEGER NOT NULL REFERENCES sections(id),
+    summary TEXT NOT NULL
+);
+"""
+
+HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*$", re.MULTILINE)
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+RECORD_FIELD = re.compile(r"^\w[\w ]*: ")
+
+
+def extractive_summary(text, max_chars=SUMMARY_MAX_CHARS):
+    """A short extract of text: its leading fields for a record (CSV row), else its most central sentence."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if lines and sum(bool(RECORD_FIELD.match(line)) for line in lines) > len(lines) / 2:
+        # "key: value" lines of a CSV row: the first fields identify it
+        summary = "; ".join(lines)
+    else:
+        text = MARKDOWN_LINK.sub(r"\1", text)
+        parts = [part.strip(" -*|#") for part in re.split(r"(?<=[.!?])\s+|\n+", text)]
+        sentences = [part for part in parts if len(tokenize(part)) >= 3]
+        if not sentences:
+            summary = " ".join(text.split())
+        else:
+            frequencies = Counter(tokenize(text))
+
+            def score(sentence):
+                terms = set(tokenize(sentence))
+                return sum(frequencies[term] for term in terms) / (len(terms) ** 0.5)
+
+            summary = " ".join(max(sentences, key=score).split())
+    return summary if len(summary) <= max_chars else summary[:max_chars].rsplit(" ", 1)[0] + "..."
+
+
+def llm_summarizer(max_chars=SUMMARY_MAX_CHARS):
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    from src.helper import get_llm
+    from src.prompt import CHUNK_SUMMARY
+
+    chain = PromptTemplate.from_template(CHUNK_SUMMARY) | get_llm() | StrOutputParser()
+
+    def summarize(text, source=""):
+        summary = " ".join(chain.invoke({"source": source, "text": text, "max_words": max_chars // 6}).split())
+        return summary[:max_chars]
+
+    return summarize
+
+
+def get_summarizer(method=SUMMARY_METHOD):
+    if method == "llm":
+        return llm_summarizer()
+    return lambda text, source="": extractive_summary(text)
+
+
+def summarize_shard(shard_path, summarize):
+    """Write summaries.sqlite for one shard; returns (chunks, sections) summarised."""
+    store = ChunkStore(os.path.join(shard_path, CHUNK_STORE_FILE))
+    path = os.path.join(shard_path, SUMMARY_FILE)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        sections = {}  # (source, heading) -> (id, [chunk summaries])
+        headings = {}  # source -> last heading seen
+        rows = []
+        for doc in store.iter_documents():
+            source = doc.metadata.get("source", "")
+            # A chunk belongs to the last heading before or at its start
+            found = HEADING.findall(doc.page_content)
+            first = HEADING.match(doc.page_content.lstrip())
+            heading = first.group(1) if first else headings.get(source)
+            if found:
+                headings[source] = found[-1]
+            key = (source, heading)
+            if key not in sections:
+                sections[key] = (len(sections), [])
+            summary = summarize(doc.page_content, source)
+            sections[key][1].append(summary)
+            rows.append((int(doc.id), sections[key][0], summary))
+            if len(rows) >= 1000:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", rows)
+                rows = []
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", rows)
+
+        for (source, heading), (section_id, summaries) in sections.items():
+            text = "\n".join(([heading] if heading else []) + summaries)
+            summary = summaries[0] if len(summaries) == 1 else summarize(text, source)
+            conn.execute("INSERT INTO sections VALUES (?, ?, ?, ?)", (section_id, source, heading, summary))
+        conn.commit()
+    finally:
+        conn.close()
+        store.close()
+    os.replace(tmp_path, path)
+    return len(store), len(sections)
+
+
+def summarize_index(root, method=SUMMARY_METHOD, force=False):
+    """Summarise every shard of the published index that has no summaries yet."""
+    from src.helper import current_index_path
+    from src.shards import list_shards
+
+    summarize = None
+    done = {}
+    for name, shard_path in list_shards(current_index_path(root)).items():
+        if not force and os.path.exists(os.path.join(shard_path, SUMMARY_FILE)):
+            continue
+        if not os.path.exists(os.path.join(shard_path, CHUNK_STORE_FILE)):
+            continue  # legacy pickled layout
+        summarize = summarize or get_summarizer(method)
+        done[name] = summarize_shard(shard_path, summarize)
+    return done
+
+
+class SummaryStore:
+    """Read-only, thread-safe access to a shard's summaries."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def get_many(self, rows):
+        """{row: (chunk summary, section id, section summary)} for the rows that have one."""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            results = self._conn.execute(
+                "SELECT chunks.id, chunks.summary, sections.id, sections.summary FROM chunks "
+                f"JOIN sections ON sections.id = chunks.section_id WHERE chunks.id IN ({placeholders})",
+                rows,
+            ).fetchall()
+        return {row: (summary, section_id, section_summary) for row, summary, section_id, section_summary in results}
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute chunk and section summaries for the published index.")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--method", choices=["extractive", "llm"], default=SUMMARY_METHOD)
+    parser.add_argument("--force", action="store_true", help="recompute shards that already have summaries")
+    args = parser.parse_args()
+    done = summarize_index(args.index, args.method, args.force)
+    for name, (chunks, sections) in sorted(done.items()):
+        print(f"{name:<14}{chunks:>6} chunks{sections:>6} sections")
+    if not done:
+        print("Every shard already has summaries.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
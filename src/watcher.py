@@ -0,0 +1,228 @@
+"""Continuous ingestion: watch resources/data and publish updated index versions.
+
+Only files whose content changed since the published version are loaded, split
+and embedded, and only their department shards are rebuilt; vectors for
+unchanged files are copied over from the current index. Run it next to the
+app with:
+
+    python -m src.watcher                     # watch until interrupted
+    python -m src.watcher --once              # sync once and exit
+    python -m src.watcher --rebuild-shard hr  # re-embed one shard and exit
+
+or set WATCH_DATA=1 to run it inside the FastAPI process.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from src.docstore import CHUNK_STORE_FILE, ChunkStore
+from src.helper import (
+    CONTEXT_TIER,
+    FAISS_INDEX_PATH,
+    create_and_store_vs,
+    current_index_path,
+    file_fingerprint,
+    get_embeddings,
+    get_text_splitter,
+    publish_index,
+    read_faiss_index,
+    read_manifest,
+    update_metadata_into_docs,
+)
+from src.ingest import ShardBuilder
+from src.loaders import iter_documents, iter_files, load_files
+from src.shards import ALL_SHARD, DATA_PATH, list_shards, shard_for_source
+from src.summaries import summarize_index
+
+
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get("WATCH_DEBOUNCE_SECONDS", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+def diff_sources(data_path, manifest):
+    """Compare the files on disk with a manifest; returns (fingerprints, changed, removed)."""
+    fingerprints = {path: file_fingerprint(path) for path in iter_files(data_path)}
+    changed = sorted(path for path, fingerprint in fingerprints.items() if manifest.get(path) != fingerprint)
+    removed = sorted(path for path in manifest if path not in fingerprints)
+    return fingerprints, changed, removed
+
+
+def rebuild_shard(old_path, stale, new_chunks, path):
+    """Build one shard in path from its unchanged rows in old_path plus new_chunks.
+
+    Unchanged rows keep their vectors and go through the ShardBuilder first, so
+    new chunks are deduplicated against them as in a full build, and only the
+    new chunks that are kept are embedded, in batches. Returns the number of
+    vectors written, or None if the shard is now empty.
+    """
+    old_index = store = None
+    keep_rows = []
+    if old_path is not None:
+        old_index = read_faiss_index(old_path, mmap=True)
+        store = ChunkStore(os.path.join(old_path, CHUNK_STORE_FILE))
+        keep_rows = store.rows_excluding_sources(stale)
+    try:
+        if not keep_rows and not new_chunks:
+            return None
+        builder = ShardBuilder(path, get_embeddings())
+        for start in range(0, len(keep_rows), 1000):
+            rows = keep_rows[start:start + 1000]
+            vectors = old_index.reconstruct_batch(np.array(rows, dtype="int64"))
+            for doc, vector in zip(store.get_many(rows), vectors):
+                builder.add(doc, vector)
+        for chunk in new_chunks:
+            builder.add(chunk)
+        return builder.close()
+    finally:
+        if store is not None:
+            store.close()
+
+
+def linked_sources(old_shards, affected, stale):
+    """Unchanged files that share a deduplicated chunk with a stale file.
+
+    Their content may only be stored as that chunk, which is dropped with the
+    stale file, so they are re-embedded from their own files as well.
+    """
+    linked = set()
+    for name in affected:
+        if name not in old_shards:
+            continue
+        store = ChunkStore(os.path.join(old_shards[name], CHUNK_STORE_FILE))
+        try:
+            linked |= store.linked_sources(stale)
+        finally:
+            store.close()
+    # Linked files missing from disk are already among the removed ones
+    return sorted(path for path in linked - set(stale) if os.path.exists(path))
+
+
+def sync_index(data_path=DATA_PATH, root=FAISS_INDEX_PATH, force_shards=()):
+    """Publish a new index version if data_path changed; returns (changed, removed).
+
+    Only the shards containing changed files are rebuilt; the others are carried
+    over unchanged. force_shards re-embeds every file of the named shards.
+    """
+    current = current_index_path(root)
+    manifest = read_manifest(current)
+    fingerprints, changed, removed = diff_sources(data_path, manifest)
+    changed = sorted(set(changed) | {path for path in fingerprints if shard_for_source(path, data_path) in force_shards})
+    if not changed and not removed:
+        return [], []
+
+    old_shards = list_shards(current)
+    if not manifest or ALL_SHARD in old_shards:
+        # Nothing to reuse (first run or unsharded layout), so build from scratch
+        logger.info("Building index from %s", data_path)
+        create_and_store_vs(update_metadata_into_docs(iter_documents(data_path), data_path), root, data_path=data_path)
+        summarize_if_enabled(root)
+        return changed, removed
+
+    stale = changed + removed
+    affected = {shard_for_source(path, data_path) for path in stale}
+    linked = linked_sources(old_shards, affected, stale)
+    logger.info("Updating shards %s: %d changed, %d removed, %d re-embedded with them",
+                sorted(affected), len(changed), len(removed), len(linked))
+
+    new_chunks = {}
+    for doc in get_text_splitter().split_documents(update_metadata_into_docs(load_files(changed + linked), data_path)):
+        new_chunks.setdefault(shard_for_source(doc.metadata.get("source", ""), data_path), []).append(doc)
+
+    reuse = {name: path for name, path in old_shards.items() if name not in affected}
+    # Rebuilt shards are written next to the versions and hard-linked in, as in a full build
+    staging = tempfile.mkdtemp(prefix=".build-", dir=root)
+    try:
+        for name in affected:
+            path = os.path.join(staging, name)
+            if rebuild_shard(old_shards.get(name), stale + linked, new_chunks.get(name, []), path) is not None:
+                reuse[name] = path
+        publish_index({}, fingerprints, root, reuse=reuse)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    summarize_if_enabled(root)
+    return changed, removed
+
+
+def summarize_if_enabled(root):
+    # Reused shards carry their summaries over; only rebuilt ones need new ones
+    if CONTEXT_TIER == "summary":
+        for name, (chunks, sections) in summarize_index(root).items():
+            logger.info("Summarised shard %s: %d chunks, %d sections", name, chunks, sections)
+
+
+class DebouncedSync:
+    """Runs sync_index once events have been quiet for `delay` seconds."""
+
+    def __init__(self, data_path=DATA_PATH, root=FAISS_INDEX_PATH, delay=WATCH_DEBOUNCE_SECONDS):
+        self.data_path = data_path
+        self.root = root
+        self.delay = delay
+        self._timer = None
+        self._timer_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def dispatch(self, event):
+        # watchdog handler entry point; any file event just (re)arms the timer
+        if event.is_directory:
+            return
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def run(self):
+        with self._sync_lock:
+            try:
+                changed, removed = sync_index(self.data_path, self.root)
+                if changed or removed:
+                    logger.info("Published %s", current_index_path(self.root))
+            except Exception:
+                logger.exception("Index sync failed")
+
+
+def start_watcher(data_path=DATA_PATH, root=FAISS_INDEX_PATH, delay=WATCH_DEBOUNCE_SECONDS):
+    """Sync once, then watch data_path in a background thread; returns the observer."""
+    from watchdog.observers import Observer
+
+    handler = DebouncedSync(data_path, root, delay)
+    handler.run()
+    observer = Observer()
+    observer.schedule(handler, data_path, recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the FAISS index in sync with the data directory.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--index", default=FAISS_INDEX_PATH)
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE_SECONDS)
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    parser.add_argument("--rebuild-shard", action="append", default=[], help="re-embed every file of this shard and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.once or args.rebuild_shard:
+        changed, removed = sync_index(args.data, args.index, force_shards=args.rebuild_shard)
+        print(f"{len(changed)} changed, {len(removed)} removed -> {current_index_path(args.index)}")
+        return
+
+    observer = start_watcher(args.data, args.index, args.debounce)
+    try:
+        observer.join()
+    except KeyboardInterrupt:
+        observer.stop()
+        observer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+
+# Local, deterministic embeddings and no LLM: must be set before src.helper is imported
+os.environ.setdefault("EMBEDDINGS_BACKEND", "hashing")
+os.environ.setdefault("QUERY_LOG_PATH", "")
+
+import pytest
+
+
+DOCUMENTS = {
+    "hr/leave_policy.md": "# Leave policy\n\nEmployees get 26 weeks of maternity leave and 2 weeks of paternity leave.\n\n"
+                          "Annual leave is 24 days per year and can be carried over up to 5 days.",
+    "hr/benefits.md": "# Benefits\n\nHealth insurance covers the employee, spouse and two children.\n\n"
+                      "The wellness allowance is 500 dollars per year.",
+    "finance/q4_report.md": "# Q4 report\n\nRevenue grew 12 percent to 2.6 billion dollars in Q4.\n\n"
+                            "Marketing expenses were 410 million dollars in Q4.",
+    "general/handbook.md": "# Handbook\n\nOffice hours are 9 to 6. The cafeteria opens at 8.\n\n"
+                           "Remote work is allowed two days per week.",
+}
+
+
+def write_documents(root, documents):
+    for relative, text in documents.items():
+        path = os.path.join(root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """A small resources/data style tree (department directories under .../data/)."""
+    path = str(tmp_path / "resources" / "data")
+    write_documents(path, DOCUMENTS)
+    return path
+
+
+@pytest.fixture
+def index_root(tmp_path, data_path):
+    """A published, sharded index of data_path."""
+    from src.watcher import sync_index
+
+    root = str(tmp_path / "faiss_index")
+    sync_index(data_path, root)
+    return root
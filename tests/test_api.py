@@ -0,0 +1,106 @@
+import httpx
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from src.api_client import APIError, ChatbotAPIClient
+from src.profiler import ProfileStore
+from src.ratelimit import LocalBuckets, RateLimiter
+from src.state import InMemoryRedis, RedisBackend
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The API with in-memory state and rate limits, and a registered hr user."""
+    backend = RedisBackend(InMemoryRedis())
+    monkeypatch.setattr(fastapi_app, "state_backend", backend)
+    monkeypatch.setattr(fastapi_app, "user_manager", fastapi_app.UserManager(backend))
+    monkeypatch.setattr(fastapi_app, "RATE_LIMIT_ENABLED", True)
+    limiter = RateLimiter(LocalBuckets())
+    monkeypatch.setattr(fastapi_app, "get_rate_limiter", lambda: limiter)
+
+    client = TestClient(fastapi_app.app)
+    token = client.post("/register", json={
+        "full_name": "Test User", "username": "tester", "department": "hr", "email": "tester@example.com",
+        "password": "secret123", "confirm_password": "secret123",
+    }).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+def fake_stream_answer(pieces):
+    def stream_answer(question, department, memory=None, index=None, timer=None, deadline=None):
+        def generate():
+            for piece in pieces:
+                if isinstance(piece, Exception):
+                    raise piece
+                yield piece
+        return [], generate()
+    return stream_answer
+
+
+def events(response):
+    return [orjson.loads(line) for line in response.iter_lines() if line]
+
+
+def test_stream_sends_rate_limit_headers_and_ends_with_done(client, monkeypatch):
+    monkeypatch.setattr(fastapi_app, "stream_answer", fake_stream_answer(["Twenty six ", "weeks."]))
+    with client.stream("POST", "/chat/stream", json={"message": "Maternity leave?"}) as response:
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Limit"] == "20"
+        assert int(response.headers["X-RateLimit-Remaining"]) < 20
+        received = events(response)
+    assert [event["type"] for event in received] == ["context", "token", "token", "done"]
+    assert fastapi_app.state_backend.get_history("tester")[-1]["content"] == "Twenty six weeks."
+
+
+def test_stream_failing_part_way_ends_with_an_error_event(client, monkeypatch):
+    monkeypatch.setattr(fastapi_app, "stream_answer", fake_stream_answer(["Twenty six ", RuntimeError("LLM down")]))
+    with client.stream("POST", "/chat/stream", json={"message": "Maternity leave?"}) as response:
+        received = events(response)
+    assert [event["type"] for event in received] == ["context", "token", "error"]
+    assert "LLM down" not in received[-1]["detail"]
+    # A half-written answer is not saved to the history
+    assert fastapi_app.state_backend.get_history("tester") == []
+
+
+def busy_answer(question, department, memory=None, index=None, timer=None, deadline=None):
+    def search():
+        return sum(i * i for i in range(2000000))
+    deadline.run(search)
+    sum(i * i for i in range(2000000))
+    return "Twenty six weeks.", []
+
+
+def test_chat_profile_samples_the_threads_doing_the_work(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(fastapi_app, "ADMIN_USERS", {"tester"})
+    monkeypatch.setattr(fastapi_app, "profile_store", ProfileStore(str(tmp_path)))
+    monkeypatch.setattr(fastapi_app, "answer", busy_answer)
+
+    response = client.post("/chat", json={"message": "Maternity leave?"}, headers={"X-Profile": "1"})
+    assert response.json()["response"] == "Twenty six weeks."
+    profile = client.get(f"/admin/profiles/{response.headers['X-Profile-Id']}").text
+    # answer() runs in the threadpool and its search on a deadline thread, both off the event loop
+    assert "busy_answer (tests/test_api.py" in profile
+    assert "search (tests/test_api.py" in profile
+
+
+def thin_client(*events):
+    body = b"".join(orjson.dumps(event) + b"\n" for event in events)
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    return ChatbotAPIClient(base_url="http://api", transport=transport)
+
+
+def test_client_stream_stops_at_done_and_raises_on_error_or_cut_off():
+    context, token = {"type": "context", "context": []}, {"type": "token", "text": "Hi"}
+    done = {"type": "done", "degraded": True, "cut_stages": []}
+    assert list(thin_client(context, token, done).chat_stream("t", "q")) == [context, token, done]
+
+    with pytest.raises(APIError) as error:
+        list(thin_client(context, token, {"type": "error", "detail": "The answer could not be completed."})
+             .chat_stream("t", "q"))
+    assert error.value.detail == "The answer could not be completed."
+
+    with pytest.raises(APIError, match="cut off"):
+        list(thin_client(context, token).chat_stream("t", "q"))
@@ -0,0 +1,141 @@
+import pytest
+from langchain_core.documents import Document
+
+from src import helper
+from src.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, extractive_answer, split_sentences
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failures=3, reset_seconds=30, slow_seconds=20, clock=Clock())
+
+
+def trip(breaker):
+    for _ in range(breaker.max_failures):
+        assert breaker.allow()
+        breaker.record(False)
+
+
+def test_opens_after_consecutive_failures_only(breaker):
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True, 1.0)
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+    trip(breaker)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot() == {"state": OPEN, "consecutive_failures": 3, "trips": 1, "rejected": 1}
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(3):
+        breaker.record(True, 25.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(breaker):
+    trip(breaker)
+    breaker.clock.now += 29
+    assert not breaker.allow()
+
+    breaker.clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow()
+
+    breaker.record(True, 1.0)
+    assert breaker.state == CLOSED and breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_period(breaker):
+    trip(breaker)
+    breaker.clock.now += 30
+    assert breaker.allow()
+    breaker.record(False)
+    # Reopening from half-open counts as another trip
+    assert breaker.state == OPEN and breaker.trips == 2
+    assert not breaker.allow()
+    breaker.clock.now += 30
+    assert breaker.allow()
+
+
+class FailingChain:
+    def stream(self, inputs):
+        raise RuntimeError("LLM down")
+
+
+class WritingChain:
+    def stream(self, inputs):
+        yield "Maternity leave "
+        yield "is 26 weeks."
+
+
+@pytest.fixture
+def probing(monkeypatch, breaker):
+    """The helper's breaker, half-open and ready to let one probe through."""
+    monkeypatch.setattr(helper, "llm_breaker", breaker)
+    monkeypatch.setattr(helper, "LLM_BREAKER_ENABLED", True)
+    trip(breaker)
+    breaker.clock.now += 30
+    return breaker
+
+
+def test_answer_releases_a_failed_probe(index_root, probing, monkeypatch):
+    index = helper.load_sharded_index(helper.current_index_path(index_root))
+    monkeypatch.setattr(helper, "get_chain", lambda department: FailingChain())
+
+    response, context = helper.answer("What is the maternity leave policy?", "hr", index=index)
+    # Extractive fallback from the retrieved chunks
+    assert context and "26 weeks of maternity leave" in response
+    assert probing.state == OPEN and not probing.probing
+
+
+def test_answer_releases_a_probe_whose_reader_went_away(index_root, probing, monkeypatch):
+    index = helper.load_sharded_index(helper.current_index_path(index_root))
+    monkeypatch.setattr(helper, "get_chain", lambda department: WritingChain())
+
+    context, pieces = helper.stream_answer("What is the maternity leave policy?", "hr", index=index)
+    assert next(pieces) == "Maternity leave "
+    pieces.close()
+    # The LLM was answering, so the probe counts as a success
+    assert probing.state == CLOSED and not probing.probing
+
+
+def test_split_sentences_and_extractive_answer():
+    assert split_sentences("**Leave** policy.\n| Type | Weeks |\n- Remote work is fine!") == [
+        "Leave policy.", "Type: Weeks", "Remote work is fine!",
+    ]
+    docs = [Document(page_content="The cafeteria opens at 8. Maternity leave is 26 weeks.",
+                     metadata={"source": "resources/data/hr/leave.md"})]
+    answer = extractive_answer("How long is maternity leave?", docs)
+    assert "Maternity leave is 26 weeks." in answer
+    assert "cafeteria" not in answer
+
+
+def test_open_breaker_degrades_the_answer_and_skips_the_summary(index_root, breaker, monkeypatch):
+    from src.memory import ConversationMemory
+    from src.querylog import StageTimer
+
+    monkeypatch.setattr(helper, "llm_breaker", breaker)
+    monkeypatch.setattr(helper, "LLM_BREAKER_ENABLED", True)
+    monkeypatch.setattr(helper, "get_summary_chain", lambda department: FailingChain())
+    trip(breaker)
+    index = helper.load_sharded_index(helper.current_index_path(index_root))
+    memory = ConversationMemory(turns=[{"question": "Earlier question " * 5, "answer": "Earlier answer " * 20}], token_budget=60)
+    timer = StageTimer()
+
+    helper.answer("What is the maternity leave policy?", "hr", memory=memory, index=index, timer=timer)
+    assert timer.degraded
+    # The old turn was dropped without an LLM call
+    assert memory.summary == "" and len(memory.turns) == 1
+    assert breaker.snapshot()["rejected"] == 1
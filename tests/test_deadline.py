@@ -0,0 +1,172 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from src import deadline as deadline_module
+from src import helper
+from src.deadline import Deadline, DeadlineExceeded, parse_deadline
+from src.profiler import SamplingProfiler, profiled_threads
+from src.querylog import StageTimer
+from src.shards import gather_shards
+
+
+def test_run_returns_in_time_and_gives_up_at_the_deadline():
+    deadline = Deadline(0.2)
+    assert deadline.run(lambda x: x * 2, 21) == 42
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        deadline.run(time.sleep, 2)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_run_propagates_errors():
+    with pytest.raises(ZeroDivisionError):
+        Deadline(1).run(lambda: 1 / 0)
+
+
+def test_nothing_is_started_after_the_deadline():
+    started = []
+    deadline = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        deadline.run(started.append, 1)
+    with pytest.raises(DeadlineExceeded):
+        next(deadline.iterate(iter([1, 2])))
+    time.sleep(0.05)
+    assert started == []
+
+
+def test_iterate_cuts_a_slow_stream_and_closes_it():
+    closed = threading.Event()
+
+    def stream():
+        try:
+            yield "first"
+            time.sleep(0.3)
+            yield "late"
+        finally:
+            closed.set()
+
+    pieces = []
+    with pytest.raises(DeadlineExceeded):
+        for piece in Deadline(0.15).iterate(stream()):
+            pieces.append(piece)
+    assert pieces == ["first"]
+    # The abandoned stream is closed when it next yields, not read to the end
+    assert closed.wait(1)
+
+
+def test_calls_do_not_queue_behind_abandoned_ones(monkeypatch):
+    monkeypatch.setattr(deadline_module, "DEADLINE_THREADS", 1)
+    monkeypatch.setattr(deadline_module, "_deadline_pool", ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0.05).run(release.wait, 5)
+
+    # The only pool thread is still taken by the abandoned call
+    assert Deadline(0.5).run(threading.current_thread).name == "deadline-overflow"
+    release.set()
+
+
+def test_profiled_requests_sample_their_deadline_threads():
+    threads = set()
+    token = profiled_threads.set(threads)
+    try:
+        assert Deadline(1).run(lambda: threading.get_ident() in threads)
+    finally:
+        profiled_threads.reset(token)
+    # Untagged once the call returns
+    assert threads == set()
+
+    profiler = SamplingProfiler(interval=0.001, thread_ids=threads)
+    token = profiled_threads.set(threads)
+    try:
+        with profiler:
+            Deadline(1).run(lambda: sum(i * i for i in range(300000)))
+    finally:
+        profiled_threads.reset(token)
+    assert "<genexpr>" in profiler.collapsed()
+
+
+def test_gather_shards_keeps_the_shards_that_answered():
+    answered, late = Future(), Future()
+    answered.set_result(["hit"])
+    deadline = Deadline(0.05)
+    assert gather_shards({"hr": answered, "finance": late}, deadline) == [["hit"]]
+    assert deadline.cut_stages == ["search:finance"]
+
+
+def test_parse_deadline():
+    assert parse_deadline(None).seconds == deadline_module.REQUEST_DEADLINE_SECONDS
+    assert parse_deadline("2.5").seconds == 2.5
+    assert parse_deadline("100000").seconds == deadline_module.REQUEST_DEADLINE_MAX_SECONDS
+    for value in ("abc", "0", "-1", "nan"):
+        with pytest.raises(ValueError):
+            parse_deadline(value)
+
+
+class UnusedChain:
+    def stream(self, inputs):
+        raise AssertionError("the LLM is not called without time for it")
+
+
+def test_answer_skips_generation_without_time_for_it(index_root, monkeypatch):
+    index = helper.load_sharded_index(helper.current_index_path(index_root))
+    monkeypatch.setattr(helper, "get_chain", lambda department: UnusedChain())
+    deadline = Deadline(helper.GENERATE_MIN_SECONDS)
+    # Retrieval leaves less than GENERATE_MIN_SECONDS
+    deadline.expires_at -= 0.01
+    timer = StageTimer()
+
+    response, context = helper.answer("What is the maternity leave policy?", "hr", index=index, timer=timer,
+                                      deadline=deadline)
+    assert context and "26 weeks of maternity leave" in response
+    assert deadline.cut_stages == ["generate"]
+    # Cut for time, not because the LLM is unavailable
+    assert not timer.degraded
+
+
+class SlowSummary:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        time.sleep(1)
+        return "A summary."
+
+
+def long_memory():
+    from src.memory import ConversationMemory
+
+    return ConversationMemory(turns=[{"question": "Earlier question " * 5, "answer": "Earlier answer " * 20}],
+                              token_budget=60)
+
+
+def test_remember_drops_old_turns_without_time_to_summarize(monkeypatch):
+    summary = SlowSummary()
+    monkeypatch.setattr(helper, "get_summary_chain", lambda department: summary)
+
+    # Too little left to start the call
+    memory, deadline = long_memory(), Deadline(helper.CONDENSE_MIN_SECONDS / 2)
+    helper.remember_turn(memory, "Next question?", "Next answer.", "hr", deadline=deadline)
+    assert summary.calls == 0
+    assert deadline.cut_stages == ["remember"]
+    assert memory.summary == "" and len(memory.turns) == 1
+
+    # Started, but abandoned at the deadline
+    monkeypatch.setattr(helper, "CONDENSE_MIN_SECONDS", 0.05)
+    memory, deadline = long_memory(), Deadline(0.2)
+    start = time.perf_counter()
+    helper.remember_turn(memory, "Next question?", "Next answer.", "hr", deadline=deadline)
+    assert time.perf_counter() - start < 0.5
+    assert summary.calls == 1 and deadline.cut_stages == ["remember"]
+    assert memory.summary == "" and len(memory.turns) == 1
+
+
+def test_remember_summarizes_in_time_without_cutting(monkeypatch):
+    monkeypatch.setattr(helper, "get_summary_chain", lambda department: SlowSummary())
+    memory, deadline = long_memory(), Deadline(5)
+    helper.remember_turn(memory, "Next question?", "Next answer.", "hr", deadline=deadline)
+    assert memory.summary == "A summary." and deadline.cut_stages == []
@@ -0,0 +1,121 @@
+import os
+
+from src.dedup import NearDuplicateIndex, band_buckets, minhash, numbers_key, similarity
+
+
+POLICY = (
+    "Employees are entitled to twenty six weeks of paid maternity leave, which can start up to eight weeks "
+    "before the expected date of delivery. Fathers and partners get two weeks of paternity leave to be taken "
+    "within the first six months. Requests go to the people team through the leave portal at least a month ahead. "
+    "Leave that is not taken in the first year lapses and cannot be paid out at the end of the year."
+)
+
+
+def test_identical_and_near_identical_chunks_collapse():
+    index = NearDuplicateIndex()
+    assert index.find_or_add(POLICY, 0) is None
+    assert index.find_or_add(POLICY, 1) == 0
+    # One word changed out of ~90 stays above the default 0.9 similarity
+    assert index.find_or_add(POLICY.replace("portal", "system"), 2) == 0
+    index.close()
+
+
+def test_unrelated_chunks_and_different_numbers_stay_separate():
+    index = NearDuplicateIndex()
+    assert index.find_or_add(POLICY, 0) is None
+    assert index.find_or_add("The cafeteria opens at eight and serves lunch until two in the afternoon.", 1) is None
+    # Same words, different figure: says something else, so it is kept
+    assert index.find_or_add(POLICY + " Revised in 2024.", 2) is None
+    assert index.find_or_add(POLICY + " Revised in 2025.", 3) is None
+    assert index.find_or_add(POLICY + " Revised in 2025.", 4) == 3
+    index.close()
+
+
+def test_earliest_kept_chunk_wins():
+    index = NearDuplicateIndex(threshold=0.5)
+    index.find_or_add(POLICY, 10)
+    index.find_or_add(POLICY.replace("portal", "desk"), 11)
+    assert index.find_or_add(POLICY.replace("portal", "office"), 12) == 10
+    index.close()
+
+
+def test_signature_helpers():
+    a, b = minhash(POLICY), minhash(POLICY.replace("portal", "system"))
+    assert similarity(a, a) == 1.0
+    assert 0.8 < similarity(a, b) < 1.0
+    assert len(band_buckets(a)) == 32
+    # Equal bands at different positions land in different buckets
+    assert len(set(band_buckets(a))) == 32
+    assert numbers_key("Q1 revenue was $2.1B") != numbers_key("Q3 revenue was $2.1B")
+
+
+def test_watcher_keeps_an_unchanged_duplicate_when_its_twin_is_edited(tmp_path):
+    from src.docstore import CHUNK_STORE_FILE, ChunkStore
+    from src.helper import current_index_path, load_sharded_index
+    from src.watcher import sync_index
+    from tests.conftest import write_documents
+
+    data_path = str(tmp_path / "resources" / "data")
+    root = str(tmp_path / "faiss_index")
+    write_documents(data_path, {"hr/policy.md": POLICY, "hr/policy_copy.md": POLICY})
+    sync_index(data_path, root)
+
+    def hr_chunks():
+        store = ChunkStore(os.path.join(current_index_path(root), "hr", CHUNK_STORE_FILE))
+        try:
+            return list(store.iter_documents())
+        finally:
+            store.close()
+
+    # Built once, the copy is only recorded as a duplicate source of the kept chunk
+    chunks = hr_chunks()
+    assert len(chunks) == 1
+    kept = chunks[0].metadata["source"]
+    twin, = chunks[0].metadata["duplicate_sources"]
+
+    with open(kept, "w") as f:
+        f.write("The leave portal has moved to the new intranet.")
+    assert sync_index(data_path, root) == ([kept], [])
+
+    by_source = {doc.metadata["source"]: doc.page_content for doc in hr_chunks()}
+    assert by_source == {kept: "The leave portal has moved to the new intranet.", twin: POLICY}
+    index = load_sharded_index(current_index_path(root))
+    hits = index.search("paid maternity leave weeks", "hr", k=1)
+    assert hits[0][0].metadata["source"] == twin
+
+
+def test_watcher_deduplicates_and_batches_new_chunks(tmp_path, monkeypatch):
+    from src import watcher
+    from src.docstore import CHUNK_STORE_FILE, ChunkStore
+    from src.helper import current_index_path, get_embeddings
+    from src.ingest import EMBED_BATCH_SIZE
+    from tests.conftest import write_documents
+
+    data_path = str(tmp_path / "resources" / "data")
+    root = str(tmp_path / "faiss_index")
+    write_documents(data_path, {"hr/policy.md": POLICY})
+    watcher.sync_index(data_path, root)
+
+    embeddings, batches = get_embeddings(), []
+
+    class Recording:
+        def embed_documents(self, texts):
+            batches.append(len(texts))
+            return embeddings.embed_documents(texts)
+
+    monkeypatch.setattr(watcher, "get_embeddings", Recording)
+    notes = "\n\n".join(f"Note {i}: room {i} on floor {i % 7} is booked through the facilities desk." for i in range(1000))
+    write_documents(data_path, {"hr/policy_copy.md": POLICY.replace("portal", "system"), "hr/rooms.md": notes})
+    watcher.sync_index(data_path, root)
+
+    store = ChunkStore(os.path.join(current_index_path(root), "hr", CHUNK_STORE_FILE))
+    try:
+        docs = list(store.iter_documents())
+    finally:
+        store.close()
+    # The near-duplicate is folded into the chunk carried over from the first build
+    policy, = [doc for doc in docs if "maternity" in doc.page_content]
+    assert policy.metadata["duplicate_sources"] == [os.path.join(data_path, "hr", "policy_copy.md")]
+    # The unchanged chunk keeps its vector; the new ones are embedded in batches
+    assert sum(batches) == len(docs) - 1
+    assert len(batches) > 1 and max(batches) <= EMBED_BATCH_SIZE
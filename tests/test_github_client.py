@@ -0,0 +1,109 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from src.github_client import DiskCache, GitHubClient, parse_link_header
+
+
+API = "https://github.test"
+
+
+class StandIn:
+    """A GitHub API stand-in: one user with `repos` repositories, ETags and Link headers."""
+
+    def __init__(self, repos=250, last_links=True):
+        self.repos = [{"name": f"repo{i}"} for i in range(repos)]
+        self.last_links = last_links
+        self.requests = []
+        self.down = False
+
+    def handler(self, request):
+        if self.down:
+            raise httpx.ConnectError("GitHub unreachable", request=request)
+        self.requests.append(request)
+        if request.url.path == "/users/octo":
+            body, etag, headers = {"login": "octo"}, '"user"', {}
+        else:
+            query = parse_qs(request.url.query.decode())
+            page, per_page = int(query["page"][0]), int(query["per_page"][0])
+            body = self.repos[(page - 1) * per_page:page * per_page]
+            etag = f'"repos-{page}"'
+            last = -(-len(self.repos) // per_page)
+            page_url = f"{API}/users/octo/repos?sort=updated&per_page={per_page}&page="
+            links = [f'<{page_url}{page + 1}>; rel="next"'] if page < last else []
+            if self.last_links:
+                links.append(f'<{page_url}{last}>; rel="last"')
+            headers = {"Link": ", ".join(links)}
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, json=body, headers={"ETag": etag, **headers})
+
+
+def fetch(server, cache_dir):
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+        async with GitHubClient(API, DiskCache(cache_dir), client=client) as github:
+            return await asyncio.gather(github.get_user("octo"), github.get_repos("octo"))
+    return asyncio.run(run())
+
+
+def validators_sent(server):
+    return sorted(request.headers.get("If-None-Match", "") for request in server.requests)
+
+
+@pytest.mark.parametrize("last_links", [True, False])
+def test_all_pages_are_fetched_in_order(tmp_path, last_links):
+    server = StandIn(repos=250, last_links=last_links)
+    user, repos = fetch(server, str(tmp_path))
+    assert user == {"login": "octo"}
+    assert [repo["name"] for repo in repos] == [f"repo{i}" for i in range(250)]
+    # The user and three pages of 100
+    assert len(server.requests) == 4
+
+
+def test_unchanged_data_is_revalidated_with_etags(tmp_path):
+    server = StandIn()
+    first = fetch(server, str(tmp_path))
+    server.requests.clear()
+
+    assert fetch(server, str(tmp_path)) == first
+    # Every request was conditional, so every answer was a 304
+    assert validators_sent(server) == ['"repos-1"', '"repos-2"', '"repos-3"', '"user"']
+
+
+def test_cached_copy_is_served_when_github_is_unreachable(tmp_path):
+    server = StandIn()
+    first = fetch(server, str(tmp_path))
+    server.down = True
+    assert fetch(server, str(tmp_path)) == first
+
+    with pytest.raises(httpx.TransportError):
+        fetch(server, str(tmp_path / "empty"))
+
+
+def test_not_modified_without_a_cached_body_fetches_the_body_again(tmp_path):
+    server = StandIn(repos=3)
+    cache = DiskCache(str(tmp_path))
+    # Validators kept after the body was lost
+    cache.set(f"{API}/users/octo", {"etag": '"user"'})
+    user, _ = fetch(server, str(tmp_path))
+    assert user == {"login": "octo"}
+    user_request, = [request for request in server.requests if request.url.path == "/users/octo"]
+    assert "If-None-Match" not in user_request.headers
+
+    # A 304 to a request that had nothing to revalidate
+    replies = iter([httpx.Response(304), httpx.Response(200, json={"login": "octo"})])
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(replies)))
+        async with GitHubClient(API, DiskCache(str(tmp_path / "empty")), client=client) as github:
+            return await github.get_user("octo")
+    assert asyncio.run(run()) == {"login": "octo"}
+
+
+def test_parse_link_header():
+    header = '<https://x/repos?page=2>; rel="next", <https://x/repos?page=5>; rel="last"'
+    assert parse_link_header(header) == {"next": "https://x/repos?page=2", "last": "https://x/repos?page=5"}
+    assert parse_link_header(None) == {}
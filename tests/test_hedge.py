@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable
+
+from src.hedge import HedgeStats, HedgedRunnable
+
+
+class Stub(Runnable):
+    """Answers after `delay` seconds in `pieces` chunks, or fails if `error` is set."""
+
+    def __init__(self, name, delay=0.0, pieces=3, error=None):
+        self.name = name
+        self.delay = delay
+        self.pieces = pieces
+        self.error = error
+        self.closed = threading.Event()
+
+    def stream(self, input, config=None, **kwargs):
+        try:
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            for i in range(self.pieces):
+                yield f"{self.name}{i} "
+                time.sleep(0.02)
+        finally:
+            self.closed.set()
+
+    def invoke(self, input, config=None, **kwargs):
+        return "".join(self.stream(input, config))
+
+
+def hedged(primary, backup, delay=0.1):
+    return HedgedRunnable(primary, backup, stats=HedgeStats(), delay=delay)
+
+
+def test_fast_primary_streams_chunk_by_chunk_through_a_chain():
+    llm = hedged(Stub("p"), Stub("b"))
+    chain = PromptTemplate.from_template("{question}") | llm | StrOutputParser()
+    chunks = list(chain.stream({"question": "q"}))
+    assert chunks == ["p0 ", "p1 ", "p2 "]
+    assert llm.stats.snapshot()["hedged"] == 0
+
+
+def test_slow_first_chunk_is_hedged_and_the_loser_is_closed():
+    primary, backup = Stub("p", delay=0.5), Stub("b")
+    llm = hedged(primary, backup)
+    assert list(llm.stream("q")) == ["b0 ", "b1 ", "b2 "]
+    stats = llm.stats.snapshot()
+    assert (stats["hedged"], stats["backup_wins"], stats["abandoned"]) == (1, 1, 1)
+    # The abandoned primary is closed at its first chunk instead of streaming to the end
+    assert primary.closed.wait(2)
+
+
+def test_primary_error_before_the_first_chunk_goes_to_the_backup_at_once():
+    llm = hedged(Stub("p", error=RuntimeError("down")), Stub("b"), delay=5)
+    start = time.perf_counter()
+    assert list(llm.stream("q")) == ["b0 ", "b1 ", "b2 "]
+    assert time.perf_counter() - start < 1
+    assert llm.stats.snapshot()["primary_errors"] == 1
+
+
+def test_both_failing_raises_the_last_error():
+    llm = hedged(Stub("p", error=RuntimeError("primary")), Stub("b", error=RuntimeError("backup")))
+    with pytest.raises(RuntimeError, match="backup"):
+        list(llm.stream("q"))
+
+
+def test_stopping_early_closes_the_stream():
+    primary = Stub("p", pieces=50)
+    stream = hedged(primary, Stub("b")).stream("q")
+    assert next(stream) == "p0 "
+    stream.close()
+    assert primary.closed.wait(2)
+
+
+def test_invoke_hedges_and_counts_the_abandoned_request():
+    llm = hedged(Stub("p", delay=0.5), Stub("b"))
+    assert llm.invoke("q") == "b0 b1 b2 "
+    stats = llm.stats.snapshot()
+    assert (stats["hedged"], stats["backup_wins"], stats["abandoned"]) == (1, 1, 1)
+
+    fast = hedged(Stub("p"), Stub("b"))
+    assert fast.invoke("q") == "p0 p1 p2 "
+    assert fast.stats.snapshot()["hedged"] == 0
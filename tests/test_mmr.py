@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.mmr import mmr_select
+
+
+def reference_mmr(query, candidates, k, lambda_mult):
+    """Textbook MMR, one candidate and one similarity at a time."""
+    def cosine(a, b):
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    selected, remaining = [], list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        def score(i):
+            relevance = cosine(query, candidates[i])
+            if not selected:
+                return relevance
+            redundancy = max(cosine(candidates[i], candidates[j]) for j in selected)
+            return lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.3, 0.5, 1.0])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_the_reference(seed, lambda_mult):
+    rng = np.random.default_rng(seed)
+    query, candidates = rng.normal(size=32), rng.normal(size=(40, 32))
+    assert mmr_select(query, candidates, 6, lambda_mult) == reference_mmr(query, candidates, 6, lambda_mult)
+
+
+def test_matches_langchain():
+    maximal_marginal_relevance = pytest.importorskip("langchain_community.vectorstores.utils").maximal_marginal_relevance
+    rng = np.random.default_rng(7)
+    query, candidates = rng.normal(size=64).astype("float32"), rng.normal(size=(30, 64)).astype("float32")
+    assert mmr_select(query, candidates, 5, 0.5) == maximal_marginal_relevance(query, candidates, lambda_mult=0.5, k=5)
+
+
+def test_masked_rows_are_never_chosen_and_do_not_affect_the_rest():
+    rng = np.random.default_rng(3)
+    query, candidates = rng.normal(size=16), rng.normal(size=(20, 16))
+    mask = rng.random(20) < 0.5
+    allowed = np.flatnonzero(mask)
+
+    selected = mmr_select(query, candidates, 5, 0.5, mask=mask)
+    assert all(mask[i] for i in selected)
+    # Same as running MMR over the permitted rows only
+    assert selected == [int(allowed[i]) for i in reference_mmr(query, candidates[allowed], 5, 0.5)]
+
+
+def test_edge_cases():
+    rng = np.random.default_rng(0)
+    query, candidates = rng.normal(size=8), rng.normal(size=(3, 8))
+    assert sorted(mmr_select(query, candidates, 10)) == [0, 1, 2]
+    assert mmr_select(query, np.empty((0, 8)), 4) == []
+    assert mmr_select(query, candidates, 2, mask=[False, False, False]) == []
+    # Zero vectors do not produce NaNs
+    assert len(mmr_select(query, np.zeros((3, 8)), 2)) == 2
@@ -0,0 +1,92 @@
+import pytest
+
+from src import ratelimit
+from src.ratelimit import Decision, LocalBuckets, Quota, RateLimiter, RedisBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_quota_parse():
+    quota = Quota.parse("20/60")
+    assert (quota.capacity, quota.period, quota.rate) == (20, 60.0, 20 / 60)
+    assert Quota.parse("5").period == 60
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    buckets, quota = LocalBuckets(), Quota(3, 30)  # one token per 10 s
+    assert [buckets.take(("k", quota))[0].allowed for _ in range(4)] == [True, True, True, False]
+
+    clock.now += 9
+    denied, = buckets.take(("k", quota))
+    assert not denied.allowed
+    assert denied.retry_after == 1
+
+    clock.now += 1
+    allowed, = buckets.take(("k", quota))
+    assert allowed.allowed and allowed.remaining == 0
+
+    # Refill is capped at capacity however long the bucket sat idle
+    clock.now += 3600
+    full, = buckets.take(("k", quota))
+    assert full.remaining == 2 and full.reset == 10
+
+
+def test_decision_headers():
+    quota = Quota(10, 60)
+    denied = Decision(False, quota, 0.5)
+    assert (denied.limit, denied.remaining, denied.retry_after, denied.reset) == (10, 0, 3, 57)
+    assert Decision(True, quota, 4).retry_after == 0
+
+
+def buckets_under_test(request):
+    if request.param == "local":
+        return LocalBuckets()
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBuckets(fakeredis.FakeRedis(decode_responses=True))
+
+
+@pytest.fixture(params=["local", "redis"])
+def limiter(request, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_USER", "2/3600")
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_DEPARTMENT", "3/3600")
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_OVERRIDES", {"c_level": {"user": "5/3600"}})
+    return RateLimiter(buckets_under_test(request))
+
+
+def test_user_quota_is_checked_first(limiter):
+    assert limiter.check("alice", "hr").allowed
+    assert limiter.check("alice", "hr").allowed
+    denied = limiter.check("alice", "hr")
+    assert not denied.allowed and denied.limit == 2
+    # Alice's denied request did not use up the department's third token
+    assert limiter.check("bob", "hr").allowed
+
+
+def test_department_denial_does_not_charge_the_user(limiter):
+    for user in ("alice", "bob", "carol"):
+        assert limiter.check(user, "hr").allowed
+    denied = limiter.check("dave", "hr")
+    assert not denied.allowed and denied.limit == 3
+    # Dave was refused by the department bucket, so his own two tokens are intact
+    buckets = limiter.buckets
+    dave, = buckets.take(("user:dave", Quota(2, 3600)))
+    assert dave.allowed and dave.remaining == 1
+
+
+def test_overrides_apply_per_department(limiter):
+    results = [limiter.check("ceo", "c_level").allowed for _ in range(4)]
+    # The user override (5) is above the department quota (3)
+    assert results == [True, True, True, False]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from src.docstore import CHUNK_STORE_FILE, ChunkStore, ReadOnlyDocstoreError, SQLiteDocstore
+from src.helper import current_index_path, is_permitted, load_sharded_index
+from src.shards import list_shards, shard_for_source, source_department
+
+
+def test_mmr_candidates_are_fetched_in_one_batch_without_text(index_root, monkeypatch):
+    index = load_sharded_index(current_index_path(index_root))
+    calls = []
+    get_many = ChunkStore.get_many
+
+    def counting_get_many(self, rows, with_text=True):
+        calls.append((len(list(rows)), with_text))
+        return get_many(self, rows, with_text)
+
+    def no_single_row_lookups(self, row):
+        raise AssertionError("candidates must not be fetched one row at a time")
+
+    monkeypatch.setattr(ChunkStore, "get_many", counting_get_many)
+    monkeypatch.setattr(ChunkStore, "get", no_single_row_lookups)
+
+    hits = index.max_marginal_relevance_search(
+        "maternity leave", "c_level", k=2, fetch_k=10, filter=lambda metadata: is_permitted(metadata, "c_level"),
+    )
+    assert len(hits) == 2
+    assert all(doc.page_content for doc, _ in hits)
+    # One metadata-only query per shard searched, then one text query per shard with a selected hit
+    shards = len(index.shards)
+    assert [with_text for _, with_text in calls[:shards]] == [False] * shards
+    assert all(with_text for _, with_text in calls[shards:])
+    assert sum(rows for rows, with_text in calls if with_text) == 2
+
+
+def test_mmr_and_search_agree_on_the_nearest_chunk(index_root):
+    index = load_sharded_index(current_index_path(index_root))
+    permitted = lambda metadata: is_permitted(metadata, "hr")
+    nearest, _ = index.search("maternity leave weeks", "hr", k=1, filter=permitted)[0]
+    diverse = index.max_marginal_relevance_search("maternity leave weeks", "hr", k=3, fetch_k=10, filter=permitted)
+    assert diverse[0][0].id == nearest.id
+    assert diverse[0][0].page_content == nearest.page_content
+
+
+def test_chunk_store_is_read_only(index_root):
+    docstore = SQLiteDocstore(os.path.join(current_index_path(index_root), "hr", CHUNK_STORE_FILE))
+    try:
+        assert docstore.search("0").metadata["source"].endswith(".md")
+        with pytest.raises(ReadOnlyDocstoreError):
+            docstore.delete(["0"])
+    finally:
+        docstore.store.close()
+
+
+def test_department_is_the_directory_below_the_data_path(tmp_path):
+    data_path = str(tmp_path / "data" / "checkout" / "resources" / "data")
+    assert source_department(f"{data_path}/hr/leave.md", data_path) == "hr"
+    assert source_department(f"{data_path}/engineering/data/specs/api.md", data_path) == "engineering"
+    assert source_department(f"{data_path}/readme.md", data_path) is None
+    assert shard_for_source(f"{data_path}/readme.md", data_path) == "general"
+    # Outside the data path: the directory after the last /data/
+    assert source_department("/srv/data/app/resources/data/finance/q4.md", data_path) == "finance"
+
+
+def test_checkout_under_a_data_directory_keeps_departments_apart(tmp_path):
+    from src.watcher import sync_index
+    from tests.conftest import DOCUMENTS, write_documents
+
+    data_path = str(tmp_path / "data" / "checkout" / "resources" / "data")
+    write_documents(data_path, DOCUMENTS)
+    root = str(tmp_path / "faiss_index")
+    sync_index(data_path, root)
+    assert sorted(list_shards(current_index_path(root))) == ["finance", "general", "hr"]
+
+    index = load_sharded_index(current_index_path(root))
+    hits = index.search("revenue Q4", "hr", k=4, filter=lambda metadata: is_permitted(metadata, "hr"))
+    assert hits and all("/finance/" not in doc.metadata["source"] for doc, _ in hits)
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from src.state import InMemoryRedis, LocalBackend, RedisBackend, StateBackend
+
+
+@pytest.fixture(params=["local", "memory", "fakeredis"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalBackend(str(tmp_path / "users.json"))
+    if request.param == "memory":
+        return RedisBackend(InMemoryRedis())
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_state_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
+
+
+def test_user_round_trip(backend):
+    record = {"username": "alice", "email": "alice@example.com", "department": "hr"}
+    assert backend.create_user("alice", record) == (True, "Registration successful")
+    assert backend.create_user("alice", record) == (False, "Username already exists")
+    assert backend.create_user("bob", dict(record, username="bob")) == (False, "Email already registered")
+
+    assert backend.get_user("alice") == record
+    assert backend.update_user("alice", {"department": "finance"})
+    assert backend.get_user("alice")["department"] == "finance"
+    assert not backend.update_user("nobody", {"department": "hr"})
+    assert set(backend.get_users()) == {"alice"}
+
+
+def test_history_and_session_round_trip(backend):
+    backend.append_history("alice", {"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"})
+    assert [message["content"] for message in backend.get_history("alice")] == ["hi", "hello"]
+    backend.clear_history("alice")
+    assert backend.get_history("alice") == []
+
+    backend.set_session("alice", {"memory": {"turns": []}})
+    assert backend.get_session("alice") == {"memory": {"turns": []}}
+    assert backend.get_session("bob") == {}
+
+
+def test_local_backend_returns_copies(tmp_path):
+    backend = LocalBackend(str(tmp_path / "users.json"))
+    backend.create_user("alice", {"email": "alice@example.com", "department": "hr"})
+
+    backend.get_user("alice")["department"] = "c_level"
+    backend.get_users()["alice"]["department"] = "c_level"
+    assert backend.get_user("alice")["department"] == "hr"
+
+
+def test_concurrent_updates_keep_every_field(backend):
+    backend.create_user("alice", {"email": "alice@example.com"})
+
+    def update(i):
+        backend.update_user("alice", {f"field{i}": i})
+
+    threads = [threading.Thread(target=update, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record = backend.get_user("alice")
+    assert all(record[f"field{i}"] == i for i in range(20))